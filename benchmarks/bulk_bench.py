@@ -0,0 +1,111 @@
+"""
+Bulk product API against one call per product.
+
+    python -m benchmarks.bulk_bench                     # 10k products
+    python -m benchmarks.bulk_bench --products 2000 --output bulk.json
+
+Creates, edits and deletes --products products for a scratch seller, first
+with ProductCreateView / ProductEditView / ProductDeleteView one call each,
+then with /api/products/bulk/ (bulk.MAX_ITEMS per call). Requests go through
+the whole Django + DRF stack in process, JWT authentication included, so the
+single-call numbers leave out a network round trip per call: the real gap is
+wider. Runs against the configured database (DJANGO_SETTINGS_MODULE /
+DATABASE_URL), so point it at a scratch database.
+"""
+import argparse
+import json
+import time
+
+from benchmarks._setup import setup
+
+SELLER = 'bulkbench_seller'
+
+
+def timed(run):
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from myapp import bulk
+    from myapp.models import Product
+
+    User.objects.filter(username=SELLER).delete()
+    seller = User.objects.create_user(SELLER, f'{SELLER}@example.com', 'bench')
+    api = APIClient()
+    api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(seller)}')
+    items = [{'name': f'Bulk ebook {i}', 'description': 'Seeded by benchmarks.bulk_bench', 'price': 100 + i}
+             for i in range(args.products)]
+
+    def check(response, status=200):
+        if response.status_code != status:
+            raise SystemExit(f'{response.status_code}: {response.content[:500]!r}')
+        return response
+
+    def ids():
+        return list(Product.objects.filter(seller=seller).order_by('id').values_list('id', flat=True))
+
+    def chunks(values):
+        return [values[i:i + bulk.MAX_ITEMS] for i in range(0, len(values), bulk.MAX_ITEMS)]
+
+    def single_create():
+        for item in items:
+            check(api.post('/api/products/create/', item, format='json'), 201)
+
+    def single_update():
+        for product_id in ids():
+            check(api.put(f'/api/products/{product_id}/edit/', {'price': 1}, format='json'))
+
+    def single_delete():
+        for product_id in ids():
+            check(api.delete(f'/api/products/{product_id}/delete/'))
+
+    def bulk_create():
+        for chunk in chunks(items):
+            check(api.post('/api/products/bulk/', chunk, format='json'))
+
+    def bulk_update():
+        for chunk in chunks(ids()):
+            check(api.patch('/api/products/bulk/', [{'id': pk, 'price': 1} for pk in chunk], format='json'))
+
+    def bulk_delete():
+        for chunk in chunks(ids()):
+            check(api.delete('/api/products/bulk/', chunk, format='json'))
+
+    result = {'products': args.products, 'bulk_items_per_call': bulk.MAX_ITEMS}
+    try:
+        for mode, steps in (
+            ('single', [('create', single_create), ('update', single_update), ('delete', single_delete)]),
+            ('bulk', [('create', bulk_create), ('update', bulk_update), ('delete', bulk_delete)]),
+        ):
+            for step, run in steps:
+                seconds = timed(run)
+                result[f'{mode}_{step}'] = {
+                    'seconds': round(seconds, 3),
+                    'products_per_sec': round(args.products / seconds, 1),
+                }
+        for step in ('create', 'update', 'delete'):
+            result[f'{step}_speedup'] = round(result[f'single_{step}']['seconds'] / result[f'bulk_{step}']['seconds'], 1)
+    finally:
+        seller.delete()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Local stand-in for the Razorpay orders API.
+
+    python -m benchmarks.fake_gateway --port 8765 --latency-ms 50
+
+Answers POST /v1/orders like the real gateway (HTTP/1.1 keep-alive), so the
+app can run with RAZORPAY_BASE_URL=http://127.0.0.1:8765 and no network.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    counter = itertools.count(1)
+    latency = 0.0
+    fail_every = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length).decode() if length else ''
+        if self.path.rstrip('/') != '/v1/orders':
+            return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'not found'}})
+
+        number = next(self.counter)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and number % self.fail_every == 0:
+            return self._send(503, {'error': {'code': 'SERVER_ERROR', 'description': 'try again'}})
+
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = {k: v[0] for k, v in parse_qs(raw).items()}
+        self._send(200, {
+            'id': f'order_fake{number:010d}',
+            'entity': 'order',
+            'amount': int(data.get('amount', 0)),
+            'currency': data.get('currency', 'INR'),
+            'status': 'created',
+        })
+
+
+def serve(port=0, latency_ms=0, fail_every=0):
+    """Start the fake gateway on a background thread, returns (server, base_url)"""
+    handler = type('Handler', (FakeGatewayHandler,), {
+        'latency': latency_ms / 1000,
+        'fail_every': fail_every,
+        'counter': itertools.count(1),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth order with a 503')
+    args = parser.parse_args()
+    server, url = serve(args.port, args.latency_ms, args.fail_every)
+    print(f'Fake gateway on {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Local stand-in for Cloudinary uploads.
+
+install(directory) routes cloudinary.uploader's upload calls (what
+CloudinaryField uses for product images) to files under `directory`, with the
+response shape of the real upload API, so image uploads work with no network.
+Delivery URLs are still built by the SDK and only need a cloud name.
+"""
+import itertools
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+def install(directory, latency_ms=0):
+    """Replace cloudinary.uploader.upload / upload_large with local writes"""
+    import cloudinary.uploader
+
+    directory = Path(directory)
+    versions = itertools.count(int(time.time()))
+    lock = threading.Lock()
+
+    def upload(file, **options):
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        name = getattr(file, 'name', None) or 'upload'
+        base, ext = os.path.splitext(os.path.basename(name))
+        public_id = '/'.join(filter(None, [options.get('folder'), f'{base}_{uuid.uuid4().hex[:8]}']))
+        path = directory / public_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(ext), 'wb') as f:
+            for chunk in file.chunks() if hasattr(file, 'chunks') else [file.read()]:
+                f.write(chunk)
+        with lock:
+            version = next(versions)
+        return {
+            'public_id': public_id,
+            'version': version,
+            'format': ext.lstrip('.') or None,
+            'type': options.get('type') or 'upload',
+            'resource_type': options.get('resource_type') or 'image',
+            'bytes': path.with_suffix(ext).stat().st_size,
+        }
+
+    cloudinary.uploader.upload = upload
+    cloudinary.uploader.upload_large = upload
@@ -0,0 +1,96 @@
+"""
+Gateway client: per-request razorpay.Client vs the pooled client in myapp/gateway.py.
+
+    python -m benchmarks.gateway_bench --requests 500 --concurrency 16 --latency-ms 20
+
+Runs against benchmarks/fake_gateway.py on localhost, no keys or network needed.
+The async run drives gateway.acreate_order() from one event loop, like the
+create_checkout_session_async view does under ASGI.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._setup import setup, summarize
+from benchmarks.fake_gateway import serve
+
+
+def timed_calls(call, requests, concurrency):
+    def one(_):
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return {'latency': summarize(samples), 'requests_per_sec': round(requests / elapsed, 1)}
+
+
+async def timed_async_calls(acall, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await acall()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {'latency': summarize(samples), 'requests_per_sec': round(requests / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    server, base_url = serve(latency_ms=args.latency_ms)
+
+    setup()
+    import razorpay
+    from django.conf import settings
+    from myapp import gateway
+
+    settings.RAZOR_KEY_ID, settings.RAZOR_SECRET_KEY = 'rzp_test_bench', 'bench-secret'
+    settings.RAZORPAY_BASE_URL = base_url
+    gateway.reset_client()
+    order = {'amount': 49900, 'currency': 'INR', 'payment_capture': 1}
+
+    def per_request_client():
+        client = razorpay.Client(auth=(settings.RAZOR_KEY_ID, settings.RAZOR_SECRET_KEY), base_url=base_url)
+        client.order.create(order)
+
+    def pooled_client():
+        gateway.create_order(order['amount'])
+
+    result = {
+        'gateway_latency_ms': args.latency_ms,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'per_request_client': timed_calls(per_request_client, args.requests, args.concurrency),
+        'pooled_client': timed_calls(pooled_client, args.requests, args.concurrency),
+        'pooled_client_async': asyncio.run(
+            timed_async_calls(lambda: gateway.acreate_order(order['amount']), args.requests, args.concurrency)
+        ),
+    }
+    server.shutdown()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
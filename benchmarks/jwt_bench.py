@@ -0,0 +1,100 @@
+"""
+Refresh token rotation: simplejwt's TokenRefreshSerializer against
+myapp.tokens (blacklist filter, leaner writes).
+
+    python -m benchmarks.jwt_bench                         # 2000 refreshes, 100k blacklisted tokens
+    python -m benchmarks.jwt_bench --refreshes 500 --blacklisted 0 --output jwt.json
+
+Seeds --blacklisted unexpired blacklisted tokens for a scratch user (the
+table a busy site carries until prune_jwt_tokens removes them), then rotates
+--refreshes live tokens with each serializer, each rotation in its own
+transaction as the refresh view does. Runs against the configured database
+(DJANGO_SETTINGS_MODULE / DATABASE_URL), so point it at a scratch database.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import timedelta
+
+from benchmarks._setup import setup, summarize
+
+USER = 'jwtbench_user'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--refreshes', type=int, default=2000)
+    parser.add_argument('--blacklisted', type=int, default=100_000)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.test import override_settings
+    from django.utils import timezone
+    from rest_framework_simplejwt import serializers as jwt_serializers, tokens as jwt_tokens
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    from myapp import tokens
+
+    User.objects.filter(username=USER).delete()
+    user = User.objects.create_user(USER, f'{USER}@example.com', 'bench')
+    expires = timezone.now() + timedelta(days=7)
+    for start in range(0, args.blacklisted, 5000):
+        outstanding = OutstandingToken.objects.bulk_create(
+            OutstandingToken(user=user, jti=uuid.uuid4().hex, token='', expires_at=expires)
+            for _ in range(start, min(args.blacklisted, start + 5000))
+        )
+        BlacklistedToken.objects.bulk_create(BlacklistedToken(token=token) for token in outstanding)
+
+    def rotate(serializer_class, token_class, filtered):
+        refresh = [str(token_class.for_user(user)) for _ in range(args.refreshes)]
+        samples, queries = [], []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with override_settings(JWT_BLACKLIST_FILTER=filtered):
+            started = time.perf_counter()
+            for token in refresh:
+                began = time.perf_counter()
+                with connection.execute_wrapper(count), transaction.atomic():
+                    serializer = serializer_class(data={'refresh': token})
+                    if not serializer.is_valid():
+                        raise SystemExit(serializer.errors)
+                samples.append(time.perf_counter() - began)
+            seconds = time.perf_counter() - started
+        return {
+            'refreshes_per_sec': round(args.refreshes / seconds, 1),
+            'queries_per_refresh': round(len(queries) / args.refreshes, 2),
+            **summarize(samples),
+        }
+
+    result = {'refreshes': args.refreshes, 'blacklisted': args.blacklisted}
+    try:
+        result['simplejwt'] = rotate(jwt_serializers.TokenRefreshSerializer, jwt_tokens.RefreshToken, False)
+        # First check per process builds the filter, timed on its own
+        with override_settings(JWT_BLACKLIST_FILTER=True):
+            tokens.blacklist_filter.reset()
+            started = time.perf_counter()
+            tokens.blacklist_filter.might_contain('')
+            result['filter_build_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        result['filtered'] = rotate(tokens.TokenRefreshSerializer, tokens.RefreshToken, True)
+        result['speedup'] = round(result['filtered']['refreshes_per_sec'] / result['simplejwt']['refreshes_per_sec'], 2)
+    finally:
+        # Outstanding tokens outlive their user (SET_NULL)
+        OutstandingToken.objects.filter(user=user).delete()
+        user.delete()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
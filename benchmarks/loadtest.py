@@ -0,0 +1,309 @@
+"""
+End-to-end load test of the buyer and seller journeys.
+
+    python -m benchmarks.loadtest --buyers 16 --sellers 2 --iterations 20 --output run.json
+    python -m benchmarks.loadtest --baseline run.json        # p95/throughput change per step
+
+Buyer journey: index -> detail -> create_checkout_session -> verify_payment ->
+payment_success_view. Seller journey: createproduct (with an image upload) ->
+dashboard -> sales. Each virtual user is a thread with its own logged-in HTTP
+session, against the WSGI app served from a child process (so load generation
+doesn't share a GIL with the app), with benchmarks/fake_gateway.py for the
+payment gateway and benchmarks/fake_storage.py for Cloudinary: no keys or
+network needed.
+
+Users and products are seeded through the ORM into the configured database
+(DJANGO_SETTINGS_MODULE / DATABASE_URL), so point it at a scratch database.
+Results are per step latency percentiles, requests/s and errors, plus the git
+commit, written as JSON to compare runs across commits.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks._setup import ROOT, setup, summarize
+from benchmarks.fake_gateway import serve
+
+KEY_ID, SECRET = 'rzp_test_loadtest', 'loadtest-secret'
+PASSWORD = 'loadtest-password'
+BUYER_STEPS = ['index', 'detail', 'create_checkout_session', 'verify_payment', 'success']
+SELLER_STEPS = ['createproduct_form', 'createproduct', 'dashboard', 'sales']
+
+# 1x1 PNG
+IMAGE = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+def run_server(port, media, storage_latency_ms):
+    """Child process: serve the WSGI app on a threaded server until killed"""
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    setup()
+    from benchmarks import fake_storage
+    from django.core.wsgi import get_wsgi_application
+
+    fake_storage.install(media, storage_latency_ms)
+
+    class Server(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    class Handler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    make_server('127.0.0.1', port, get_wsgi_application(), Server, Handler).serve_forever()
+
+
+def start_server(port, gateway_url, media, storage_latency_ms):
+    env = dict(
+        os.environ,
+        RAZORPAY_BASE_URL=gateway_url,
+        RAZOR_KEY_ID=KEY_ID,
+        RAZOR_SECRET_KEY=SECRET,
+        # Only used to build image URLs, uploads go to fake_storage
+        CLOUDINARY_CLOUD_NAME='loadtest',
+        CLOUDINARY_API_KEY='loadtest',
+        CLOUDINARY_API_SECRET='loadtest',
+        # Staged uploads go to the run's scratch directory too, not media/ in the checkout
+        IMAGE_STAGING_ROOT=os.path.join(media, 'staged'),
+        DEBUG='False',
+        # Every virtual user comes from 127.0.0.1
+        RATE_LIMIT_ENABLED='False',
+    )
+    env.setdefault('DJANGO_SECRET_KEY', 'loadtest')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.loadtest', '--serve', str(port), '--media', media,
+         '--storage-latency-ms', str(storage_latency_ms)],
+        # The app's logging stays off stdout, which carries the JSON result
+        cwd=ROOT, env=env, stdout=sys.stderr,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'app server exited with {process.returncode}')
+        try:
+            requests.get(f'{base_url}/invalid/', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit('app server did not start')
+
+
+def seed(buyers, sellers, products):
+    """Create the load test accounts and catalog (reused by later runs), returns product ids"""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from myapp.models import Product
+
+    password = make_password(PASSWORD)
+    usernames = [f'loadtest_buyer_{i}' for i in range(buyers)] + [f'loadtest_seller_{i}' for i in range(sellers)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    User.objects.bulk_create(
+        User(username=name, email=f'{name}@example.com', password=password)
+        for name in usernames if name not in existing
+    )
+
+    catalog = Product.objects.filter(name__startswith='Loadtest ebook ')
+    missing = products - catalog.count()
+    if missing > 0:
+        owner = User.objects.get(username='loadtest_seller_0')
+        Product.objects.bulk_create(
+            Product(seller=owner, name=f'Loadtest ebook {i}', description='Seeded by benchmarks.loadtest', price=499)
+            for i in range(missing)
+        )
+    return list(catalog.order_by('id').values_list('id', flat=True)[:products])
+
+
+class VirtualUser:
+    def __init__(self, base_url, username, record):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.record = record
+        self.login(username)
+
+    def login(self, username):
+        self.session.get(f'{self.base_url}/login/').raise_for_status()
+        response = self.session.post(f'{self.base_url}/login/', data={
+            'username': username, 'password': PASSWORD, 'csrfmiddlewaretoken': self.session.cookies['csrftoken'],
+        }, allow_redirects=False)
+        if response.status_code != 302:
+            raise RuntimeError(f'login failed for {username}: {response.status_code}')
+
+    def step(self, name, method, path, expect=(200,), **kwargs):
+        """One timed request; returns the response or None on a failed step"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            response = None
+        self.record(name, time.perf_counter() - started, response is not None and response.status_code in expect)
+        return response if response is not None and response.status_code in expect else None
+
+
+def buyer_journey(user, product_id, email):
+    if not user.step('index', 'GET', '/'):
+        return
+    if not user.step('detail', 'GET', f'/product/{product_id}/'):
+        return
+    checkout = user.step('create_checkout_session', 'POST', f'/create-checkout-session/{product_id}/',
+                         json={'email': email})
+    if not checkout:
+        return
+    order_id = checkout.json()['order_id']
+    payment_id = f'pay_{order_id}'
+    signature = hmac.new(SECRET.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256).hexdigest()
+    verified = user.step('verify_payment', 'POST', '/verify-payment/', json={
+        'razorpay_order_id': order_id, 'razorpay_payment_id': payment_id, 'razorpay_signature': signature,
+    })
+    if verified:
+        user.step('success', 'GET', f'/success/?order_id={verified.json()["order_id"]}')
+
+
+def seller_journey(user, number):
+    form = user.step('createproduct_form', 'GET', '/createproduct/')
+    if not form:
+        return
+    csrf = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', form.text).group(1)
+    user.step('createproduct', 'POST', '/createproduct/', expect=(302,), data={
+        'name': f'Loadtest upload {number}', 'description': 'Uploaded by benchmarks.loadtest', 'price': '299',
+        'csrfmiddlewaretoken': csrf,
+    }, files={'image': ('cover.png', IMAGE, 'image/png')})
+    user.step('dashboard', 'GET', '/dashboard/')
+    user.step('sales', 'GET', '/sales/')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """{step: {p95_ms: (before, after, change %), requests_per_sec: ...}} against an earlier run"""
+    changes = {}
+    for name, step in result['steps'].items():
+        before = baseline.get('steps', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {}
+        for metric, old, new in (
+            ('p95_ms', before['latency']['p95_ms'], step['latency']['p95_ms']),
+            ('requests_per_sec', before['requests_per_sec'], step['requests_per_sec']),
+        ):
+            change = round((new - old) / old * 100, 1) if old else None
+            changes[name][metric] = (old, new, change)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buyers', type=int, default=8, help='concurrent buyer sessions')
+    parser.add_argument('--sellers', type=int, default=2, help='concurrent seller sessions')
+    parser.add_argument('--iterations', type=int, default=20, help='journeys per session')
+    parser.add_argument('--products', type=int, default=200, help='catalog size to seed')
+    parser.add_argument('--gateway-latency-ms', type=float, default=50)
+    parser.add_argument('--storage-latency-ms', type=float, default=0, help='added to each image upload')
+    parser.add_argument('--port', type=int, default=8799, help='port of the app server')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    parser.add_argument('--baseline', help='JSON result of an earlier run to compare with')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--media', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return run_server(args.serve, args.media, args.storage_latency_ms)
+
+    setup()
+    product_ids = seed(max(args.buyers, 1), max(args.sellers, 1), args.products)
+    gateway, gateway_url = serve(latency_ms=args.gateway_latency_ms)
+    media = tempfile.TemporaryDirectory(prefix='loadtest-media-')
+    server, base_url = start_server(args.port, gateway_url, media.name, args.storage_latency_ms)
+
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def record(step, seconds, ok):
+        with lock:
+            samples[step].append(seconds)
+            if not ok:
+                errors[step] += 1
+
+    def run_buyer(number):
+        rng = random.Random(args.seed + number)
+        user = VirtualUser(base_url, f'loadtest_buyer_{number}', record)
+        for _ in range(args.iterations):
+            buyer_journey(user, rng.choice(product_ids), f'loadtest_buyer_{number}@example.com')
+
+    def run_seller(number):
+        user = VirtualUser(base_url, f'loadtest_seller_{number}', record)
+        for i in range(args.iterations):
+            seller_journey(user, f'{args.seed}-{number}-{i}')
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.buyers + args.sellers) as pool:
+            futures = [pool.submit(run_buyer, n) for n in range(args.buyers)]
+            futures += [pool.submit(run_seller, n) for n in range(args.sellers)]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+        gateway.shutdown()
+        media.cleanup()
+
+    result = {
+        'commit': git_commit(),
+        'config': {
+            'buyers': args.buyers, 'sellers': args.sellers, 'iterations': args.iterations,
+            'products': len(product_ids), 'gateway_latency_ms': args.gateway_latency_ms,
+            'storage_latency_ms': args.storage_latency_ms, 'seed': args.seed,
+        },
+        'elapsed_seconds': round(elapsed, 2),
+        'steps': {
+            step: {
+                'latency': summarize(samples[step]),
+                'requests_per_sec': round(len(samples[step]) / elapsed, 1),
+                'errors': errors[step],
+            }
+            for step in BUYER_STEPS + SELLER_STEPS if samples[step]
+        },
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        result['baseline_commit'] = baseline.get('commit')
+        result['change'] = compare(result, baseline)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
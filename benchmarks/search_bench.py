@@ -0,0 +1,107 @@
+"""
+Product search latency.
+
+    python -m benchmarks.search_bench                      # in-process index, 1M synthetic products
+    python -m benchmarks.search_bench --products 100000
+    python -m benchmarks.search_bench --backend db         # search_products() against the configured DB
+
+The in-process run builds the same InvertedIndex the SQLite fallback uses.
+The db run expects the catalog to be populated already (see generate_dataset).
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+
+from benchmarks._setup import setup, summarize
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'pu', 'ra', 'si', 'to', 'vu', 'ze', 'an', 'el', 'or', 'ix', 'um']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def zipf_weights(n):
+    return list(itertools.accumulate(1 / (rank + 1) for rank in range(n)))
+
+
+def build_index(products, words, cum_weights, rng):
+    from myapp.search import InvertedIndex
+
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for product_id in range(1, products + 1):
+        name = ' '.join(rng.choices(words, cum_weights=cum_weights, k=3))
+        description = ' '.join(rng.choices(words, cum_weights=cum_weights, k=8))
+        index.add(product_id, name, description)
+    return index, time.perf_counter() - started
+
+
+def make_queries(count, words, cum_weights, rng):
+    queries = []
+    for _ in range(count):
+        picked = rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 2))
+        # The last word is typed partially, like a search box would send it
+        picked[-1] = picked[-1][:max(2, len(picked[-1]) - 2)]
+        queries.append(' '.join(picked))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['memory', 'db'], default='memory')
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--vocabulary', type=int, default=50_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    setup()
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary, rng)
+    cum_weights = zipf_weights(len(words))
+    result = {'backend': args.backend, 'page_size': args.page_size}
+
+    if args.backend == 'memory':
+        index, build_seconds = build_index(args.products, words, cum_weights, rng)
+        result.update(products=len(index), build_seconds=round(build_seconds, 2))
+
+        def run(query):
+            return index.search(query, args.page_size + 1)
+    else:
+        from myapp.models import Product
+        from myapp.search import search_products
+
+        result.update(products=Product.objects.count())
+
+        def run(query):
+            return search_products(query, per_page=args.page_size)
+
+    queries = make_queries(args.queries, words, cum_weights, rng)
+    for query in queries[:10]:
+        run(query)  # warm up
+
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        run(query)
+        samples.append(time.perf_counter() - started)
+
+    result['latency'] = summarize(samples)
+    result['queries_per_sec'] = round(len(samples) / sum(samples), 1)
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Product list serialization: ProductSerializer against the ProductRows fast path.
+
+    python -m benchmarks.serializer_bench                  # 10k rows, serialization only
+    python -m benchmarks.serializer_bench --backend db     # query + serialization, configured DB
+    python -m benchmarks.serializer_bench --fields id,name,price
+
+The memory run times turning 10k rows into response dicts and JSON bytes,
+from model instances (ProductSerializer) and from .values() dicts
+(ProductRows), with the same data. The db run includes the query, so it
+expects at least --rows products (see generate_dataset).
+"""
+import argparse
+import json
+import time
+
+from benchmarks._setup import setup
+
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['memory', 'db'], default='memory')
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--fields', help='comma separated ?fields= selection for the fast path')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.renderers import JSONRenderer
+
+    from myapp.models import Product
+    from myapp.serializers import ProductRows, ProductSerializer
+
+    rows = ProductRows(args.fields.split(',') if args.fields else None)
+    if args.backend == 'memory':
+        variants = {'card': {'webp': '/media/card.webp', 'jpeg': '/media/card.jpeg', 'width': 640, 'height': 480}}
+        values = [
+            {'id': i, 'name': f'Ebook {i}', 'description': 'A synthetic product description', 'price': 100.0 + i,
+             'seller_id': i % 100, 'total_sales': i, 'total_sales_amount': 100 * i,
+             'pending_sales': 0, 'pending_sales_amount': 0, 'image_variants': variants}
+            for i in range(args.rows)
+        ]
+        instances = []
+        for row in values:
+            product = Product(**{k: v for k, v in row.items() if not k.startswith('pending_')})
+            product.pending_sales = product.pending_sales_amount = 0
+            instances.append(product)
+
+        def serializer():
+            return ProductSerializer(instances, many=True).data
+
+        def fast():
+            return rows.data(values)
+    else:
+        def serializer():
+            return ProductSerializer(Product.objects.with_sales_totals().order_by('-id')[:args.rows], many=True).data
+
+        def fast():
+            return rows.data(rows.queryset(Product.objects).order_by('-id')[:args.rows])
+
+    render = JSONRenderer().render
+    if not args.fields and render(serializer()) != render(fast()):
+        raise SystemExit('ProductRows output differs from ProductSerializer')
+
+    result = {'backend': args.backend, 'rows': args.rows, 'fields': args.fields or 'all'}
+    for name, run in (('serializer', serializer), ('fast_path', fast)):
+        seconds = best_of(args.repeat, run)
+        with_json = best_of(args.repeat, lambda: render(run()))
+        result[name] = {
+            'ms': round(seconds * 1000, 1),
+            'ms_with_json': round(with_json * 1000, 1),
+            'rows_per_sec': round(args.rows / seconds),
+        }
+    result['speedup'] = round(result['serializer']['ms'] / result['fast_path']['ms'], 1)
+    result['speedup_with_json'] = round(result['serializer']['ms_with_json'] / result['fast_path']['ms_with_json'], 1)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Database round trips per signed-in page view, by session store.
+
+    python -m benchmarks.session_bench                     # 200 views of each page
+    python -m benchmarks.session_bench --sliding           # with SESSION_SAVE_EVERY_REQUEST
+    python -m benchmarks.session_bench --views 50 --output sessions.json
+
+Signs a scratch user in with each store (Django's own db engine, then
+myapp.sessions db / cached_db / cache) and requests the dashboard, sales,
+purchases and create product pages through the test client, counting every
+statement and the ones on django_session. The cache stores use the configured
+cache (local memory without REDIS_URL, so no network round trip for them
+here). Runs against the configured database (DJANGO_SETTINGS_MODULE /
+DATABASE_URL), so point it at a scratch database.
+"""
+import argparse
+import json
+import time
+
+from benchmarks._setup import setup, summarize
+
+USER = 'sessionbench_user'
+PAGES = ['/dashboard/', '/sales/', '/purchases/', '/createproduct/']
+ENGINES = {
+    'django_db': 'django.contrib.sessions.backends.db',
+    'db': 'myapp.sessions.db',
+    'cached_db': 'myapp.sessions.cached_db',
+    'cache': 'myapp.sessions.cache',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--views', type=int, default=200, help='requests per page and store')
+    parser.add_argument('--sliding', action='store_true', help='save the session on every request')
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, override_settings
+
+    User.objects.filter(username=USER).delete()
+    user = User.objects.create_user(USER, f'{USER}@example.com', 'bench')
+
+    def run(engine):
+        statements = []
+
+        def count(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with override_settings(SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=args.sliding):
+            client = Client()
+            client.force_login(user)
+            samples = []
+            with connection.execute_wrapper(count):
+                for _ in range(args.views):
+                    for page in PAGES:
+                        started = time.perf_counter()
+                        response = client.get(page)
+                        samples.append(time.perf_counter() - started)
+                        if response.status_code != 200:
+                            raise SystemExit(f'{page}: {response.status_code}')
+        views = len(samples)
+        session = [sql for sql in statements if 'django_session' in sql]
+        return {
+            'queries_per_view': round(len(statements) / views, 2),
+            'session_queries_per_view': round(len(session) / views, 2),
+            'session_writes_per_view': round(sum(not sql.lstrip().startswith('SELECT') for sql in session) / views, 3),
+            **summarize(samples),
+        }
+
+    result = {'views': args.views * len(PAGES), 'pages': PAGES, 'sliding': args.sliding}
+    try:
+        for name, engine in ENGINES.items():
+            result[name] = run(engine)
+        result['round_trips_saved_per_view'] = {
+            name: round(result['django_db']['queries_per_view'] - result[name]['queries_per_view'], 2)
+            for name in ENGINES if name != 'django_db'
+        }
+    finally:
+        user.delete()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
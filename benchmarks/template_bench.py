@@ -0,0 +1,100 @@
+"""
+Storefront render time by page size: cached product cards and template loader
+against rendering everything on each request.
+
+    python -m benchmarks.template_bench                    # 3, 30 and 300 products per page
+    python -m benchmarks.template_bench --sizes 30 --requests 50 --output templates.json
+
+Seeds the largest page size of products for a scratch seller, then requests
+the index page through the test client with CATALOG_PAGE_SIZE at each size:
+
+  uncached   templates read and compiled on every render (no cached loader),
+             every card rendered
+  loader     cached template loader, every card rendered
+  cards      cached template loader, cards from the catalog cache
+
+Runs against the configured database and cache (DJANGO_SETTINGS_MODULE /
+DATABASE_URL / REDIS_URL), so point it at scratch ones.
+"""
+import argparse
+import itertools
+import json
+import time
+from contextlib import ExitStack
+from copy import deepcopy
+
+from benchmarks._setup import setup, summarize
+
+SELLER = 'templatebench_seller'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='3,30,300', help='comma separated products per page')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per size and mode')
+    parser.add_argument('--output', help='write the JSON result here as well')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    setup()
+    from unittest import mock
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client, override_settings
+
+    from myapp import catalog_cache
+    from myapp.models import Product
+
+    User.objects.filter(username=SELLER).delete()
+    seller = User.objects.create_user(SELLER, f'{SELLER}@example.com', 'bench')
+    Product.objects.bulk_create(
+        Product(name=f'Bench ebook {i}', description='Seeded by benchmarks.template_bench ' * 4, price=100 + i, seller=seller)
+        for i in range(max(sizes))
+    )
+
+    uncached_templates = deepcopy(settings.TEMPLATES)
+    for engine in uncached_templates:
+        [(_, loaders)] = engine['OPTIONS'].pop('loaders')
+        engine['OPTIONS']['loaders'] = loaders
+    # A key nobody has seen yet on every call: each card is rendered again
+    fresh = itertools.count()
+    every_card = mock.patch.object(catalog_cache, '_card_key', lambda template_name, product: f'bench:{next(fresh)}')
+    modes = {
+        'uncached': [override_settings(TEMPLATES=uncached_templates), every_card],
+        'loader': [every_card],
+        'cards': [],
+    }
+
+    client = Client()
+    result = {'requests': args.requests}
+    try:
+        for size in sizes:
+            result[size] = {}
+            for mode, patches in modes.items():
+                with ExitStack() as stack:
+                    stack.enter_context(override_settings(CATALOG_PAGE_SIZE=size, RATE_LIMIT_ENABLED=False))
+                    for patch in patches:
+                        stack.enter_context(patch)
+                    client.get('/')  # warm up: templates and cards cached where the mode allows
+                    samples = []
+                    for _ in range(args.requests):
+                        started = time.perf_counter()
+                        response = client.get('/')
+                        samples.append(time.perf_counter() - started)
+                        if response.status_code != 200:
+                            raise SystemExit(f'{response.status_code}')
+                result[size][mode] = summarize(samples)
+            result[size]['speedup'] = round(result[size]['uncached']['p50_ms'] / result[size]['cards']['p50_ms'], 1)
+    finally:
+        seller.delete()
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
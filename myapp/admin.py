@@ -1,6 +1,8 @@
 from django.contrib import admin
-from . models import Product, OrderDetail
+from . models import Product, OrderDetail, SalesRollup, PaymentWebhookEvent
 # Register your models here.
 
 admin.site.register(Product)
-admin.site.register(OrderDetail)
\ No newline at end of file
+admin.site.register(OrderDetail)
+admin.site.register(SalesRollup)
+admin.site.register(PaymentWebhookEvent)
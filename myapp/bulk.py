@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .db import update_from_values
+from .models import Product
+from .serializers import ProductWriteSerializer
+from .signals import batched_changes, products_changed
+
+
+# Bulk product writes (/api/products/bulk/).
+# Large sellers send up to MAX_ITEMS products per request instead of one
+# request each. Every item is validated on its own and gets its own result,
+# in request order; the valid ones are written together in one transaction:
+# one ownership query (rows locked), bulk INSERTs, UPDATE ... FROM (VALUES ...)
+# in chunks, one cascading DELETE. The catalog cache and search index are
+# invalidated once for the whole batch after commit.
+
+MAX_ITEMS = 5000
+UPDATE_FIELDS = ['name', 'description', 'price']
+
+
+def _invalid(errors):
+    return {'status': 400, 'errors': errors}
+
+
+def _validate(serializer, data):
+    """(validated_data, None) or (None, errors) for one item
+
+    One serializer validates the whole batch: a ModelSerializer builds its
+    fields per instance, which was most of the cost of validating item by item.
+    """
+    try:
+        return serializer.run_validation(data), None
+    except ValidationError as error:
+        return None, error.detail
+
+
+def _owned(seller, ids):
+    """{id: Product} of the given ids, locked, with (status, error) results for the rest"""
+    products = {
+        product.pk: product
+        for product in (
+            Product.objects.select_for_update().only('id', 'seller_id', *UPDATE_FIELDS)
+            .filter(pk__in=ids).order_by('pk')
+        )
+    }
+    missing = {}
+    for product_id in ids:
+        product = products.get(product_id)
+        if product is None:
+            missing[product_id] = {'status': 404, 'id': product_id, 'error': 'Not found'}
+        elif product.seller_id != seller.pk:
+            missing[product_id] = {'status': 403, 'id': product_id, 'error': 'Not authorized'}
+    return {pk: product for pk, product in products.items() if pk not in missing}, missing
+
+
+def _ids(ids):
+    """`ids` as a list, with a 400 result by position for invalid and repeated ones"""
+    ids, invalid, seen = list(ids), {}, set()
+    for i, product_id in enumerate(ids):
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            invalid[i] = _invalid({'id': ['A product id is required.']})
+        elif product_id in seen:
+            invalid[i] = _invalid({'id': ['Duplicate id in this batch.']})
+        else:
+            seen.add(product_id)
+    return ids, invalid
+
+
+def create_products(seller, items):
+    results, products = [], []
+    serializer = ProductWriteSerializer()
+    for item in items:
+        validated_data, errors = _validate(serializer, item)
+        if errors:
+            results.append(_invalid(errors))
+        else:
+            product = Product(seller=seller, **validated_data)
+            products.append(product)
+            results.append(product)
+
+    with transaction.atomic():
+        Product.objects.bulk_create(products, batch_size=1000)
+        products_changed(product.pk for product in products)
+    return [
+        {'status': 201, 'id': result.pk} if isinstance(result, Product) else result
+        for result in results
+    ]
+
+
+def update_products(seller, items):
+    """Partial updates, each item is {'id': ..., <fields to change>}"""
+    ids, results = _ids(item.get('id') if isinstance(item, dict) else None for item in items)
+    # Validated before taking the row locks
+    changes = {}
+    serializer = ProductWriteSerializer(partial=True)
+    for i, (item, product_id) in enumerate(zip(items, ids)):
+        if i in results:
+            continue
+        validated_data, errors = _validate(serializer, {k: v for k, v in item.items() if k != 'id'})
+        if errors:
+            results[i] = _invalid(errors)
+        else:
+            changes[i] = validated_data
+
+    with transaction.atomic():
+        products, missing = _owned(seller, [ids[i] for i in changes])
+        now = timezone.now()
+        rows = []
+        for i, validated_data in changes.items():
+            product = products.get(ids[i])
+            if product is None:
+                results[i] = missing[ids[i]]
+                continue
+            for field, value in validated_data.items():
+                setattr(product, field, value)
+            rows.append((product.pk, *(getattr(product, field) for field in UPDATE_FIELDS), now))
+            results[i] = {'status': 200, 'id': product.pk}
+
+        update_from_values(Product, [*UPDATE_FIELDS, 'updated_at'], rows)
+        products_changed(row[0] for row in rows)
+    return [results[i] for i in range(len(items))]
+
+
+def delete_products(seller, ids):
+    ids, results = _ids(ids)
+    with transaction.atomic(), batched_changes():
+        products, missing = _owned(seller, [pk for i, pk in enumerate(ids) if i not in results])
+        # Deletes their orders, rollups and counter shards like a single delete
+        Product.objects.filter(pk__in=list(products)).delete()
+    for i, product_id in enumerate(ids):
+        if i not in results:
+            results[i] = missing.get(product_id) or {'status': 200, 'id': product_id}
+    return [results[i] for i in range(len(ids))]
@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .conditional import data_etag
+
+
+# Versioned catalog cache.
+# Every product has a version key and the whole catalog has one more.
+# Entries embed the version in their key, so an edit only has to bump the
+# version (from the Product signals) and every stale entry is simply never
+# read again and ages out on its own.
+# An entry is (data, etag, last_modified), so conditional GETs are answered
+# from the entry alone (conditional.py).
+# Product cards in the HTML pages are cached as rendered fragments keyed on
+# the product's updated_at, which every change to a card's fields moves (the
+# sales counters, not on cards, don't), so they need no invalidation and a
+# page fetches all of its cards in one get_many.
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _record(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def stats():
+    """Hit/miss counters for this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
+
+
+def _product_version_key(product_id):
+    return f'catalog:product:{product_id}:version'
+
+
+def _new_version():
+    # Time based so a version key that was evicted can't restart at an old number
+    return time.time_ns()
+
+
+def _version(cache, key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def catalog_version():
+    return _version(get_cache(), CATALOG_VERSION_KEY)
+
+
+def product_version(product_id):
+    return _version(get_cache(), _product_version_key(product_id))
+
+
+def _get_or_build(cache, key, build):
+    entry = cache.get(key)
+    if entry is not None:
+        _record(True)
+        return entry
+    _record(False)
+    data, last_modified = build()
+    entry = (data, data_etag(data), last_modified)
+    cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+    return entry
+
+
+def get_product(product_id, build):
+    """Cached per-product entry, `build()` returns (data, last_modified) on a miss"""
+    cache = get_cache()
+    version = _version(cache, _product_version_key(product_id))
+    return _get_or_build(cache, f'catalog:product:{product_id}:entry:v{version}', build)
+
+
+def get_page(request, build):
+    """Cached listing page keyed on the full URL (cursor, page size, ...)"""
+    cache = get_cache()
+    version = _version(cache, CATALOG_VERSION_KEY)
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return _get_or_build(cache, f'catalog:page:entry:v{version}:{url_hash}', build)
+
+
+def invalidate(product_ids=()):
+    """Move the given products and the catalog listing to new versions"""
+    cache = get_cache()
+    # Dropping the version keys is one round trip however many products
+    # changed; the next read starts them again at a later, time based version
+    cache.delete_many([_product_version_key(product_id) for product_id in product_ids])
+    _bump(cache, CATALOG_VERSION_KEY)
+
+
+def _card_key(template_name, product):
+    version = product.updated_at.timestamp() if product.updated_at else 0
+    return f'catalog:card:{template_name}:{product.pk}:{version}'
+
+
+def render_cards(products, template_name):
+    """Set `product.card` to its rendered `template_name` (context: product only), cached per product version"""
+    cache = get_cache()
+    keys = [_card_key(template_name, product) for product in products]
+    cached = cache.get_many(keys) if keys else {}
+    rendered = {}
+    template = None
+    for product, key in zip(products, keys):
+        html = cached.get(key)
+        _record(html is not None)
+        if html is None:
+            template = template or get_template(template_name)
+            html = rendered[key] = template.render({'product': product})
+        product.card = mark_safe(html)
+    if rendered:
+        cache.set_many(rendered, settings.CATALOG_CACHE_TIMEOUT)
+    return products
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core import checks
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+
+
+@checks.register(checks.Tags.templates)
+def cached_template_loader(app_configs, **kwargs):
+    """Outside DEBUG, every Django template engine should compile templates once per process"""
+    if settings.DEBUG:
+        return []
+    errors = []
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates) and not any(
+            isinstance(loader, CachedLoader) for loader in engine.engine.template_loaders
+        ):
+            errors.append(checks.Warning(
+                f"Template engine '{engine.name}' doesn't use the cached loader, "
+                'every render reads and compiles its templates again.',
+                hint="Wrap its loaders in 'django.template.loaders.cached.Loader' (see mysite/settings.py).",
+                id='myapp.W001',
+            ))
+    return errors
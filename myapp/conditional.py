@@ -0,0 +1,62 @@
+import hashlib
+import json
+from calendar import timegm
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+# Conditional GET for the catalog.
+# Catalog pages and APIs send a strong ETag and Last-Modified, and a request
+# whose If-None-Match / If-Modified-Since still matches gets 304 Not Modified
+# before anything is rendered or serialized:
+# - The product APIs answer from the catalog cache, whose entries keep the
+#   ETag (hash of the serialized data) and Last-Modified next to the data, so
+#   revalidating costs the cache lookup the request made anyway, no query.
+# - The HTML pages depend on the signed-in user and aren't cached: detail
+#   checks the product row it loads anyway, index the catalog version plus a
+#   MAX(updated_at) on its index. Their ETags also cover the viewer's CSRF
+#   secret (the logout forms embed a token, and login rotates it), and a page
+#   with flash messages waiting is always rendered.
+# Public responses may be kept by a CDN for CATALOG_HTTP_MAX_AGE seconds and
+# served stale while it revalidates; browsers always revalidate.
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def data_etag(data):
+    """Strong ETag of serialized API data"""
+    return make_etag(json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True))
+
+
+def respond(request, etag, last_modified, render, public, conditional=True):
+    """`render()`, or 304 Not Modified when the client already has this version
+
+    `last_modified` is a datetime or None. Public responses are shared by
+    every user (CDN cacheable); the others are private and revalidated on
+    every use. `conditional=False` always renders (the page shows something
+    the validators don't cover), still sending them.
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp) if conditional else None
+    if response is None:
+        response = render()
+    if response.status_code not in (200, 304):
+        return response
+
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    if public:
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=settings.CATALOG_HTTP_MAX_AGE,
+            stale_while_revalidate=settings.CATALOG_HTTP_MAX_AGE,
+        )
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,23 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .sales_feed import seller_group
+
+
+class SalesConsumer(AsyncJsonWebsocketConsumer):
+    """Live sales of the signed-in seller, see sales_feed.py"""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.group = seller_group(user.pk)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def sales_event(self, event):
+        await self.send_json({'sales': event['sales']})
@@ -0,0 +1,77 @@
+import random
+
+from django.db import transaction
+from django.db.models import F
+
+from .db import upsert_increments
+from .models import Product, ProductSalesShard
+
+
+# Product sales counters.
+# Normal products get one UPDATE ... SET total_sales = total_sales + 1 touching
+# only the two counter columns, so concurrent payments never lose an update.
+# Hot products (counter_shards > 0) spread their increments over N shard rows
+# so concurrent payments don't all queue on one row lock; reads add the
+# shards on top (Product.objects.with_sales_totals()) until compaction folds
+# them back into the product row.
+#
+# Counter updates don't go through Product.save(), so they don't invalidate the
+# catalog cache; cached listings can lag by up to CATALOG_CACHE_TIMEOUT.
+
+def increment_sales(product_id, amount, shards=0, count=1):
+    if shards:
+        upsert_increments(
+            ProductSalesShard,
+            ['product', 'slot'],
+            ['total_sales', 'total_sales_amount'],
+            [(product_id, random.randrange(shards), count, amount)],
+        )
+    else:
+        Product.objects.filter(pk=product_id).update(
+            total_sales=F('total_sales') + count,
+            total_sales_amount=F('total_sales_amount') + amount,
+        )
+
+
+def add_sale(product, amount):
+    """Count one paid order of `product`"""
+    increment_sales(product.pk, amount, product.counter_shards)
+
+
+def sales_totals(product_id):
+    """(total_sales, total_sales_amount) including shards not compacted yet"""
+    product = Product.objects.with_sales_totals().values(
+        'total_sales', 'total_sales_amount', 'pending_sales', 'pending_sales_amount'
+    ).get(pk=product_id)
+    return (
+        product['total_sales'] + product['pending_sales'],
+        product['total_sales_amount'] + product['pending_sales_amount'],
+    )
+
+
+def compact_product(product_id):
+    """Fold a product's shard slots into its row, returns the folded (sales, amount)"""
+    with transaction.atomic():
+        shards = list(
+            ProductSalesShard.objects
+            .filter(product_id=product_id)
+            .exclude(total_sales=0, total_sales_amount=0)
+            .values_list('id', 'total_sales', 'total_sales_amount')
+        )
+        if not shards:
+            return 0, 0
+        sales = amount = 0
+        for shard_id, shard_sales, shard_amount in shards:
+            # Subtract what was read instead of zeroing, so an increment that
+            # lands between the read and this update is kept for next time
+            ProductSalesShard.objects.filter(pk=shard_id).update(
+                total_sales=F('total_sales') - shard_sales,
+                total_sales_amount=F('total_sales_amount') - shard_amount,
+            )
+            sales += shard_sales
+            amount += shard_amount
+        Product.objects.filter(pk=product_id).update(
+            total_sales=F('total_sales') + sales,
+            total_sales_amount=F('total_sales_amount') + amount,
+        )
+    return sales, amount
@@ -0,0 +1,77 @@
+from django.db import connection
+
+
+def upsert_increments(model, key_fields, increment_fields, rows):
+    """Add `increment_fields` onto the rows identified by `key_fields`, creating them as needed.
+
+    `rows` are tuples of key values followed by increments. It runs as one
+    INSERT ... ON CONFLICT (keys) DO UPDATE SET f = f + excluded.f statement
+    (same syntax on Postgres and SQLite), so concurrent writers never lose an
+    update and never need a lock-then-update round trip. The keys must be
+    covered by a unique constraint.
+    """
+    merged = {}
+    width = len(key_fields)
+    for row in rows:
+        key, increments = tuple(row[:width]), row[width:]
+        current = merged.get(key)
+        merged[key] = increments if current is None else [a + b for a, b in zip(current, increments)]
+    if not merged:
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = [model._meta.get_field(name).column for name in (*key_fields, *increment_fields)]
+    keys = ', '.join(qn(column) for column in columns[:width])
+    updates = ', '.join(
+        f'{qn(column)} = {table}.{qn(column)} + excluded.{qn(column)}'
+        for column in columns[width:]
+    )
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    params = []
+    for key, increments in merged.items():
+        params.extend(key)
+        params.extend(increments)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(qn(column) for column in columns)}) '
+            f'VALUES {", ".join([placeholders] * len(merged))} '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+            params,
+        )
+
+
+def update_from_values(model, fields, rows, chunk_size=1000):
+    """Set `fields` per primary key from `rows` of (pk, *values).
+
+    One UPDATE ... FROM (VALUES ...) statement per chunk (Postgres, SQLite
+    3.33+) instead of QuerySet.bulk_update's CASE WHEN per row and field, which
+    dominates the cost of large batches.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = model._meta.pk
+    model_fields = [model._meta.get_field(name) for name in fields]
+    # VALUES columns are named column1, column2, ... on both backends
+    assignments = ', '.join(
+        f'{qn(field.column)} = v.column{i}' for i, field in enumerate(model_fields, start=2)
+    )
+    placeholders = '(' + ', '.join(['%s'] * (len(fields) + 1)) + ')'
+
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            params = []
+            for row in chunk:
+                params.append(pk.get_db_prep_value(row[0], connection))
+                params.extend(
+                    field.get_db_prep_value(value, connection) for field, value in zip(model_fields, row[1:])
+                )
+            cursor.execute(
+                f'UPDATE {table} SET {assignments} '
+                f'FROM (VALUES {", ".join([placeholders] * len(chunk))}) AS v '
+                f'WHERE {table}.{qn(pk.column)} = v.column1',
+                params,
+            )
@@ -8,7 +8,9 @@ class ProductForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['image'].required = True  # Make image required
+        # Required unless the product already has an image (an edit may keep it)
+        instance = self.instance
+        self.fields['image'].required = not (instance.image or instance.staged_image or instance.image_variants)
 
 class UserRegistrationForm(forms.ModelForm):
     password = forms.CharField(label='Password',widget=forms.PasswordInput)
@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import razorpay
+import requests
+import urllib3
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from mysite.metrics import timed
+
+
+# One Razorpay client per process.
+# A pooled keep-alive session replaces the per-request razorpay.Client (and
+# its fresh TLS handshake), every call gets connect/read timeouts, and order
+# creation is retried with exponential backoff when the connection could not
+# be made. Once the request may have been sent (a read timeout, a dropped
+# connection, a 5xx) the gateway may have created the order, so that error is
+# raised instead: a retry could leave a second, orphaned gateway order.
+
+class GatewayClient(razorpay.Client):
+    """razorpay.Client on a pooled session with default timeouts"""
+
+    def __init__(self, key_id, secret, base_url=None, timeout=None, pool_size=20):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        options = {'base_url': base_url} if base_url else {}
+        super().__init__(session=session, auth=(key_id, secret), **options)
+        self.timeout = timeout
+        self._version = None
+
+    def request(self, method, path, **options):
+        options.setdefault('timeout', self.timeout)
+        with timed('gateway'):
+            return super().request(method, path, **options)
+
+    def _get_version(self):
+        # The SDK looks its own version up in the package metadata on every call
+        if self._version is None:
+            self._version = super()._get_version()
+        return self._version
+
+
+def connect_failed(error):
+    """True if the request never reached the gateway, so retrying can't create a second order"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # Refused, unreachable or DNS failure, as opposed to a connection that
+        # broke after the request went out
+        return isinstance(getattr(error.args[0], 'reason', None), urllib3.exceptions.NewConnectionError)
+    return False
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GatewayClient(
+                    settings.RAZOR_KEY_ID,
+                    settings.RAZOR_SECRET_KEY,
+                    base_url=settings.RAZORPAY_BASE_URL,
+                    timeout=(settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT),
+                    pool_size=settings.RAZORPAY_POOL_SIZE,
+                )
+    return _client
+
+
+def reset_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def _gateway_setting_changed(setting, **kwargs):
+    if setting.startswith('RAZOR'):
+        reset_client()
+
+
+def create_order(amount, currency='INR'):
+    """Create a gateway order (amount in paise), retrying failures to connect"""
+    attempts = settings.RAZORPAY_ORDER_RETRIES + 1
+    delay = settings.RAZORPAY_RETRY_BACKOFF
+    for attempt in range(attempts):
+        try:
+            return get_client().order.create({
+                "amount": amount,
+                "currency": currency,
+                "payment_capture": 1
+            })
+        except requests.exceptions.RequestException as e:
+            if attempt == attempts - 1 or not connect_failed(e):
+                raise
+            time.sleep(delay * random.uniform(0.75, 1.25))
+            delay *= 2
+
+
+# The blocking call runs in a worker thread, so an async view never stalls the
+# event loop while it waits for the gateway. The executor is sized like the
+# HTTP pool instead of the loop's default (cpu count + 4) one.
+_executor = ThreadPoolExecutor(max_workers=settings.RAZORPAY_POOL_SIZE, thread_name_prefix='gateway')
+acreate_order = sync_to_async(create_order, thread_sensitive=False, executor=_executor)
+
+
+def verify_payment_signature(order_id, payment_id, signature):
+    """Raises razorpay.errors.SignatureVerificationError on a bad signature (no HTTP call)"""
+    get_client().utility.verify_payment_signature({
+        'razorpay_order_id': order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': signature
+    })
+
+
+def verify_webhook_signature(body, signature):
+    """Raises razorpay.errors.SignatureVerificationError unless `body` was signed with RAZOR_WEBHOOK_SECRET"""
+    if not settings.RAZOR_WEBHOOK_SECRET:
+        raise razorpay.errors.SignatureVerificationError('RAZOR_WEBHOOK_SECRET is not configured')
+    razorpay.Utility(None).verify_webhook_signature(body, signature or '', settings.RAZOR_WEBHOOK_SECRET)
@@ -0,0 +1,132 @@
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Product, image_variant_storage
+from .signals import products_changed
+
+logger = logging.getLogger(__name__)
+
+
+# Product image variants.
+# Uploads are only staged on local disk inside the request (Product.save).
+# process_product_images then renders each staged image once into fixed
+# sizes, WebP plus a JPEG fallback, uploads them and stores their URLs in
+# Product.image_variants, so pages serve a thumbnail-sized file and never build
+# an image URL while rendering.
+
+# Longest side in pixels
+VARIANTS = {
+    'full': 1600,
+    'card': 640,
+    'thumb': 160,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = image_variant_storage()
+    return _storage
+
+
+def render_variants(file):
+    """{variant: (width, height, {format: bytes})} for an image file"""
+    image = Image.open(file)
+    largest = max(VARIANTS.values())
+    scale = min(1, largest / max(image.size))
+    # JPEG decoding can downscale by 1/2..1/8 for almost free: a 12 MP photo
+    # decodes at 2000x1500 instead of being decoded in full and resized
+    image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        # Transparent images go on white, JPEG has no alpha
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+
+    rendered = {}
+    # Largest first, each smaller variant is resized from the previous one
+    for name, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        if max(image.size) > size:
+            ratio = size / max(image.size)
+            target = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+            # reducing_gap: a cheap box reduction first, Lanczos for the last 3x
+            image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+        encoded = {}
+        for fmt, (pil_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            encoded[fmt] = buffer.getvalue()
+        rendered[name] = (image.width, image.height, encoded)
+    return rendered
+
+
+def store_variants(product_id, staged_name, rendered):
+    """Upload rendered variants, returns (the Product.image_variants value, the stored names)"""
+    storage = get_storage()
+    # The staged name is unique per upload, so a replaced image gets new URLs
+    stem = os.path.splitext(os.path.basename(staged_name))[0]
+    variants, stored_names = {}, []
+    for name, (width, height, encoded) in rendered.items():
+        variants[name] = {'width': width, 'height': height}
+        for fmt, data in encoded.items():
+            stored = storage.save(f'products/{product_id}/{stem}-{name}.{fmt}', ContentFile(data))
+            stored_names.append(stored)
+            variants[name][fmt] = storage.url(stored)
+    return variants, stored_names
+
+
+def pending_images():
+    return Product.objects.exclude(staged_image='')
+
+
+def process_image(product_id):
+    """Render and upload the staged image of one product, returns True if it was processed
+
+    Rendering and uploading run outside any transaction; the result is then
+    committed in one short UPDATE, only if the product still has the staged
+    file that was rendered. An upload that replaced it meanwhile is processed
+    on the next pass.
+
+    Only an image Pillow cannot decode is dropped. Errors opening the staged
+    file or storing the variants propagate and leave the product pending, to
+    be retried.
+    """
+    product = pending_images().only('id', 'staged_image').filter(pk=product_id).first()
+    if product is None:
+        return False
+    staged = product.staged_image
+    with staged.open('rb') as file:
+        try:
+            rendered = render_variants(file)
+        except (OSError, Image.DecompressionBombError):
+            # Not an image Pillow can read (UnidentifiedImageError is an
+            # OSError, so is a truncated file): drop it rather than retry forever
+            logger.exception('Product %s: could not decode %s', product.pk, staged.name)
+            rendered = None
+    variants, stored_names = store_variants(product.pk, staged.name, rendered) if rendered else ({}, [])
+
+    updates = {'staged_image': '', 'updated_at': timezone.now()}
+    if rendered is not None:
+        updates['image_variants'] = variants
+    with transaction.atomic():
+        if not pending_images().filter(pk=product.pk, staged_image=staged.name).update(**updates):
+            # Replaced or already processed by another worker: these uploads are not referenced
+            for name in stored_names:
+                get_storage().delete(name)
+            return False
+        products_changed([product.pk])
+        transaction.on_commit(lambda: staged.storage.delete(staged.name))
+    return True
@@ -0,0 +1,56 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from myapp.db import update_from_values
+from myapp.models import OrderDetail
+
+
+def buyer_ids_by_email(emails):
+    """{email: user id} for the emails that belong to exactly one account"""
+    rows = (
+        User.objects.filter(email__in=emails)
+        .values('email')
+        .annotate(accounts=Count('id'), user_id=Min('id'))
+        .filter(accounts=1)
+    )
+    return {row['email']: row['user_id'] for row in rows}
+
+
+class Command(BaseCommand):
+    help = (
+        'Link orders without a buyer to the account with the same email, in chunks. '
+        'Emails shared by several accounts are left unlinked.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        orders = OrderDetail.objects.filter(buyer__isnull=True).order_by('id').values_list('id', 'customer_email')
+
+        started = time.monotonic()
+        last_id = 0
+        scanned = linked = 0
+        while True:
+            chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            buyers = buyer_ids_by_email({email for _, email in chunk})
+            rows = [(order_id, buyers[email]) for order_id, email in chunk if email in buyers]
+            with transaction.atomic():
+                update_from_values(OrderDetail, ['buyer'], rows)
+            last_id = chunk[-1][0]
+            scanned += len(chunk)
+            linked += len(rows)
+            self.stdout.write(f'{scanned} orders scanned, {linked} linked (last id {last_id})')
+
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. orders={scanned} linked={linked} in {elapsed:.1f}s ({rate:.0f} orders/s)'
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.counters import compact_product
+from myapp.models import ProductSalesShard
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded sales counter slots back into Product.total_sales / total_sales_amount'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, help='only compact this product id')
+        parser.add_argument('--loop', type=float, help='keep running, compacting every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.compact(options['product'])
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def compact(self, product_id):
+        shards = ProductSalesShard.objects.exclude(total_sales=0, total_sales_amount=0)
+        if product_id is not None:
+            shards = shards.filter(product_id=product_id)
+        product_ids = sorted(set(shards.values_list('product_id', flat=True)))
+
+        total_sales = total_amount = 0
+        for pid in product_ids:
+            sales, amount = compact_product(pid)
+            total_sales += sales
+            total_amount += amount
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {len(product_ids)} products: sales={total_sales} amount={total_amount}'
+        ))
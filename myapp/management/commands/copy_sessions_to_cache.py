@@ -0,0 +1,58 @@
+import time
+from collections import defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy unexpired database sessions into the session cache, in chunks, so switching '
+        'SESSION_STORE to cache keeps users signed in. Run it right before the switch: '
+        'sessions that change in between are copied as they were.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', choices=['cache', 'cached_db'], default='cache',
+                            help='session store to fill (cached_db only warms its cache)')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['store'] == 'cache' and not settings.REDIS_URL:
+            raise CommandError('The cache session store needs REDIS_URL (a cache shared by every process)')
+        store = import_module(f'myapp.sessions.{options["store"]}').SessionStore
+        cache = caches[settings.SESSION_CACHE_ALIAS]
+
+        now = timezone.now()
+        sessions = (
+            Session.objects.filter(expire_date__gt=now).order_by('session_key')
+            .values_list('session_key', 'session_data', 'expire_date')
+        )
+        decoder = store()
+
+        started = time.monotonic()
+        last_key = ''
+        copied = 0
+        while True:
+            chunk = list(sessions.filter(session_key__gt=last_key)[:options['chunk_size']])
+            if not chunk:
+                break
+            # One set_many per whole minute of remaining lifetime; rounding
+            # down only drops a session from the cache a little early
+            by_timeout = defaultdict(dict)
+            for session_key, session_data, expire_date in chunk:
+                timeout = int((expire_date - now).total_seconds()) // 60 * 60
+                if timeout > 0:
+                    by_timeout[timeout][store.cache_key_prefix + session_key] = decoder.decode(session_data)
+            for timeout, entries in by_timeout.items():
+                cache.set_many(entries, timeout)
+            last_key = chunk[-1][0]
+            copied += sum(len(entries) for entries in by_timeout.values())
+            self.stdout.write(f'{copied} sessions copied (last key {last_key[:8]}...)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Done. sessions={copied} in {elapsed:.1f}s'))
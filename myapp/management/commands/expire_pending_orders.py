@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.models import ArchivedOrder, OrderDetail
+
+ARCHIVED_FIELDS = ['id', 'customer_email', 'buyer_id', 'product_id', 'amount', 'created_on', 'razor_order_id']
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark PENDING orders older than the TTL (abandoned checkouts) EXPIRED, in batches. '
+        'Orders a payment confirmation holds locked are skipped (SKIP LOCKED) and left for the next run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=settings.PENDING_ORDER_TTL,
+                            help='seconds a checkout may stay PENDING (PENDING_ORDER_TTL)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--archive', action='store_true',
+                            help='move them to ArchivedOrder instead; a payment arriving later finds no order, '
+                                 'so keep the TTL well past how long the gateway accepts one')
+        parser.add_argument('--loop', type=float, help='keep running, sweeping every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options['ttl'], options['batch_size'], options['archive'])
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def sweep(self, ttl, batch_size, archive):
+        # Served by the orderdetail_pending_created partial index
+        stale = (
+            OrderDetail.objects.filter(status='PENDING', created_on__lt=timezone.now() - timedelta(seconds=ttl))
+            .order_by('created_on')
+        )
+
+        started = time.monotonic()
+        swept = 0
+        while True:
+            with transaction.atomic():
+                # Each batch leaves the PENDING set, so the next one starts
+                # over at the oldest rows that are still there
+                locked = stale.select_for_update(skip_locked=True)[:batch_size]
+                if archive:
+                    rows = list(locked.values(*ARCHIVED_FIELDS))
+                    ids = [row['id'] for row in rows]
+                    ArchivedOrder.objects.bulk_create(
+                        [ArchivedOrder(order_id=row.pop('id'), **row) for row in rows], ignore_conflicts=True
+                    )
+                    OrderDetail.objects.filter(id__in=ids).delete()
+                else:
+                    ids = list(locked.values_list('id', flat=True))
+                    OrderDetail.objects.filter(id__in=ids, status='PENDING').update(
+                        status='EXPIRED', updated_on=timezone.now()
+                    )
+            if not ids:
+                break
+            swept += len(ids)
+            self.stdout.write(f'{swept} orders {"archived" if archive else "expired"} (last id {ids[-1]})')
+
+        elapsed = time.monotonic() - started
+        rate = swept / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. orders={swept} in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
@@ -0,0 +1,197 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from myapp.db import update_from_values
+from myapp.models import OrderDetail, Product
+from myapp.rollups import add_to_rollups
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'pu', 'ra', 'si', 'to', 'vu', 'ze', 'an', 'el', 'or', 'ix', 'um']
+KINDS = ['Ebook', 'Course', 'Template', 'Preset pack', 'Font', 'Icon set', 'Audio pack', 'Guide']
+PRICES = [49, 99, 149, 199, 299, 499, 799, 999, 1499, 2999]
+STATUSES = ['PAID', 'FAILED', 'PENDING']
+STATUS_WEIGHTS = [78, 12, 10]
+# Relative checkouts per hour of the (local) day: quiet nights, evening peak
+HOURLY = [2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 10, 11, 10, 10, 10, 11, 12, 14, 16, 16, 13, 8, 4]
+ORDER_COLUMNS = [
+    'customer_email', 'buyer', 'product', 'amount', 'has_paid', 'created_on', 'updated_on',
+    'status', 'razor_order_id', 'razor_payment_id', 'receipt',
+]
+
+
+def zipf_cum_weights(n, exponent):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def order_rows(rng, count, products, buyers, end, days, exponent, prefix):
+    """Yield `count` order tuples (ORDER_COLUMNS) from `rng`, deterministic for a given seed
+
+    `products` is [(id, price)] and `buyers` [(id, email)]. Product popularity
+    follows a Zipf law over a seeded shuffle of the catalog; order volume grows
+    linearly over the `days` before `end` and follows HOURLY through the day.
+    """
+    ranked = products[:]
+    rng.shuffle(ranked)
+    cum_weights = zipf_cum_weights(len(ranked), exponent)
+    hour_weights = list(itertools.accumulate(HOURLY))
+    status_weights = list(itertools.accumulate(STATUS_WEIGHTS))
+    start = end - datetime.timedelta(days=days)
+
+    # Drawn a block at a time: one choices() call per column instead of per row
+    block = 10_000
+    for offset in range(0, count, block):
+        size = min(block, count - offset)
+        picked = rng.choices(ranked, cum_weights=cum_weights, k=size)
+        hours = rng.choices(range(24), cum_weights=hour_weights, k=size)
+        statuses = rng.choices(STATUSES, cum_weights=status_weights, k=size)
+        for n, (product_id, price), hour, status in zip(itertools.count(offset), picked, hours, statuses):
+            buyer_id, email = buyers[rng.randrange(len(buyers))]
+            # Density proportional to age from start: a growing store
+            day = int(days * rng.random() ** 0.5)
+            created_on = start + datetime.timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+            yield (
+                email, buyer_id, product_id, price, status == 'PAID', created_on, created_on, status,
+                f'order_{prefix}{n}', f'pay_{prefix}{n}' if status == 'PAID' else None, '',
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate sellers, buyers, a catalog and orders at scale for benchmarks. '
+        'The same options and seed on an empty database produce the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=1000)
+        parser.add_argument('--buyers', type=int, default=100_000)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--days', type=int, default=730, help='spread orders over this many days')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, default=None,
+                            help='last day of orders (YYYY-MM-DD), today by default; fix it for identical reruns')
+        parser.add_argument('--zipf', type=float, default=1.1, help='product popularity exponent')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=50_000)
+        parser.add_argument('--prefix', default='ds', help='prefix of generated usernames and gateway ids')
+        parser.add_argument('--password', default='dataset', help='password of every generated account')
+        parser.add_argument('--method', choices=['auto', 'copy', 'insert'], default='auto',
+                            help='COPY (Postgres) or multi-row INSERTs for orders')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Accounts prefixed {prefix}_ exist already, pick another --prefix')
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'insert'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('--method copy needs PostgreSQL')
+
+        rng = random.Random(options['seed'])
+        end = options['end'] or timezone.localdate()
+        end = timezone.make_aware(datetime.datetime.combine(end, datetime.time.min))
+        started = time.monotonic()
+
+        sellers = self.create_users(f'{prefix}_seller', options['sellers'], options['password'])
+        buyers = self.create_users(f'{prefix}_buyer', options['buyers'], options['password'])
+        products = self.create_products(rng, sellers, options['products'], options['batch_size'])
+        seller_of = {product.pk: product.seller_id for product in products}
+        self.stdout.write(f'{len(sellers)} sellers, {len(buyers)} buyers, {len(products)} products '
+                          f'in {time.monotonic() - started:.1f}s')
+
+        rows = order_rows(
+            rng, options['orders'], [(p.pk, int(p.price)) for p in products],
+            [(user.pk, user.email) for user in buyers], end, options['days'], options['zipf'], f'{prefix}_',
+        )
+        write = self.copy_orders if method == 'copy' else self.insert_orders
+        totals = {product.pk: [0, 0] for product in products}
+        written = 0
+        orders_started = time.monotonic()
+        while batch := list(itertools.islice(rows, options['batch_size'])):
+            rollups = {}
+            for email, buyer_id, product_id, amount, paid, created_on, *_ in batch:
+                if paid:
+                    for counts in (
+                        totals[product_id],
+                        # created_on is already in the current time zone
+                        rollups.setdefault((seller_of[product_id], product_id, created_on.date()), [0, 0]),
+                    ):
+                        counts[0] += 1
+                        counts[1] += amount
+            with transaction.atomic():
+                write(batch)
+                # Keeps each upsert well under Postgres' 65535 bind parameters
+                rollups = [(*key, count, amount) for key, (count, amount) in rollups.items()]
+                for start in range(0, len(rollups), 5000):
+                    add_to_rollups(rollups[start:start + 5000])
+            written += len(batch)
+            elapsed = time.monotonic() - orders_started
+            self.stdout.write(f'{written}/{options["orders"]} orders ({written / elapsed:.0f} orders/s)')
+
+        update_from_values(Product, ['total_sales', 'total_sales_amount'], [
+            (product_id, count, amount) for product_id, (count, amount) in totals.items()
+        ])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Done. orders={written} via {method} in {elapsed:.1f}s'))
+
+    def create_users(self, name, count, password):
+        password = make_password(password)
+        User.objects.bulk_create(
+            (User(username=f'{name}_{i}', email=f'{name}_{i}@example.com', password=password) for i in range(count)),
+            batch_size=5000,
+        )
+        return list(User.objects.filter(username__startswith=f'{name}_').order_by('id').only('id', 'email'))
+
+    def create_products(self, rng, sellers, count, batch_size):
+        # A few prolific sellers, a long tail of small ones
+        cum_weights = zipf_cum_weights(len(sellers), 1.0)
+        words = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(5000)})
+        products = []
+        for _ in range(count):
+            title = ' '.join(rng.choices(words, k=2)).title()
+            products.append(Product(
+                seller=rng.choices(sellers, cum_weights=cum_weights)[0],
+                name=f'{title} {rng.choice(KINDS)}'[:100],
+                description=' '.join(rng.choices(words, k=8))[:100],
+                price=rng.choice(PRICES),
+            ))
+        # Primary keys come back from bulk_create on Postgres and SQLite
+        return Product.objects.bulk_create(products, batch_size=min(batch_size, 5000))
+
+    def columns(self):
+        qn = connection.ops.quote_name
+        return ', '.join(qn(OrderDetail._meta.get_field(name).column) for name in ORDER_COLUMNS)
+
+    def copy_orders(self, batch):
+        table = connection.ops.quote_name(OrderDetail._meta.db_table)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f'COPY {table} ({self.columns()}) FROM STDIN') as copy:
+                for row in batch:
+                    copy.write_row(row)
+
+    def insert_orders(self, batch):
+        # Plain INSERTs rather than bulk_create(), which would overwrite the
+        # generated created_on/updated_on with now() (auto_now_add)
+        table = connection.ops.quote_name(OrderDetail._meta.db_table)
+        adapt = connection.ops.adapt_datetimefield_value
+        placeholders = '(' + ', '.join(['%s'] * len(ORDER_COLUMNS)) + ')'
+        per_statement = max(1, 30_000 // len(ORDER_COLUMNS))
+        with connection.cursor() as cursor:
+            for start in range(0, len(batch), per_statement):
+                chunk = batch[start:start + per_statement]
+                params = []
+                for row in chunk:
+                    params.extend(row[:5])
+                    params.extend((adapt(row[5]), adapt(row[6])))
+                    params.extend(row[7:])
+                cursor.execute(
+                    f'INSERT INTO {table} ({self.columns()}) VALUES {", ".join([placeholders] * len(chunk))}',
+                    params,
+                )
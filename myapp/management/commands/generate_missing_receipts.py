@@ -1,25 +1,111 @@
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
 from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp.db import update_from_values
 from myapp.models import OrderDetail
-from myapp.views import generate_receipt
+from myapp.receipts import RECEIPT_FIELDS, missing_receipts, render_receipts, store_receipt
+
+
+def timing(samples):
+    if not samples:
+        return 'n/a'
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return (f'p50 {statistics.median(samples) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, '
+            f'max {samples[-1] * 1000:.1f} ms')
 
 
 class Command(BaseCommand):
     help = 'Generate receipts for paid orders missing receipt files'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='rendering processes')
+        parser.add_argument('--uploaders', type=int, default=8, help='concurrent storage uploads')
+        parser.add_argument('--chunk-size', type=int, default=500, help='orders fetched and recorded at a time')
+        parser.add_argument('--batch-size', type=int, default=25, help='receipts per rendering task')
+        parser.add_argument('--after', type=int, default=0,
+                            help='resume after this order id (orders with a receipt are always skipped)')
+
     def handle(self, *args, **options):
-        qs = OrderDetail.objects.filter(has_paid=True).filter(receipt__isnull=True)
-        total = qs.count()
+        orders = missing_receipts().filter(id__gt=options['after'])
+        total = orders.count()
         self.stdout.write(self.style.NOTICE(f'Found {total} paid orders without receipts'))
-        success = 0
-        failed = 0
-        for order in qs:
+        if not total:
+            return
+
+        self.render_times, self.upload_times = [], []
+        self.success = self.failed = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(options['workers'], initializer=django.setup) as renderers, \
+                ThreadPoolExecutor(options['uploaders']) as uploaders:
+            last_id = options['after']
+            uploads = []
+            workers_started = False
+            while True:
+                chunk = orders.filter(id__gt=last_id).order_by('id').values(*RECEIPT_FIELDS)
+                rows = list(chunk[:options['chunk_size']])
+                if not workers_started:
+                    # With fork the workers start on the first submit() and
+                    # would inherit the connection the query above opened
+                    connections.close_all()
+                    workers_started = True
+                # Rendering of this chunk starts before the previous chunk's
+                # uploads are waited on, so the pool never idles on the network
+                batches = [rows[i:i + options['batch_size']] for i in range(0, len(rows), options['batch_size'])]
+                renders = [
+                    ([row['id'] for row in batch], renderers.submit(render_receipts, batch)) for batch in batches
+                ]
+                if uploads:
+                    self.record(uploads)
+                    self.stdout.write(f'{self.success + self.failed}/{total} done, resume with --after {last_id}')
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                uploads = [(order_ids, uploaders.submit(self.upload, future)) for order_ids, future in renders]
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'render: {timing(self.render_times)}')
+        self.stdout.write(f'upload: {timing(self.upload_times)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. success={self.success} failed={self.failed} '
+            f'in {elapsed:.1f}s ({self.success / elapsed:.0f} receipts/s)'
+        ))
+
+    def upload(self, render):
+        """Wait for a rendered batch and upload it, runs in an uploader thread"""
+        stored = []
+        for order_id, pdf, render_seconds in render.result():
+            started = time.perf_counter()
             try:
-                self.stdout.write(f'Generating receipt for order {order.id}...')
-                generate_receipt(order)
-                success += 1
-                self.stdout.write(self.style.SUCCESS(f'OK: {order.id}'))
+                name = store_receipt(order_id, pdf)
             except Exception as e:
-                failed += 1
-                self.stderr.write(f'FAILED: {order.id} -> {e}')
+                stored.append((order_id, e, render_seconds, None))
+            else:
+                stored.append((order_id, name, render_seconds, time.perf_counter() - started))
+        return stored
 
-        self.stdout.write(self.style.SUCCESS(f'Done. success={success} failed={failed}'))
+    def record(self, uploads):
+        """Wait for a chunk's uploads and attach them to their orders in one statement"""
+        stored = []
+        for order_ids, future in uploads:
+            try:
+                results = future.result()
+            except Exception as e:
+                # The whole rendering batch failed
+                results = [(order_id, e, None, None) for order_id in order_ids]
+            for order_id, name, render_seconds, upload_seconds in results:
+                if isinstance(name, Exception):
+                    self.failed += 1
+                    self.stderr.write(f'FAILED: {order_id} -> {name}')
+                    continue
+                stored.append((order_id, name))
+                self.render_times.append(render_seconds)
+                self.upload_times.append(upload_seconds)
+        update_from_values(OrderDetail, ['receipt'], stored)
+        self.success += len(stored)
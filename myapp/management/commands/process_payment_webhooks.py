@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.webhooks import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Apply queued payment webhooks to orders, sales counters and rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', type=float, help='keep running, polling every N seconds when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            drained = self.drain(options['batch_size'])
+            if not options['loop']:
+                break
+            if not drained:
+                time.sleep(options['loop'])
+
+    def drain(self, batch_size):
+        started = time.monotonic()
+        total = paid = 0
+        while True:
+            batch_started = time.monotonic()
+            count, newly_paid, oldest = process_batch(batch_size)
+            if not count:
+                break
+            elapsed = time.monotonic() - batch_started
+            lag = (timezone.now() - oldest).total_seconds()
+            total += count
+            paid += newly_paid
+            self.stdout.write(
+                f'{count} events ({newly_paid} paid) in {elapsed * 1000:.0f} ms, '
+                f'{count / elapsed:.0f} events/s, lag {lag:.1f}s'
+            )
+
+        if total:
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Processed {total} events ({paid} orders paid), {total / elapsed:.0f} events/s'
+            ))
+        return total
@@ -0,0 +1,60 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+
+from myapp.images import pending_images, process_image
+
+logger = logging.getLogger('myapp.images')
+
+
+def try_process_image(product_id):
+    """process_image(), an error leaves the product pending for the next pass"""
+    try:
+        return process_image(product_id)
+    except Exception:
+        logger.exception('Product %s: image processing failed, will retry', product_id)
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Render and upload the image variants of products with a staged upload'
+
+    def add_arguments(self, parser):
+        # Pillow releases the GIL while decoding, resizing and encoding, and
+        # uploads wait on the network, so threads keep several cores busy
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', type=float, help='keep running, polling every N seconds when there is no work')
+
+    def handle(self, *args, **options):
+        with ExitStack() as stack:
+            # --workers 1 processes in this thread (and its database connection)
+            pool = stack.enter_context(ThreadPoolExecutor(options['workers'])) if options['workers'] > 1 else None
+            while True:
+                processed = self.drain(pool.map if pool else map, options['batch_size'])
+                if not options['loop']:
+                    break
+                if not processed:
+                    time.sleep(options['loop'])
+
+    def drain(self, run, batch_size):
+        started = time.monotonic()
+        last_id = total = 0
+        while True:
+            ids = list(pending_images().filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            batch_started = time.monotonic()
+            processed = sum(run(try_process_image, ids))
+            total += processed
+            elapsed = time.monotonic() - batch_started
+            self.stdout.write(f'{processed} images in {elapsed * 1000:.0f} ms ({processed / elapsed:.1f} images/s)')
+
+        if total:
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Processed {total} images, {total / elapsed:.1f} images/s'))
+        return total
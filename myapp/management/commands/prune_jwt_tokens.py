@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from myapp.tokens import new_generation
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired outstanding refresh tokens and their blacklist entries, in batches. '
+        'Unlike flushexpiredtokens, no single statement deletes the whole backlog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--loop', type=float, help='keep running, pruning every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.prune(options['batch_size'])
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def prune(self, batch_size):
+        # Tokens expire in the order they were issued, so walking the primary
+        # key finds the expired ones at the start of each remaining range
+        expired = OutstandingToken.objects.filter(expires_at__lte=aware_utcnow()).order_by('id').values_list('id', flat=True)
+
+        started = time.monotonic()
+        last_id = deleted = 0
+        while True:
+            ids = list(expired.filter(id__gt=last_id)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Cascades to the BlacklistedToken rows
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            last_id = ids[-1]
+            deleted += len(ids)
+            self.stdout.write(f'{deleted} expired tokens deleted (last id {last_id})')
+
+        if deleted:
+            # Every process rebuilds its blacklist filter without them
+            new_generation()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Done. tokens={deleted} in {elapsed:.1f}s'))
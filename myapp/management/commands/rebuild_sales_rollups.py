@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.models import Product
+from myapp.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill or rebuild the daily SalesRollup table from PAID orders, one seller at a time. '
+        'Each seller is corrected in one transaction, and payments confirmed while it runs are '
+        'counted once, so it is safe to run on a live site.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='sellers looked up per query')
+        parser.add_argument('--seller', type=int, help='only rebuild this seller id')
+
+    def handle(self, *args, **options):
+        sellers = Product.objects.order_by('seller_id').values_list('seller_id', flat=True).distinct()
+        if options['seller'] is not None:
+            sellers = sellers.filter(seller_id=options['seller'])
+
+        started = time.monotonic()
+        last_id = 0
+        rebuilt = corrected = 0
+        while True:
+            chunk = list(sellers.filter(seller_id__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            for seller_id in chunk:
+                corrected += rebuild_rollups(seller_id)
+            last_id = chunk[-1]
+            rebuilt += len(chunk)
+            self.stdout.write(f'{rebuilt} sellers rebuilt, {corrected} rollup rows corrected (last id {last_id})')
+
+        elapsed = time.monotonic() - started
+        rate = rebuilt / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. sellers={rebuilt} rows={corrected} in {elapsed:.1f}s ({rate:.0f} sellers/s)'
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The tsvector column is filled by a trigger so every write path (ORM save,
+# bulk_create, raw SQL) keeps it in sync. SQLite only gets the plain column,
+# search there is served by the in-process index in myapp/search.py.
+FORWARD_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION myapp_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER myapp_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON myapp_product
+    FOR EACH ROW EXECUTE FUNCTION myapp_product_search_vector_update();
+    """,
+    "UPDATE myapp_product SET name = name;",
+    "CREATE INDEX myapp_product_search_gin ON myapp_product USING gin (search_vector);",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS myapp_product_search_gin;",
+    "DROP TRIGGER IF EXISTS myapp_product_search_vector_trigger ON myapp_product;",
+    "DROP FUNCTION IF EXISTS myapp_product_search_vector_update();",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_remove_orderdetail_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(_run(FORWARD_SQL), _run(REVERSE_SQL)),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_salesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProductSalesShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('total_sales', models.IntegerField(default=0)),
+                ('total_sales_amount', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_shards', to='myapp.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'slot'), name='unique_product_sales_shard')],
+            },
+        ),
+    ]
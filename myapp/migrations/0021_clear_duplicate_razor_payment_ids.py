@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:52
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def clear_duplicate_payment_ids(apps, schema_editor):
+    # Blank ids and ids shared by several orders can't live under the unique
+    # constraint; the oldest order keeps a shared id
+    OrderDetail = apps.get_model('myapp', 'OrderDetail')
+    OrderDetail.objects.filter(razor_payment_id='').update(razor_payment_id=None)
+    duplicates = (
+        OrderDetail.objects.exclude(razor_payment_id=None)
+        .values('razor_payment_id')
+        .annotate(n=Count('id'), keep=Min('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        OrderDetail.objects.filter(razor_payment_id=row['razor_payment_id']).exclude(id=row['keep']).update(
+            razor_payment_id=None
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_product_sales_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_payment_ids, migrations.RunPython.noop),
+    ]
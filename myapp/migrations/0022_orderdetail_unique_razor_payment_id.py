@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0021_clear_duplicate_razor_payment_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderdetail',
+            name='razor_payment_id',
+            field=models.CharField(blank=True, max_length=200, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:00
+
+import myapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0023_paymentwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderdetail',
+            name='receipt',
+            field=models.FileField(blank=True, storage=myapp.models.receipt_storage, upload_to='receipts/'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0024_orderdetail_receipt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The composite index exists before the plain seller_id index is dropped
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', '-id'], name='product_seller_newest'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='seller',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(fields=['razor_order_id'], name='orderdetail_razor_order'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(condition=models.Q(('status', 'PAID')), fields=['customer_email', '-created_on'], name='orderdetail_paid_by_customer'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(condition=models.Q(('status', 'PAID')), fields=['product', 'created_on'], name='orderdetail_paid_by_product'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(condition=models.Q(('receipt', ''), ('status', 'PAID')), fields=['id'], name='orderdetail_missing_receipt'),
+        ),
+    ]
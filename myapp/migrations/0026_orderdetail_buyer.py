@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0025_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderdetail',
+            name='orderdetail_paid_by_customer',
+        ),
+        migrations.AddField(
+            model_name='orderdetail',
+            name='buyer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(fields=['buyer', 'status', '-id'], name='orderdetail_buyer_status'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:26
+
+import myapp.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0026_orderdetail_buyer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='staged_image',
+            field=models.FileField(blank=True, editable=False, storage=myapp.models.image_staging_storage, upload_to='products/'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('staged_image', ''), _negated=True), fields=['id'], name='product_image_pending'),
+        ),
+    ]
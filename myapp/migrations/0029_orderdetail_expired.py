@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0028_product_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(unique=True)),
+                ('customer_email', models.EmailField(max_length=254)),
+                ('buyer_id', models.BigIntegerField(blank=True, null=True)),
+                ('product_id', models.BigIntegerField()),
+                ('amount', models.IntegerField()),
+                ('created_on', models.DateTimeField()),
+                ('razor_order_id', models.CharField(max_length=200)),
+                ('archived_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='orderdetail',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PAID', 'Paid'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired')], default='PENDING', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='orderdetail',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['created_on'], name='orderdetail_pending_created'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# Index the words as they are ('simple' configuration: lowercased, no stemming,
+# no stopwords), like the in-process fallback index in myapp/search.py, so
+# both return the same products. The trigger from 0018 calls this function,
+# and the UPDATE rebuilds every stored vector.
+def _vector_function(config):
+    return f"""
+    CREATE OR REPLACE FUNCTION myapp_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{config}', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('{config}', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """
+
+
+def _run(config):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        schema_editor.execute(_vector_function(config))
+        schema_editor.execute("UPDATE myapp_product SET name = name;")
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0029_orderdetail_expired'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run('simple'), _run('english')),
+    ]
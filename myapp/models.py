@@ -1,31 +1,143 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
 from django.db import models
+from django.db.models import Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.utils.module_loading import import_string
 from cloudinary.models import CloudinaryField
 
+class ProductQuerySet(models.QuerySet):
+    def with_sales_totals(self):
+        """Annotate the sharded counter slots not yet compacted into the row"""
+        shards = ProductSalesShard.objects.filter(product=models.OuterRef('pk')).values('product')
+        return self.annotate(
+            pending_sales=Coalesce(Subquery(shards.annotate(n=Sum('total_sales')).values('n')), 0),
+            pending_sales_amount=Coalesce(Subquery(shards.annotate(n=Sum('total_sales_amount')).values('n')), 0),
+        )
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    def get_queryset(self):
+        # The search document is only ever read by Postgres itself
+        return super().get_queryset().defer('search_vector')
+
+
+def image_staging_storage():
+    return FileSystemStorage(location=settings.IMAGE_STAGING_ROOT)
+
+
+def image_variant_storage():
+    backend = settings.IMAGE_VARIANT_STORAGE
+    return import_string(backend["BACKEND"])(**backend.get("OPTIONS", {}))
+
+
 class Product(models.Model):
-    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Indexed by product_seller_newest (seller lookups use its leading column)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     name  = models.CharField(max_length=100)
     description  = models.CharField(max_length=100)
     price = models.FloatField()
     
     total_sales_amount = models.IntegerField(default=0)
     total_sales = models.IntegerField(default=0)
+    # 0 = sales counters are incremented in place on this row. N > 0 spreads a
+    # hot product's increments over N ProductSalesShard rows (see counters.py)
+    counter_shards = models.PositiveSmallIntegerField(default=0)
 
-    # Product images stored in Cloudinary
+    # Original image on Cloudinary, products created before image variants only
     image = CloudinaryField('image', blank=True, null=True, folder='products')
-    
+    # A new upload waits here (local disk) until process_product_images renders
+    # and uploads its variants, see images.py
+    staged_image = models.FileField(upload_to='products/', storage=image_staging_storage,
+                                    blank=True, editable=False)
+    # {variant: {'webp': url, 'jpeg': url, 'width': w, 'height': h}} for
+    # images.VARIANTS; read as-is by templates and the API
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Full-text search document (name + description), kept up to date by a
+    # Postgres trigger and backed by a GIN index, see migration 0018
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Last change to what the catalog shows (not the sales counters), the
+    # Last-Modified / ETag source of the catalog pages, see conditional.py
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductManager()
+
+    class Meta:
+        indexes = [
+            # Seller dashboard: keyset pages of one seller's products, newest first
+            models.Index(fields=['seller', '-id'], name='product_seller_newest'),
+            # Newest catalog change: MAX(updated_at) for conditional GETs
+            models.Index(fields=['updated_at'], name='product_updated'),
+            # process_product_images backlog
+            models.Index(fields=['id'], name='product_image_pending', condition=~models.Q(staged_image='')),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Forms and serializers assign a new upload to `image`; it is staged
+        # instead of uploaded inside the request, and the current image (if
+        # any) keeps showing until the variants are ready
+        if isinstance(self.image, UploadedFile):
+            self.staged_image = self.image
+            self.image = (
+                None if self._state.adding
+                else Product.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+            )
+        super().save(*args, **kwargs)
+
+    @property
+    def thumb_image(self):
+        return self.image_variants.get('thumb')
+
+    @property
+    def card_image(self):
+        return self.image_variants.get('card')
+
+    @property
+    def full_image(self):
+        return self.image_variants.get('full')
+
+
+class ProductSalesShard(models.Model):
+    """One counter slot of a hot product, folded back by compact_sales_counters"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_shards')
+    slot = models.PositiveSmallIntegerField()
+    total_sales = models.IntegerField(default=0)
+    total_sales_amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'slot'], name='unique_product_sales_shard'),
+        ]
+
+
+def receipt_storage():
+    backend = settings.RECEIPT_STORAGE
+    return import_string(backend["BACKEND"])(**backend.get("OPTIONS", {}))
+
 
 class OrderDetail(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
         ('PAID', 'Paid'),
         ('FAILED', 'Failed'),
+        # Abandoned checkout, set by expire_pending_orders. A late payment
+        # still confirms it (payments.py only skips PAID orders).
+        ('EXPIRED', 'Expired'),
     )
 
     customer_email = models.EmailField()
+    # Set at checkout for signed-in buyers; older orders are linked by email
+    # with backfill_order_buyers. Indexed by orderdetail_buyer_status.
+    buyer = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL,
+                              related_name='purchases', db_index=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     amount = models.IntegerField()
     has_paid = models.BooleanField(default=False)
@@ -33,4 +145,79 @@ class OrderDetail(models.Model):
     updated_on = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")  
     razor_order_id = models.CharField(max_length=200)
-    razor_payment_id = models.CharField(max_length=200, null=True, blank=True)
+    # Unique: a payment confirms at most one order, and repeat confirmations
+    # are answered from this index (see payments.py)
+    razor_payment_id = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    # Receipt PDF, written by generate_missing_receipts (see receipts.py)
+    receipt = models.FileField(upload_to='receipts/', storage=receipt_storage, blank=True)
+
+    class Meta:
+        # Each index backs a hot lookup; QueryPlanTests fails if one regresses
+        # to a sequential scan
+        indexes = [
+            # verify_payment / payment_handler / webhooks / mark_failed
+            models.Index(fields=['razor_order_id'], name='orderdetail_razor_order'),
+            # Purchases pages (keyset on -id) and the payment success fallback
+            models.Index(fields=['buyer', 'status', '-id'], name='orderdetail_buyer_status'),
+            # Seller sales (rebuild_sales_rollups and anything joining product__seller)
+            models.Index(fields=['product', 'created_on'], name='orderdetail_paid_by_product',
+                         condition=models.Q(status='PAID')),
+            # generate_missing_receipts backlog
+            models.Index(fields=['id'], name='orderdetail_missing_receipt',
+                         condition=models.Q(status='PAID', receipt='')),
+            # expire_pending_orders: stale checkouts, oldest first
+            models.Index(fields=['created_on'], name='orderdetail_pending_created',
+                         condition=models.Q(status='PENDING')),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """Expired checkout moved out of OrderDetail by expire_pending_orders --archive"""
+    # Plain ids rather than foreign keys: archived rows never block or follow
+    # deletes of the users and products they point at
+    order_id = models.BigIntegerField(unique=True)
+    customer_email = models.EmailField()
+    buyer_id = models.BigIntegerField(null=True, blank=True)
+    product_id = models.BigIntegerField()
+    amount = models.IntegerField()
+    created_on = models.DateTimeField()
+    razor_order_id = models.CharField(max_length=200)
+    archived_on = models.DateTimeField(auto_now_add=True)
+
+
+class SalesRollup(models.Model):
+    """PAID sales per seller, product and day, maintained by myapp/rollups.py"""
+    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+    amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'product', 'day'], name='unique_sales_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='salesrollup_seller_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.day}: {self.amount}'
+
+
+class PaymentWebhookEvent(models.Model):
+    """Raw gateway webhook, queued by payment_webhook and applied by process_payment_webhooks"""
+    event_id = models.CharField(max_length=100, unique=True)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # The worker only ever scans the unprocessed tail of the queue
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='webhook_event_pending'),
+        ]
+
+    def __str__(self):
+        return self.event_id
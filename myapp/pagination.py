@@ -0,0 +1,189 @@
+import base64
+from urllib.parse import urlencode
+
+from django.db import connection
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+# Keyset (cursor) pagination on the "-id" ordering.
+# Instead of COUNT(*) + OFFSET, each page asks for "id < last id seen",
+# which stays an index range scan no matter how deep the page is.
+
+def pack_cursor(*parts):
+    """Opaque url-safe token for a tuple of cursor values"""
+    raw = ':'.join(str(part) for part in parts).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def unpack_cursor(token):
+    """Inverse of pack_cursor, a list of strings (None for a garbled token)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return base64.urlsafe_b64decode(padded).decode().split(':')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_cursor(boundary_id, number):
+    """Opaque cursor token holding the boundary id and the page number"""
+    return pack_cursor(boundary_id, number)
+
+
+def decode_cursor(token):
+    """Returns (boundary_id, number) or None for a missing/garbled cursor"""
+    parts = unpack_cursor(token) if token else None
+    if not parts or len(parts) != 2:
+        return None
+    try:
+        boundary_id, number = int(parts[0]), max(int(parts[1]), 1)
+    except ValueError:
+        return None
+    # Ids are bigints, anything else was tampered with
+    if not 0 <= boundary_id < 2 ** 63:
+        return None
+    return boundary_id, number
+
+
+def approximate_count(model):
+    """Row estimate from the planner statistics (Postgres only, never a full COUNT)"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0) until the table has been vacuumed/analyzed
+    if not row or row[0] <= 0:
+        return None
+    return row[0]
+
+
+class KeysetPage:
+    """Page of results, template compatible with the bits of Django's Page we use"""
+
+    def __init__(self, object_list, number, per_page, next_cursor, previous_cursor, approx_count=None):
+        self.object_list = object_list
+        self.number = number
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approx_count = approx_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def approx_num_pages(self):
+        if not self.approx_count:
+            return None
+        return max(-(-self.approx_count // self.per_page), self.number)
+
+
+def keyset_paginate(queryset, after=None, before=None, per_page=3, approx_count=None):
+    """Slice `queryset` (ordered by -id) around an opaque after/before cursor"""
+    after = decode_cursor(after)
+    before = decode_cursor(before) if not after else None
+
+    if before:
+        boundary_id, number = before
+        number = max(number - 1, 1)
+        rows = list(queryset.filter(id__gt=boundary_id).order_by('id')[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        has_next = True
+    else:
+        boundary_id, number = after if after else (None, 0)
+        number += 1
+        if boundary_id is not None:
+            queryset = queryset.filter(id__lt=boundary_id)
+        rows = list(queryset.order_by('-id')[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    # An empty page reached through a stale cursor has nothing to anchor to
+    if not rows:
+        has_next = has_previous = False
+
+    next_cursor = encode_cursor(_pk(rows[-1]), number) if has_next else None
+    previous_cursor = encode_cursor(_pk(rows[0]), number) if has_previous else None
+    return KeysetPage(rows, number, per_page, next_cursor, previous_cursor, approx_count)
+
+
+def _pk(row):
+    return row['id'] if isinstance(row, dict) else row.id
+
+
+def page_query(request, **params):
+    """Current query string with the cursor params replaced"""
+    query = request.GET.copy()
+    for key in ('after', 'before'):
+        query.pop(key, None)
+    query.update({k: v for k, v in params.items() if v is not None})
+    return urlencode(sorted(query.items()))
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination using the same ?after=/?before= cursors as the HTML views"""
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            size = self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = keyset_paginate(
+            queryset,
+            after=request.query_params.get('after'),
+            before=request.query_params.get('before'),
+            per_page=self.get_page_size(request),
+        )
+        return list(self.page)
+
+    def _link(self, **params):
+        url = self.request.build_absolute_uri(self.request.path)
+        return f'{url}?{page_query(self.request, **params)}'
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return self._link(after=self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return self._link(before=self.page.previous_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
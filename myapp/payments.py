@@ -0,0 +1,117 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import counters
+from .db import update_from_values
+from .models import OrderDetail
+from .rollups import add_to_rollups, record_sale, sale_row
+from .sales_feed import publish_sales
+
+
+# Payment confirmation.
+# verify_payment (JSON), payment_handler (form POST) and gateway retries can
+# all confirm the same payment. razor_payment_id is unique, so a repeat is
+# answered by one index lookup, and the PENDING -> PAID transition is a
+# conditional UPDATE: only the caller that actually flips the row counts the
+# sale, however many confirmations race.
+#
+# Webhooks are applied in batches by confirm_payments(): the pending orders are
+# locked (SELECT ... FOR UPDATE), so a browser confirmation racing the batch
+# waits and then finds the order PAID. The whole batch costs one
+# UPDATE ... FROM (VALUES ...), one counter statement per product and one
+# rollup upsert.
+#
+# Either way the new sales are pushed to the sellers' live sales pages once
+# the transaction commits (sales_feed.py).
+
+def confirm_payment(razor_order_id, razor_payment_id):
+    """Mark the order PAID and count the sale exactly once.
+
+    Returns (order id, newly_paid), or (None, False) when no order matches.
+    """
+    # Repeat confirmation: one lookup on the unique index, nothing written
+    order_id = OrderDetail.objects.filter(razor_payment_id=razor_payment_id).values_list('id', flat=True).first()
+    if order_id is not None:
+        return order_id, False
+
+    try:
+        with transaction.atomic():
+            updated = (
+                OrderDetail.objects
+                .filter(razor_order_id=razor_order_id)
+                .exclude(status='PAID')
+                .update(status='PAID', has_paid=True, razor_payment_id=razor_payment_id, updated_on=timezone.now())
+            )
+            order = OrderDetail.objects.select_related('product').filter(razor_order_id=razor_order_id).first()
+            if order is None or not updated:
+                # Unknown order, or already paid by an earlier confirmation
+                return (order.id if order else None), False
+
+            counters.add_sale(order.product, int(order.amount))
+            record_sale(order)
+            publish_sales([order])
+    except IntegrityError:
+        # A concurrent confirmation stored this payment id first
+        order_id = OrderDetail.objects.filter(razor_payment_id=razor_payment_id).values_list('id', flat=True).first()
+        return order_id, False
+
+    return order.id, True
+
+
+def confirm_payments(payments):
+    """Bulk confirm_payment() for a {razor_order_id: razor_payment_id} dict.
+
+    Returns the number of orders that became PAID.
+    """
+    if not payments:
+        return 0
+
+    with transaction.atomic():
+        # Payment ids already stored were confirmed by an earlier callback
+        seen = set(
+            OrderDetail.objects
+            .filter(razor_payment_id__in=payments.values())
+            .values_list('razor_payment_id', flat=True)
+        )
+        pending = [order_id for order_id, payment_id in payments.items() if payment_id not in seen]
+        orders = {}
+        for order in (
+            OrderDetail.objects
+            .select_related('product')
+            .select_for_update(of=('self',))
+            .filter(razor_order_id__in=pending)
+            .exclude(status='PAID')
+            .order_by('id')
+        ):
+            orders.setdefault(order.razor_order_id, order)
+        if not orders:
+            return 0
+
+        now = timezone.now()
+        sales = {}
+        for order in orders.values():
+            order.status = 'PAID'
+            order.has_paid = True
+            order.razor_payment_id = payments[order.razor_order_id]
+            order.updated_on = now
+            product_sales = sales.setdefault(order.product_id, [order.product.counter_shards, 0, 0])
+            product_sales[1] += 1
+            product_sales[2] += int(order.amount)
+        update_from_values(
+            OrderDetail,
+            ['status', 'has_paid', 'razor_payment_id', 'updated_on'],
+            [(o.pk, o.status, o.has_paid, o.razor_payment_id, o.updated_on) for o in orders.values()],
+        )
+
+        for product_id, (shards, count, amount) in sales.items():
+            counters.increment_sales(product_id, amount, shards, count=count)
+        add_to_rollups(sale_row(order) for order in orders.values())
+        publish_sales(orders.values())
+    return len(orders)
+
+
+def mark_failed(*razor_order_ids):
+    """Failed payment, only ever downgrades a PENDING order"""
+    return OrderDetail.objects.filter(razor_order_id__in=razor_order_ids, status='PENDING').update(
+        status='FAILED', updated_on=timezone.now()
+    )
@@ -0,0 +1,130 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+# Per-endpoint query budgets.
+# QueryBudgetMiddleware counts and fingerprints every SQL statement a request
+# runs (parameters, literals and IN/VALUES lists collapsed, so the same query
+# for another row has the same fingerprint). A request over its URL's budget,
+# or one repeating a fingerprint N_PLUS_ONE_REPEATS times or more (a query per
+# row: N+1), is logged and gets an X-Query-Budget-Warning header. Enabled by
+# QUERY_BUDGET_WARNINGS (DEBUG by default); QueryBudgetTests requests every URL
+# in myapp/urls.py against seeded data and fails on any warning.
+
+# Most statements a request may run, by URL name (session and auth lookups,
+# savepoints and writes included). Every URL in myapp/urls.py needs an entry.
+BUDGETS = {
+    'index': 3,
+    'detail': 3,
+    'create_checkout_session': 4,
+    'create_checkout_session_async': 4,
+    'verify_payment': 8,
+    'payment_webhook': 1,
+    'success': 3,
+    'failed': 2,
+    'createproduct': 2,
+    'editproduct': 3,
+    'delete': 3,
+    'dashboard': 3,
+    'register': 2,
+    'login': 2,
+    'logout': 4,
+    'invalid': 2,
+    'purchases': 3,
+    'download_receipt': 3,
+    'download_receipt_url': 3,
+    'sales': 5,
+    'payment_handler': 8,
+    'api_register': 3,
+    'api_login': 3,
+    'api_token_refresh': 7,
+    'api_logout': 7,
+    'api_dashboard': 2,
+    'api_products': 1,
+    'api_product_search': 2,
+    'api_product_detail': 1,
+    'api_product_create': 5,
+    'api_product_edit': 6,
+    'api_product_delete': 10,
+    'api_products_bulk': 5,
+    'api_purchases': 2,
+    'api_sales': 5,
+}
+
+N_PLUS_ONE_REPEATS = 3
+
+_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_group = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_groups = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+
+
+def fingerprint(sql):
+    """`sql` with every value replaced by ? and value lists collapsed to (?)"""
+    sql = _literal.sub('?', sql.replace('%s', '?'))
+    sql = _groups.sub('(?)', _group.sub('(?)', sql))
+    return ' '.join(sql.split())
+
+
+class QueryLog:
+    """Context manager counting statement fingerprints on every database connection"""
+
+    def __init__(self):
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.fingerprints[fingerprint(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return sum(self.fingerprints.values())
+
+    def repeated(self, threshold=N_PLUS_ONE_REPEATS):
+        """[(fingerprint, times)] run `threshold` times or more, most repeated first"""
+        return [(sql, times) for sql, times in self.fingerprints.most_common() if times >= threshold]
+
+
+def budget_problems(url_name, log):
+    problems = []
+    budget = BUDGETS.get(url_name)
+    if budget is not None and log.count > budget:
+        problems.append(f'{log.count} queries, budget {budget}')
+    for sql, times in log.repeated():
+        problems.append(f'N+1: {times}x {sql[:200]}')
+    return problems
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_WARNINGS:
+            return self.get_response(request)
+
+        with QueryLog() as log:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        problems = budget_problems(match.url_name if match else None, log)
+        response['X-Query-Count'] = str(log.count)
+        if problems:
+            logger.warning('%s %s: %s', request.method, request.path, '; '.join(problems))
+            response['X-Query-Budget-Warning'] = '; '.join(problems)
+        return response
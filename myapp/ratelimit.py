@@ -0,0 +1,218 @@
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+
+# Token-bucket rate limiting.
+# Each (scope, client) bucket holds up to `burst` tokens and refills at
+# `rate`; a request takes one token, and a request that finds the bucket empty
+# gets 429 with Retry-After (seconds until a token is back). Scopes and their
+# limits are RATE_LIMITS in settings, keyed by client IP, user, or the user
+# when signed in and the IP otherwise.
+# With REDIS_URL the buckets are shared by every worker: one EVALSHA per check
+# runs TOKEN_BUCKET, which refills, takes and writes back atomically on Redis'
+# clock. Without Redis, or while it can't be reached, buckets are kept in this
+# process (so each worker allows the full rate).
+# Function views use @ratelimit(scope), DRF views a TokenBucketThrottle
+# subclass naming the scope.
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# KEYS[1] bucket hash; ARGV rate (tokens/s), burst. Returns the wait in
+# seconds as a string (Lua numbers are truncated to integers in replies).
+TOKEN_BUCKET = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+# Buckets kept in process at most (least recently used are dropped, which only
+# ever refills them)
+LOCAL_BUCKETS = 100_000
+
+
+def parse_rate(rate):
+    """'10/min' -> (tokens per second, 10)"""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period], int(count)
+
+
+def client_ip(request):
+    # RATE_LIMIT_PROXIES trusted proxies each append to X-Forwarded-For
+    proxies = settings.RATE_LIMIT_PROXIES
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request, key, user=None):
+    if user is None:
+        user = getattr(request, 'user', None)
+    signed_in = user is not None and user.is_authenticated
+    if key == 'user' or (key == 'user_or_ip' and signed_in):
+        return f'user:{user.pk}' if signed_in else 'user:anonymous'
+    return f'ip:{client_ip(request)}'
+
+
+class LocalBuckets:
+    def __init__(self, size=LOCAL_BUCKETS):
+        self.size = size
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.size:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+_local = LocalBuckets()
+_script = None
+_script_lock = threading.Lock()
+# After a Redis error, checks stay in process for a while instead of each one
+# waiting for the connection to time out
+REDIS_RETRY_SECONDS = 5
+_redis_down_until = 0.0
+
+
+def _redis_script():
+    global _script
+    if _script is None:
+        with _script_lock:
+            if _script is None:
+                import redis
+
+                client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+                    socket_connect_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+                )
+                _script = client.register_script(TOKEN_BUCKET)
+    return _script
+
+
+def take(scope, key):
+    """Take a token from the `scope` bucket of `key`, returns 0 or the seconds to wait"""
+    global _redis_down_until
+    limit = settings.RATE_LIMITS[scope]
+    rate, count = parse_rate(limit['rate'])
+    burst = limit.get('burst', count)
+    bucket = f'ratelimit:{scope}:{key}'
+    if settings.REDIS_URL and time.monotonic() >= _redis_down_until:
+        import redis
+
+        try:
+            return float(_redis_script()(keys=[bucket], args=[rate, burst]))
+        except redis.RedisError:
+            _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            logger.warning('Rate limit check on Redis failed, using in-process buckets', exc_info=True)
+    return _local.take(bucket, rate, burst)
+
+
+def check(scope, request):
+    """0 if `request` may go ahead in `scope`, else the seconds to wait"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    return take(scope, client_key(request, settings.RATE_LIMITS[scope].get('key', 'ip')))
+
+
+def too_many_requests(wait):
+    retry_after = max(1, math.ceil(wait))
+    response = JsonResponse({'error': f'Too many requests, retry in {retry_after} s'}, status=429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Rate limit a function view (sync or async) for the given methods"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods and settings.RATE_LIMIT_ENABLED:
+                    key = settings.RATE_LIMITS[scope].get('key', 'ip')
+                    # auser() caches the user for the view's own auser() call
+                    user = await request.auser() if key != 'ip' else None
+                    bucket = client_key(request, key, user)
+                    # A Redis round trip is blocking I/O, keep it off the event loop
+                    wait = (
+                        await sync_to_async(take, thread_sensitive=False)(scope, bucket)
+                        if settings.REDIS_URL else take(scope, bucket)
+                    )
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    wait = check(scope, request)
+                    if wait:
+                        return too_many_requests(wait)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle for the RATE_LIMITS scope named by `scope`"""
+    scope = None
+
+    def allow_request(self, request, view):
+        self.delay = check(self.scope, request)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class AuthThrottle(TokenBucketThrottle):
+    scope = 'auth'
+
+
+class CatalogThrottle(TokenBucketThrottle):
+    scope = 'catalog'
+
+
+def reset():
+    """Forget the in-process buckets (tests)"""
+    _local.clear()
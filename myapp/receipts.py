@@ -0,0 +1,181 @@
+import io
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from mysite.metrics import timed
+
+from .models import OrderDetail
+
+
+# Receipt PDFs.
+# Fonts are registered and the fixed part of the page (header band, labels,
+# rules, footer) is laid out once per process by ReceiptTemplate.
+# A receipt then only replays those drawing ops and writes the order's own
+# values on a fresh canvas, which keeps rendering cheap enough to spread over
+# a process pool (generate_missing_receipts).
+
+# OrderDetail.values() a receipt is rendered from; plain dicts pickle cheaply
+# to pool workers, which never touch the database
+RECEIPT_FIELDS = (
+    'id', 'customer_email', 'amount', 'created_on', 'razor_order_id', 'razor_payment_id',
+    'product__name', 'product__seller__username',
+)
+
+BRAND = colors.HexColor('#059669')
+MUTED = colors.HexColor('#6b7280')
+
+
+def register_fonts():
+    """(regular, bold) font names, registering RECEIPT_FONT / RECEIPT_BOLD_FONT when set"""
+    regular, bold = 'Helvetica', 'Helvetica-Bold'
+    if settings.RECEIPT_FONT:
+        pdfmetrics.registerFont(TTFont('Receipt', settings.RECEIPT_FONT))
+        regular = bold = 'Receipt'
+    if settings.RECEIPT_BOLD_FONT:
+        pdfmetrics.registerFont(TTFont('Receipt-Bold', settings.RECEIPT_BOLD_FONT))
+        bold = 'Receipt-Bold'
+    return regular, bold
+
+
+class ReceiptTemplate:
+    """Fonts and fixed layout of a receipt page, reused for every document"""
+    width, height = A4
+    margin = 0.75 * inch
+    value_x = margin + 1.6 * inch
+    rows_top = height - 2 * inch
+    row_height = 0.3 * inch
+    labels = ('Receipt no.', 'Date', 'Billed to', 'Sold by', 'Gateway order', 'Payment id')
+
+    def __init__(self):
+        self.font, self.bold = register_fonts()
+        self.table_top = self.rows_top - len(self.labels) * self.row_height - 0.4 * inch
+        self.static = self.layout()
+
+    def layout(self):
+        """Drawing ops shared by every receipt, as (canvas method, args)"""
+        w, h, m = self.width, self.height, self.margin
+        ops = [
+            ('setFillColor', (BRAND,)),
+            ('rect', (0, h - 1.2 * inch, w, 1.2 * inch, 0, 1)),
+            ('setFillColor', (colors.white,)),
+            ('setFont', (self.bold, 20)),
+            ('drawString', (m, h - 0.75 * inch, 'Digital Marketplace')),
+            ('drawRightString', (w - m, h - 0.75 * inch, 'RECEIPT')),
+            ('setFillColor', (MUTED,)),
+            ('setFont', (self.font, 10)),
+        ]
+        for i, label in enumerate(self.labels):
+            ops.append(('drawString', (m, self.rows_top - i * self.row_height, label)))
+
+        top = self.table_top
+        ops += [
+            ('setStrokeColor', (colors.lightgrey,)),
+            ('line', (m, top + 0.2 * inch, w - m, top + 0.2 * inch)),
+            ('line', (m, top - 0.1 * inch, w - m, top - 0.1 * inch)),
+            ('line', (m, top - 0.6 * inch, w - m, top - 0.6 * inch)),
+            ('setFont', (self.bold, 10)),
+            ('drawString', (m, top, 'Item')),
+            ('drawRightString', (w - m, top, 'Amount')),
+            ('drawString', (m, top - 0.9 * inch, 'Total paid')),
+            ('setFont', (self.font, 9)),
+            ('drawCentredString', (w / 2, m + 0.2 * inch, 'Thank you for your purchase.')),
+            ('drawCentredString', (w / 2, m, 'This is a computer-generated receipt and needs no signature.')),
+        ]
+        return ops
+
+    def fit(self, text, font, size, width):
+        """Truncate `text` with an ellipsis so it fits in `width` points"""
+        if pdfmetrics.stringWidth(text, font, size) <= width:
+            return text
+        while text and pdfmetrics.stringWidth(text + '...', font, size) > width:
+            text = text[:-1]
+        return text + '...'
+
+    def render(self, order):
+        """PDF bytes for one RECEIPT_FIELDS dict"""
+        buffer = io.BytesIO()
+        # Uncompressed page streams: ~3 KB instead of ~2 KB per receipt, but
+        # reportlab's pure-Python ASCII85 + zlib pass was a third of the render time
+        pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=0)
+        pdf.setTitle(f"Receipt {order['id']}")
+        for method, args in self.static:
+            getattr(pdf, method)(*args)
+
+        w, m = self.width, self.margin
+        created_on = timezone.localtime(order['created_on'])
+        values = (
+            str(order['id']),
+            created_on.strftime('%d %b %Y, %I:%M %p'),
+            order['customer_email'],
+            order['product__seller__username'],
+            order['razor_order_id'] or '-',
+            order['razor_payment_id'] or '-',
+        )
+        pdf.setFillColor(colors.black)
+        pdf.setFont(self.font, 10)
+        for i, value in enumerate(values):
+            pdf.drawString(self.value_x, self.rows_top - i * self.row_height,
+                           self.fit(value, self.font, 10, w - m - self.value_x))
+
+        amount = f"INR {order['amount']:,.2f}"
+        top = self.table_top
+        item = self.fit(order['product__name'], self.font, 10, w - 2 * m - 1.5 * inch)
+        pdf.drawString(m, top - 0.4 * inch, item)
+        pdf.drawRightString(w - m, top - 0.4 * inch, amount)
+        pdf.setFont(self.bold, 12)
+        pdf.drawRightString(w - m, top - 0.9 * inch, amount)
+
+        pdf.showPage()
+        pdf.save()
+        return buffer.getvalue()
+
+
+_template = None
+
+
+def get_template():
+    global _template
+    if _template is None:
+        _template = ReceiptTemplate()
+    return _template
+
+
+def render_receipt(order):
+    """(order id, PDF bytes, render seconds) for a RECEIPT_FIELDS dict"""
+    started = time.perf_counter()
+    pdf = get_template().render(order)
+    return order['id'], pdf, time.perf_counter() - started
+
+
+def render_receipts(orders):
+    """render_receipt() over a batch, one pool task per batch keeps IPC overhead down"""
+    return [render_receipt(order) for order in orders]
+
+
+def missing_receipts():
+    return OrderDetail.objects.filter(status='PAID', receipt='')
+
+
+def store_receipt(order_id, pdf):
+    """Upload a rendered receipt, returns the stored name (not yet saved on the order)"""
+    field = OrderDetail._meta.get_field('receipt')
+    with timed('storage'):
+        return field.storage.save(field.generate_filename(None, f'receipt_{order_id}.pdf'), ContentFile(pdf))
+
+
+def generate_receipt(order):
+    """Render, upload and attach the receipt of one PAID order"""
+    row = OrderDetail.objects.values(*RECEIPT_FIELDS).get(pk=order.pk)
+    _, pdf, _ = render_receipt(row)
+    order.receipt = store_receipt(order.pk, pdf)
+    OrderDetail.objects.filter(pk=order.pk).update(receipt=order.receipt.name)
+    return order.receipt
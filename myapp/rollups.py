@@ -0,0 +1,123 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .db import upsert_increments
+from .models import OrderDetail, SalesRollup
+
+
+# Daily sales rollups.
+# Every PAID order adds itself to one (seller, product, day) row with an atomic
+# upsert, so the sales pages aggregate over days x products instead of
+# rescanning every order.
+
+def sale_day(created_on):
+    return timezone.localdate(created_on)
+
+
+def add_to_rollups(rows):
+    """Upsert (seller_id, product_id, day, order_count, amount) increments"""
+    upsert_increments(SalesRollup, ['seller', 'product', 'day'], ['order_count', 'amount'], rows)
+
+
+def sale_row(order):
+    """Rollup increment for one PAID order (needs order.product loaded)"""
+    return (
+        order.product.seller_id,
+        order.product_id,
+        sale_day(order.created_on),
+        1,
+        int(order.amount),
+    )
+
+
+def record_sale(order):
+    """Add one order that just became PAID to its daily rollup"""
+    add_to_rollups([sale_row(order)])
+
+
+def rollup_rows(orders):
+    """Rollup increments for an iterable of OrderDetail.values() dicts"""
+    for order in orders:
+        yield (
+            order['product__seller_id'],
+            order['product_id'],
+            sale_day(order['created_on']),
+            1,
+            int(order['amount']),
+        )
+
+
+def seller_sales(seller):
+    """Everything the sales pages show, read from the rollups only"""
+    rollups = SalesRollup.objects.filter(seller=seller)
+    today = timezone.localdate()
+
+    totals = rollups.aggregate(
+        total=Sum('amount'),
+        yearly=Sum('amount', filter=Q(day__gte=today - datetime.timedelta(days=365))),
+        monthly=Sum('amount', filter=Q(day__gte=today - datetime.timedelta(days=30))),
+        weekly=Sum('amount', filter=Q(day__gte=today - datetime.timedelta(days=7))),
+    )
+
+    daily_sales_sums = [
+        {'created_on__date': row['day'], 'sum': row['sum']}
+        for row in rollups.values('day').order_by('day').annotate(sum=Sum('amount'))
+    ]
+
+    product_sales_sums = list(
+        rollups.values('product__name')
+        .order_by('product__name')
+        .annotate(sum=Sum('amount'))
+    )
+
+    return {
+        'total_sales': totals['total'],
+        'yearly_sales': totals['yearly'],
+        'monthly_sales': totals['monthly'],
+        'weekly_sales': totals['weekly'],
+        'daily_sales_sums': daily_sales_sums,
+        'product_sales_sums': product_sales_sums,
+    }
+
+
+def rebuild_rollups(seller_id):
+    """Bring one seller's rollups back in line with their PAID orders, returns the rows corrected
+
+    The totals from the orders and the current rollups are read in a single
+    statement (one snapshot), and only the difference is applied, as
+    increments, in one transaction. A payment confirmed meanwhile is either in
+    that snapshot on both sides or on neither, and its own increment lands
+    either way, so it is counted exactly once and the sales pages never see a
+    half rebuilt seller.
+    """
+    orders = (
+        OrderDetail.objects.filter(status='PAID', product__seller_id=seller_id)
+        .annotate(day=TruncDate('created_on'))
+        .values('product_id', 'day')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    rollups = (
+        SalesRollup.objects.filter(seller_id=seller_id)
+        .annotate(count=-F('order_count'), total=-F('amount'))
+        .values('product_id', 'day', 'count', 'total')
+    )
+    deltas = {}
+    for row in orders.union(rollups, all=True):
+        count, total = deltas.get((row['product_id'], row['day']), (0, 0))
+        deltas[row['product_id'], row['day']] = (count + row['count'], total + row['total'])
+    rows = [
+        (seller_id, product_id, day, count, total)
+        for (product_id, day), (count, total) in deltas.items()
+        if count or total
+    ]
+    if rows:
+        with transaction.atomic():
+            add_to_rollups(rows)
+            # Days and products left without a sale
+            SalesRollup.objects.filter(seller_id=seller_id, order_count=0, amount=0).delete()
+    return len(rows)
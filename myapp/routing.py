@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import SalesConsumer
+
+websocket_urlpatterns = [
+    path('ws/sales/', SalesConsumer.as_asgi(), name='sales_feed'),
+]
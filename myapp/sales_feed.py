@@ -0,0 +1,55 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .rollups import sale_day
+
+logger = logging.getLogger(__name__)
+
+
+# Live sales feed.
+# When payments are confirmed, each seller's open sales pages get the new sales
+# over a WebSocket (SalesConsumer), as increments the page adds to the totals
+# it rendered: nothing is re-aggregated and nothing polls. Events are sent
+# once the confirming transaction commits, one group message per seller.
+# The channel layer is in-memory (single process) unless REDIS_URL is set,
+# which process_payment_webhooks and multi-worker deployments need.
+# The feed is best effort: the payment is already committed when it is sent,
+# so a channel layer that is down is logged and never fails the confirmation
+# (the page shows the sale on its next load).
+
+def seller_group(seller_id):
+    return f'sales.seller.{seller_id}'
+
+
+def sale_event(order):
+    """What a sales page needs to count one PAID order (needs order.product loaded)"""
+    return {
+        'order': order.pk,
+        'product': order.product.name,
+        'amount': int(order.amount),
+        'day': sale_day(order.created_on).isoformat(),
+    }
+
+
+def publish_sales(orders):
+    """Push the sales of newly PAID orders to their sellers after commit"""
+    by_seller = {}
+    for order in orders:
+        by_seller.setdefault(order.product.seller_id, []).append(sale_event(order))
+    if by_seller:
+        transaction.on_commit(lambda: send(by_seller))
+
+
+def send(by_seller):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    group_send = async_to_sync(layer.group_send)
+    try:
+        for seller_id, sales in by_seller.items():
+            group_send(seller_group(seller_id), {'type': 'sales.event', 'sales': sales})
+    except Exception:
+        logger.exception('Live sales feed unavailable, %s sellers not notified', len(by_seller))
@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import Product
+from .pagination import pack_cursor, unpack_cursor
+
+
+# Product search.
+# On Postgres it runs against the tsvector column + GIN index (migration 0018).
+# Everywhere else (SQLite in dev and tests) the same queries are answered by an
+# in-process inverted index, built lazily and kept in sync from the signals.
+# Both rank name matches above description matches, treat every query word as
+# a prefix and AND the words together. A prefix matches every term it starts,
+# however many (like :* in a tsquery). Words are only lowercased, never
+# stemmed or dropped as stopwords (the 'simple' text search configuration,
+# migration 0030), so both return the same products.
+
+# The tsvector labels names A and descriptions B (migration 0018); SearchRank
+# is given these weights for them, and the in-process index scores with the
+# same ones. ts_rank also counts repeated words, so ties between products
+# with the same name hits may be broken differently.
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+# ts_rank weights in {D, C, B, A} order; D and C are unused, left at their defaults
+RANK_WEIGHTS = [0.1, 0.2, DESCRIPTION_WEIGHT, NAME_WEIGHT]
+
+# Postgres text search configuration of the tsvector trigger (migration 0030)
+SEARCH_CONFIG = 'simple'
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def encode_search_cursor(rank, product_id, number):
+    return pack_cursor(repr(float(rank)), product_id, number)
+
+
+def decode_search_cursor(token):
+    parts = unpack_cursor(token) if token else None
+    if not parts or len(parts) != 3:
+        return None
+    try:
+        return float(parts[0]), int(parts[1]), max(int(parts[2]), 1)
+    except ValueError:
+        return None
+
+
+class InvertedIndex:
+    """term -> product ids, split into name and description postings"""
+
+    def __init__(self):
+        self.name_postings = {}
+        self.description_postings = {}
+        self.vocabulary = []  # sorted, for prefix lookups
+        self.documents = {}   # id -> (name terms, description terms)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _add_term(self, postings, term, product_id):
+        ids = postings.get(term)
+        if ids is None:
+            ids = postings[term] = set()
+            i = bisect.bisect_left(self.vocabulary, term)
+            if i == len(self.vocabulary) or self.vocabulary[i] != term:
+                self.vocabulary.insert(i, term)
+        ids.add(product_id)
+
+    def _drop_term(self, postings, term, product_id):
+        ids = postings.get(term)
+        if ids is None:
+            return
+        ids.discard(product_id)
+        if not ids:
+            del postings[term]
+            if term not in self.name_postings and term not in self.description_postings:
+                i = bisect.bisect_left(self.vocabulary, term)
+                if i < len(self.vocabulary) and self.vocabulary[i] == term:
+                    del self.vocabulary[i]
+
+    def add(self, product_id, name, description):
+        with self.lock:
+            self.remove(product_id)
+            name_terms = frozenset(tokenize(name))
+            description_terms = frozenset(tokenize(description))
+            for term in name_terms:
+                self._add_term(self.name_postings, term, product_id)
+            for term in description_terms:
+                self._add_term(self.description_postings, term, product_id)
+            self.documents[product_id] = (name_terms, description_terms)
+
+    def remove(self, product_id):
+        with self.lock:
+            document = self.documents.pop(product_id, None)
+            if document is None:
+                return
+            name_terms, description_terms = document
+            for term in name_terms:
+                self._drop_term(self.name_postings, term, product_id)
+            for term in description_terms:
+                self._drop_term(self.description_postings, term, product_id)
+
+    def _expand(self, prefix):
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            terms.append(self.vocabulary[i])
+            i += 1
+        return terms
+
+    def _matches(self, prefix):
+        name_ids, description_ids = set(), set()
+        for term in self._expand(prefix):
+            name_ids.update(self.name_postings.get(term, ()))
+            description_ids.update(self.description_postings.get(term, ()))
+        return name_ids, description_ids
+
+    def search(self, query, limit, after=None):
+        """Top `limit` (rank, id) pairs, ordered like the Postgres query"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            matches = [self._matches(term) for term in terms]
+        candidates = None
+        for name_ids, description_ids in sorted(matches, key=lambda m: len(m[0]) + len(m[1])):
+            ids = name_ids | description_ids
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        results = []
+        for rank, ids in self._buckets(candidates, matches):
+            if after is not None:
+                if rank > after[0]:
+                    continue
+                if rank == after[0]:
+                    ids = [product_id for product_id in ids if product_id < after[1]]
+            results.extend((rank, product_id) for product_id in heapq.nlargest(limit - len(results), ids))
+            if len(results) >= limit:
+                break
+        return results
+
+    @staticmethod
+    def _buckets(candidates, matches):
+        """Candidates grouped by rank, best first.
+
+        The rank only depends on how many query words hit the name, so there are
+        at most len(words) + 1 distinct ranks and no per-document scoring loop.
+        """
+        words = len(matches)
+        if words == 1:
+            name_ids = candidates & matches[0][0]
+            groups = {1: name_ids, 0: candidates - name_ids}
+        else:
+            hits = Counter()
+            for name_ids, _ in matches:
+                hits.update(name_ids & candidates)
+            groups = defaultdict(set)
+            for product_id, count in hits.items():
+                groups[count].add(product_id)
+            groups[0] = candidates - hits.keys()
+        return [
+            (m * NAME_WEIGHT + (words - m) * DESCRIPTION_WEIGHT, groups.get(m, ()))
+            for m in range(words, -1, -1)
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = InvertedIndex()
+            rows = Product.objects.values_list('id', 'name', 'description')
+            for product_id, name, description in rows.iterator(chunk_size=2000):
+                index.add(product_id, name, description)
+            _index = index
+        return _index
+
+
+def reindex_products(product_ids):
+    """Refresh the in-process index for these products (no-op until it is built)"""
+    index = _index
+    if index is None:
+        return
+    rows = Product.objects.filter(id__in=product_ids).values_list('id', 'name', 'description')
+    found = set()
+    for product_id, name, description in rows:
+        index.add(product_id, name, description)
+        found.add(product_id)
+    for product_id in set(product_ids) - found:
+        index.remove(product_id)
+
+
+def _postgres_search(query, limit, after):
+    terms = tokenize(query)
+    if not terms:
+        return []
+    # Terms are plain alphanumeric tokens, so building a raw tsquery from them is safe
+    tsquery = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+    products = (
+        Product.objects
+        .filter(search_vector=tsquery)
+        .annotate(rank=SearchRank(F('search_vector'), tsquery, weights=RANK_WEIGHTS))
+        .order_by('-rank', '-id')
+    )
+    if after is not None:
+        rank, product_id = after
+        products = products.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=product_id))
+    return [(product.rank, product) for product in products[:limit]]
+
+
+def _memory_search(query, limit, after):
+    ranked = get_index().search(query, limit, after)
+    products = Product.objects.in_bulk([product_id for _, product_id in ranked])
+    return [(rank, products[product_id]) for rank, product_id in ranked if product_id in products]
+
+
+def search_products(query, after=None, per_page=20):
+    """Ranked, cursor paginated search -> ([(rank, product), ...], page number, next cursor)"""
+    cursor = decode_search_cursor(after)
+    boundary = cursor[:2] if cursor else None
+    number = cursor[2] + 1 if cursor else 1
+
+    search = _postgres_search if connection.vendor == 'postgresql' else _memory_search
+    results = search(query, per_page + 1, boundary)
+
+    next_cursor = None
+    if len(results) > per_page:
+        results = results[:per_page]
+        rank, product = results[-1]
+        next_cursor = encode_search_cursor(rank, product.id, number)
+    return results, number, next_cursor
@@ -1,3 +1,5 @@
+from operator import itemgetter
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Product, OrderDetail
@@ -18,9 +20,74 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'seller', 'total_sales', 'total_sales_amount']
+        fields = ['id', 'name', 'description', 'price', 'seller', 'total_sales', 'total_sales_amount', 'image_variants']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded counter slots not compacted yet (Product.objects.with_sales_totals())
+        data['total_sales'] += getattr(instance, 'pending_sales', 0)
+        data['total_sales_amount'] += getattr(instance, 'pending_sales_amount', 0)
+        return data
+
+# Read-only fast path for product lists (ProductListView, DashboardView).
+# Rows are read with .values() and turned into the same dicts ProductSerializer
+# produces by a mapping compiled once per field selection: no model instances
+# and no serializer field objects per row. ?fields=id,name,price trims the
+# SELECT list, down to no counter shard subqueries when no total is asked for.
+
+# Field: (columns read, value from the row dict), in ProductSerializer order
+PRODUCT_ROW_FIELDS = {
+    'id': (['id'], itemgetter('id')),
+    'name': (['name'], itemgetter('name')),
+    'description': (['description'], itemgetter('description')),
+    'price': (['price'], lambda row: float(row['price'])),
+    'seller': (['seller_id'], itemgetter('seller_id')),
+    'total_sales': (['total_sales', 'pending_sales'], lambda row: row['total_sales'] + row['pending_sales']),
+    'total_sales_amount': (
+        ['total_sales_amount', 'pending_sales_amount'],
+        lambda row: row['total_sales_amount'] + row['pending_sales_amount'],
+    ),
+    'image_variants': (['image_variants'], itemgetter('image_variants')),
+}
+# Annotations of Product.objects.with_sales_totals()
+_PENDING_COLUMNS = {'pending_sales', 'pending_sales_amount'}
+
+
+class ProductRows:
+    """ProductSerializer output for a product queryset, built from .values() rows"""
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = [name for name in fields if name not in PRODUCT_ROW_FIELDS]
+            if unknown:
+                raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        names = [name for name in PRODUCT_ROW_FIELDS if not fields or name in fields]
+        self.getters = [(name, PRODUCT_ROW_FIELDS[name][1]) for name in names]
+        # id is always read, pagination cursors are built from it
+        self.columns = list(dict.fromkeys(
+            ['id'] + [column for name in names for column in PRODUCT_ROW_FIELDS[name][0]]
+        ))
+
+    @classmethod
+    def from_request(cls, request):
+        fields = request.query_params.get('fields')
+        return cls([name.strip() for name in fields.split(',') if name.strip()] if fields else None)
+
+    def queryset(self, queryset, *extra):
+        """`queryset` (of Product.objects) as rows of the selected columns plus `extra`"""
+        if _PENDING_COLUMNS.intersection(self.columns):
+            queryset = queryset.with_sales_totals()
+        return queryset.values(*dict.fromkeys([*self.columns, *extra]))
+
+    def data(self, rows):
+        getters = self.getters
+        return [{name: get(row) for name, get in getters} for row in rows]
+
 
 class ProductWriteSerializer(serializers.ModelSerializer):
+    # Staged by Product.save, the variants follow from process_product_images
+    image = serializers.ImageField(required=False, write_only=True)
+
     class Meta:
         model = Product
         fields = ['name', 'description', 'price', 'image'] 
@@ -30,4 +97,4 @@ class OrderDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderDetail
-        fields = ['id', 'product', 'product_name', 'customer_email', 'amount', 'status', 'has_paid', 'created_on']
\ No newline at end of file
+        fields = ['id', 'product', 'product_name', 'customer_email', 'amount', 'status', 'has_paid', 'created_on', 'receipt']
\ No newline at end of file
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+
+
+# Session engines (SESSION_ENGINE = 'myapp.sessions.<db|cached_db|cache>',
+# picked by SESSION_STORE in settings).
+# Same stores as django.contrib.sessions.backends, with write coalescing:
+# Django saves a session whenever something marked it modified, even when
+# the data ends up as it was loaded (a key set to the value it had, a popped
+# key that wasn't there...). These compare the serialized data with what was
+# loaded and skip the write when nothing changed.
+# With SESSION_SAVE_EVERY_REQUEST (sliding expiry), an unchanged session is
+# written at most once per SESSION_REFRESH_INTERVAL instead of on every
+# request; the stored expiry then trails the cookie by up to that interval.
+
+REFRESHED_KEY = '_session_refreshed'
+
+
+class CoalescingMixin:
+    # Serialized data as last loaded or saved, None for a new session
+    _stored = None
+
+    def _serialized(self, data):
+        return self.serializer().dumps(data)
+
+    def _loaded(self, data):
+        self._stored = self._serialized(data) if self.session_key else None
+        return data
+
+    def _unchanged(self, must_create):
+        if must_create or self._stored is None or self.session_key is None:
+            return False
+        data = self._get_session()
+        if self._serialized(data) != self._stored:
+            return False
+        # A sliding expiry still has to be pushed back now and then
+        return not (
+            settings.SESSION_SAVE_EVERY_REQUEST
+            and time.time() - data.get(REFRESHED_KEY, 0) >= settings.SESSION_REFRESH_INTERVAL
+        )
+
+    def _stamp(self, must_create):
+        if settings.SESSION_SAVE_EVERY_REQUEST:
+            self._get_session(no_load=must_create)[REFRESHED_KEY] = int(time.time())
+
+    def _saved(self, must_create):
+        self._stored = self._serialized(self._get_session(no_load=must_create))
+
+    def load(self):
+        return self._loaded(super().load())
+
+    async def aload(self):
+        return self._loaded(await super().aload())
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        self._stamp(must_create)
+        super().save(must_create)
+        self._saved(must_create)
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        self._stamp(must_create)
+        await super().asave(must_create)
+        self._saved(must_create)
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import cache
+
+from . import CoalescingMixin
+
+
+class SessionStore(CoalescingMixin, cache.SessionStore):
+    pass
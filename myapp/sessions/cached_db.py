@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import cached_db
+
+from . import CoalescingMixin
+
+
+class SessionStore(CoalescingMixin, cached_db.SessionStore):
+    pass
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import db
+
+from . import CoalescingMixin
+
+
+class SessionStore(CoalescingMixin, db.SessionStore):
+    pass
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache, search
+from .models import Product
+
+
+_batch = ContextVar('product_changes_batch', default=None)
+
+
+def products_changed(product_ids):
+    """Single hook for everything derived from the product catalog"""
+    batch = _batch.get()
+    if batch is not None:
+        batch.update(product_ids)
+        return
+    product_ids = list(product_ids)
+
+    def apply():
+        catalog_cache.invalidate(product_ids)
+        search.reindex_products(product_ids)
+
+    # Wait for the commit, otherwise a concurrent reader could cache the old row
+    # under the new version
+    transaction.on_commit(apply)
+
+
+@contextmanager
+def batched_changes():
+    """Collect the products_changed() calls (signals included) made inside the
+    block and apply them together once, when it exits without an error"""
+    if _batch.get() is not None:
+        yield
+        return
+    product_ids = set()
+    token = _batch.set(product_ids)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    if product_ids:
+        products_changed(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    products_changed([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    products_changed([instance.pk])
@@ -1,3 +1,1725 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import razorpay
+import requests
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from benchmarks.fake_gateway import serve
+from mysite.metrics import Histogram
+
+from . import catalog_cache, gateway, images, ratelimit, rollups, search, tokens, webhooks
+from .checks import cached_template_loader
+from .consumers import SalesConsumer
+from .counters import compact_product, increment_sales, sales_totals
+from .management.commands.generate_dataset import order_rows
+from .models import ArchivedOrder, OrderDetail, PaymentWebhookEvent, Product, ProductSalesShard, SalesRollup
+from .pagination import KeysetPagination, encode_cursor, keyset_paginate
+from .payments import confirm_payment, confirm_payments, mark_failed
+from .query_budget import BUDGETS, QueryLog, fingerprint
+from .receipts import RECEIPT_FIELDS, missing_receipts, render_receipt
+from .rollups import add_to_rollups, rollup_rows, seller_sales
+from .serializers import ProductSerializer
+from .sessions import cache as cache_sessions, db as db_sessions
+from .urls import urlpatterns
+from .webhooks import process_batch
+
+SECRET = 'test-secret'
+
+
+def sign(order_id, payment_id):
+    """Signature the gateway would send for this order/payment pair"""
+    message = f'{order_id}|{payment_id}'.encode()
+    return hmac.new(SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(client, order_id, payment_id):
+    return client.post('/verify-payment/', json.dumps({
+        'razorpay_order_id': order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': sign(order_id, payment_id),
+    }), content_type='application/json')
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET)
+class SalesCounterTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+
+    def test_increment_only_touches_counters(self):
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        increment_sales(self.product.pk, 100)  # self.product still has the old name
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Renamed')
+        self.assertEqual((self.product.total_sales, self.product.total_sales_amount), (1, 100))
+
+    def test_sharded_counters_are_summed_on_read_and_compacted(self):
+        for _ in range(20):
+            increment_sales(self.product.pk, 100, shards=4)
+        self.assertEqual(sales_totals(self.product.pk), (20, 2000))
+        self.assertLessEqual(ProductSalesShard.objects.filter(product=self.product).count(), 4)
+
+        self.assertEqual(compact_product(self.product.pk), (20, 2000))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.total_sales, self.product.total_sales_amount), (20, 2000))
+        self.assertEqual(sales_totals(self.product.pk), (20, 2000))
+
+    def test_verify_payment_counts_the_sale(self):
+        OrderDetail.objects.create(customer_email='buyer@example.com', product=self.product,
+                                   amount=100, razor_order_id='order_1')
+        response = verify(Client(), 'order_1', 'pay_1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sales_totals(self.product.pk), (1, 100))
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET)
+class PaymentConfirmationTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+        self.order = OrderDetail.objects.create(customer_email='buyer@example.com', product=self.product,
+                                                amount=100, razor_order_id='order_1')
+
+    def test_repeat_confirmations_count_once(self):
+        client = Client()
+        for _ in range(3):
+            self.assertEqual(verify(client, 'order_1', 'pay_1').status_code, 200)
+            response = client.post('/payment-handler/', {
+                'razorpay_order_id': 'order_1',
+                'razorpay_payment_id': 'pay_1',
+                'razorpay_signature': sign('order_1', 'pay_1'),
+            })
+            self.assertRedirects(response, f'/payment-success/?order_id={self.order.id}', fetch_redirect_response=False)
+
+        self.assertEqual(sales_totals(self.product.pk), (1, 100))
+        self.assertEqual(SalesRollup.objects.get().order_count, 1)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.razor_payment_id), ('PAID', 'pay_1'))
+
+    def test_repeat_confirmation_is_one_lookup(self):
+        self.assertEqual(confirm_payment('order_1', 'pay_1'), (self.order.id, True))
+        with self.assertNumQueries(1):
+            self.assertEqual(confirm_payment('order_1', 'pay_1'), (self.order.id, False))
+
+    def test_bad_signature_does_not_downgrade_a_paid_order(self):
+        confirm_payment('order_1', 'pay_1')
+        response = Client().post('/verify-payment/', json.dumps({
+            'razorpay_order_id': 'order_1',
+            'razorpay_payment_id': 'pay_2',
+            'razorpay_signature': 'forged',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PAID')
+
+
+def webhook(client, event, order_id, payment_id, event_id=None, secret=SECRET):
+    body = json.dumps({
+        'entity': 'event',
+        'event': event,
+        'payload': {'payment': {'entity': {'id': payment_id, 'order_id': order_id}}},
+    })
+    headers = {'X-Razorpay-Signature': hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()}
+    if event_id:
+        headers['X-Razorpay-Event-Id'] = event_id
+    return client.post('/webhooks/payments/', body, content_type='application/json', headers=headers)
+
+
+class SalesFeedTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+        for i in range(3):
+            OrderDetail.objects.create(customer_email='buyer@example.com', product=self.product,
+                                       amount=100, razor_order_id=f'order_{i}')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(SalesConsumer.as_asgi(), '/ws/sales/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def confirm(self, confirm, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm(*args)
+
+    async def test_confirmed_sales_are_pushed_to_the_seller(self):
+        seller, other = await self.connect(self.seller), await self.connect(self.other)
+
+        await sync_to_async(self.confirm)(confirm_payment, 'order_0', 'pay_0')
+        [sale] = (await seller.receive_json_from())['sales']
+        self.assertEqual(sale['product'], 'Ebook')
+        self.assertEqual(sale['amount'], 100)
+        self.assertEqual(sale['day'], timezone.localdate().isoformat())
+
+        # A webhook batch is one message per seller; repeats push nothing
+        await sync_to_async(self.confirm)(confirm_payments, {'order_1': 'pay_1', 'order_2': 'pay_2', 'order_0': 'pay_0'})
+        self.assertEqual(len((await seller.receive_json_from())['sales']), 2)
+        self.assertTrue(await seller.receive_nothing())
+        self.assertTrue(await other.receive_nothing())
+        await seller.disconnect()
+        await other.disconnect()
+
+    def test_feed_outage_does_not_fail_the_payment(self):
+        layer = mock.Mock(group_send=mock.AsyncMock(side_effect=ConnectionError('redis is down')))
+        with mock.patch('myapp.sales_feed.get_channel_layer', return_value=layer), \
+                self.assertLogs('myapp.sales_feed', 'ERROR'):
+            self.confirm(confirm_payment, 'order_0', 'pay_0')
+            self.confirm(confirm_payments, {'order_1': 'pay_1'})
+        self.assertEqual(layer.group_send.call_count, 2)
+        self.assertEqual(OrderDetail.objects.filter(status='PAID').count(), 2)
+        self.assertEqual(sales_totals(self.product.pk), (2, 200))
+
+    async def test_anonymous_socket_is_refused(self):
+        communicator = WebsocketCommunicator(SalesConsumer.as_asgi(), '/ws/sales/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET, RAZOR_WEBHOOK_SECRET=SECRET)
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+        self.hot = Product.objects.create(seller=self.seller, name='Course', description='A course', price=50,
+                                          counter_shards=4)
+        for i, product in enumerate([self.product] * 3 + [self.hot] * 3):
+            OrderDetail.objects.create(customer_email='buyer@example.com', product=product,
+                                       amount=product.price, razor_order_id=f'order_{i}')
+
+    def test_endpoint_only_queues_verified_events(self):
+        client = Client()
+        self.assertEqual(webhook(client, 'payment.captured', 'order_0', 'pay_0', 'evt_0').status_code, 200)
+        self.assertEqual(webhook(client, 'payment.captured', 'order_0', 'pay_0', 'evt_0').status_code, 200)
+        self.assertEqual(webhook(client, 'payment.captured', 'order_1', 'pay_1', secret='forged').status_code, 400)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+        self.assertEqual(OrderDetail.objects.get(razor_order_id='order_0').status, 'PENDING')
+
+    def test_batch_applies_events_once(self):
+        client = Client()
+        confirm_payment('order_0', 'pay_0')  # browser callback got there first
+        for i in range(6):
+            webhook(client, 'payment.captured', f'order_{i}', f'pay_{i}', f'evt_{i}')
+        webhook(client, 'order.paid', 'order_3', 'pay_3', 'evt_order_3')
+        webhook(client, 'payment.failed', 'order_5', 'pay_5_failed', 'evt_failed_5')
+
+        self.assertEqual(process_batch(), (8, 5, PaymentWebhookEvent.objects.order_by('id')[0].received_at))
+        self.assertEqual(process_batch(), (0, 0, None))
+        self.assertFalse(OrderDetail.objects.exclude(status='PAID').exists())
+        self.assertEqual(sales_totals(self.product.pk), (3, 300))
+        self.assertEqual(sales_totals(self.hot.pk), (3, 150))
+        self.assertEqual(SalesRollup.objects.get(product=self.hot).order_count, 3)
+
+    def test_poison_event_does_not_block_the_queue(self):
+        client = Client()
+        for i in range(4):
+            webhook(client, 'payment.captured', f'order_{i}', f'pay_{i}', f'evt_{i}')
+        confirm = webhooks.confirm_payments
+
+        def poisoned(payments):
+            if 'order_2' in payments:
+                raise ValueError('bad amount')
+            return confirm(payments)
+
+        with mock.patch.object(webhooks, 'confirm_payments', poisoned), self.assertLogs('myapp.webhooks', 'ERROR'):
+            self.assertEqual(process_batch()[:2], (4, 3))
+        self.assertEqual(process_batch(), (0, 0, None))
+        statuses = dict(OrderDetail.objects.values_list('razor_order_id', 'status'))
+        self.assertEqual([statuses[f'order_{i}'] for i in range(4)], ['PAID', 'PAID', 'PENDING', 'PAID'])
+        poison = PaymentWebhookEvent.objects.get(event_id='evt_2')
+        self.assertIsNotNone(poison.processed_at)
+        self.assertEqual(poison.error, 'ValueError: bad amount')
+        self.assertFalse(PaymentWebhookEvent.objects.exclude(event_id='evt_2').exclude(error='').exists())
+        self.assertEqual((sales_totals(self.product.pk), sales_totals(self.hot.pk)), ((2, 200), (1, 50)))
+
+    def test_failed_event_marks_pending_order(self):
+        webhook(Client(), 'payment.failed', 'order_0', 'pay_0', 'evt_0')
+        call_command('process_payment_webhooks', stdout=io.StringIO())
+        self.assertEqual(OrderDetail.objects.get(razor_order_id='order_0').status, 'FAILED')
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+
+class ReceiptTests(TestCase):
+    def setUp(self):
+        field = OrderDetail._meta.get_field('receipt')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(setattr, field, 'storage', field.storage)
+        field.storage = FileSystemStorage(media.name)
+
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        product = Product.objects.create(seller=seller, name='Ebook ' * 40, description='An ebook', price=100)
+        for i in range(5):
+            OrderDetail.objects.create(customer_email='buyer@example.com', product=product, amount=100,
+                                       razor_order_id=f'order_{i}', razor_payment_id=f'pay_{i}',
+                                       status='PAID' if i < 4 else 'PENDING')
+
+    def test_render(self):
+        order = OrderDetail.objects.values(*RECEIPT_FIELDS).first()
+        order_id, pdf, seconds = render_receipt(order)
+        self.assertEqual(order_id, order['id'])
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_command_renders_missing_receipts_and_resumes(self):
+        out = io.StringIO()
+        call_command('generate_missing_receipts', workers=2, chunk_size=3, stdout=out)
+        self.assertIn('success=4 failed=0', out.getvalue())
+        self.assertFalse(OrderDetail.objects.filter(status='PAID', receipt='').exists())
+        self.assertFalse(OrderDetail.objects.get(status='PENDING').receipt)
+
+        call_command('generate_missing_receipts', stdout=out)
+        self.assertIn('Found 0 paid orders', out.getvalue())
+
+        self.client.force_login(self.buyer)
+        order = OrderDetail.objects.filter(status='PAID').first()
+        response = self.client.get(f'/receipt/{order.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_only_the_buyer_downloads(self):
+        OrderDetail.receipt.field.storage.save('receipts/r.pdf', io.BytesIO(b'%PDF-1.4'))
+        OrderDetail.objects.filter(razor_order_id__in=['order_0', 'order_1']).update(receipt='receipts/r.pdf')
+        OrderDetail.objects.filter(razor_order_id='order_0').update(buyer=self.buyer)
+        linked, legacy = OrderDetail.objects.filter(razor_order_id__in=['order_0', 'order_1']).order_by('id')
+        # Anyone can put the buyer's address on their own account
+        impostor = User.objects.create_user('impostor', 'buyer@example.com', 'pw')
+
+        for user, order, allowed in [
+            (self.buyer, linked, True), (impostor, linked, False),
+            (self.buyer, legacy, True), (impostor, legacy, True),  # no buyer: only the email to go by
+        ]:
+            self.client.force_login(user)
+            self.assertEqual(self.client.get(f'/receipt/{order.id}/').status_code, 200 if allowed else 404)
+            self.assertEqual(self.client.get(f'/receipt/{order.id}/url/').status_code, 200 if allowed else 403)
+
+
+def image_upload(name='cover.png', size=(2000, 1000), mode='RGBA'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@mock.patch('cloudinary.uploader.upload', side_effect=AssertionError('no Cloudinary upload in a request'))
+class ProductImageTests(TestCase):
+    def setUp(self):
+        field = Product._meta.get_field('staged_image')
+        staging, variants = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.addCleanup(variants.cleanup)
+        self.addCleanup(setattr, field, 'storage', field.storage)
+        field.storage = FileSystemStorage(staging.name)
+        self.variants = FileSystemStorage(variants.name, base_url='/media/')
+        patcher = mock.patch.object(images, '_storage', self.variants)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.client.force_login(self.seller)
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_product_images', workers=1, stdout=io.StringIO())
+
+    def test_upload_is_staged_then_processed(self, upload):
+        response = self.client.post('/createproduct/', {
+            'name': 'Ebook', 'description': 'An ebook', 'price': 100, 'image': image_upload(),
+        })
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+        product = Product.objects.get()
+        self.assertTrue(product.staged_image)
+        self.assertFalse(product.image)
+        self.assertEqual(product.image_variants, {})
+        staged = product.staged_image.name
+
+        self.process()
+        product.refresh_from_db()
+        self.assertFalse(product.staged_image)
+        self.assertFalse(product.staged_image.storage.exists(staged))
+        self.assertEqual(
+            {name: (v['width'], v['height']) for name, v in product.image_variants.items()},
+            {'full': (1600, 800), 'card': (640, 320), 'thumb': (160, 80)},
+        )
+        with Image.open(self.variants.path(product.card_image['webp'].removeprefix('/media/'))) as card:
+            self.assertEqual((card.format, card.size), ('WEBP', (640, 320)))
+        self.assertContains(self.client.get('/'), product.card_image['webp'])
+
+        # An edit without a new file keeps the image
+        response = self.client.post(f'/editproduct/{product.pk}/', {'name': 'Ebook 2', 'description': 'x', 'price': 5})
+        self.assertEqual(response.status_code, 302)
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['card']['width'], 640)
+        upload.assert_not_called()
+
+    def test_api_upload_and_unreadable_image(self, upload):
+        api = APIClient()
+        api.force_authenticate(self.seller)
+        response = api.post('/api/products/create/', {
+            'name': 'Course', 'description': 'A course', 'price': 50, 'image': image_upload('c.png', (100, 50), 'RGB'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        product = Product.objects.get()
+        self.assertTrue(product.staged_image)
+        Product.objects.create(seller=self.seller, name='Broken', description='x', price=1,
+                               staged_image=SimpleUploadedFile('broken.png', b'not an image'))
+
+        with self.assertLogs('myapp.images', 'ERROR'):
+            self.process()
+        self.assertFalse(images.pending_images().exists())
+        variants = dict(Product.objects.values_list('name', 'image_variants'))
+        # Never upscaled
+        self.assertEqual(variants['Course']['full'], {**variants['Course']['full'], 'width': 100, 'height': 50})
+        self.assertEqual(variants['Broken'], {})
+
+    def test_storage_and_missing_file_errors_are_retried(self, upload):
+        product = Product.objects.create(seller=self.seller, name='Ebook', description='x', price=1,
+                                         staged_image=image_upload('e.png', (100, 50), 'RGB'))
+        staged = product.staged_image.name
+        with mock.patch.object(self.variants, 'save', side_effect=OSError('storage is down')), \
+                self.assertLogs('myapp.images', 'ERROR') as logs:
+            self.process()
+        self.assertIn('will retry', logs.output[0])
+        product.refresh_from_db()
+        self.assertEqual((product.staged_image.name, product.image_variants), (staged, {}))
+        self.assertTrue(product.staged_image.storage.exists(staged))
+
+        # A worker that can't see the staging directory
+        with mock.patch.object(type(product.staged_image.storage), 'open', side_effect=FileNotFoundError(staged)), \
+                self.assertLogs('myapp.images', 'ERROR'):
+            self.process()
+        product.refresh_from_db()
+        self.assertEqual(product.staged_image.name, staged)
+
+        self.process()
+        product.refresh_from_db()
+        self.assertFalse(product.staged_image)
+        self.assertEqual(product.image_variants['thumb']['width'], 100)
+
+    def test_local_variant_directory_holds_nothing_private(self, upload):
+        options = settings.IMAGE_VARIANT_STORAGE.get('OPTIONS', {})
+        if 'location' not in options:
+            self.skipTest('variants are on Cloudinary')
+        # mysite/urls.py serves this whole directory in DEBUG, without any access check
+        served = Path(options['location'])
+        for private in (settings.RECEIPT_STORAGE['OPTIONS']['location'], settings.IMAGE_STAGING_ROOT):
+            self.assertFalse(Path(private).is_relative_to(served), private)
+
+    def test_replaced_upload_is_not_overwritten(self, upload):
+        product = Product.objects.create(seller=self.seller, name='Ebook', description='x', price=1,
+                                         staged_image=image_upload('old.png', (100, 50), 'RGB'))
+        render = images.render_variants
+
+        def replace_then_render(file):
+            # A new upload lands while the old one is being rendered
+            Product.objects.filter(pk=product.pk).update(staged_image='products/new.png')
+            return render(file)
+
+        with mock.patch.object(images, 'render_variants', replace_then_render):
+            self.assertFalse(images.process_image(product.pk))
+        product.refresh_from_db()
+        self.assertEqual((product.staged_image.name, product.image_variants), ('products/new.png', {}))
+        self.assertEqual(self.variants.listdir(f'products/{product.pk}')[1], [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+            Product.objects.create(seller=self.seller, name='Course', description='A course', price=50)
+
+    def edit(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(self.product, name, value)
+            self.product.save()
+
+    def test_api_revalidation_costs_no_query(self):
+        api = APIClient()
+        for path in (f'/api/products/{self.product.pk}/', '/api/products/'):
+            response = api.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('s-maxage=', response['Cache-Control'])
+            self.assertTrue(response['Last-Modified'])
+            etag = response['ETag']
+
+            with self.assertNumQueries(0):
+                response = api.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response['ETag'], response.content), (304, etag, b''))
+
+            self.edit(price=self.product.price + 1)
+            response = api.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_are_private_per_user(self):
+        path = f'/product/{self.product.pk}/'
+        anonymous = self.client.get(path)
+        self.assertIn('private', anonymous['Cache-Control'])
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_MODIFIED_SINCE=anonymous['Last-Modified']).status_code, 304
+        )
+
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code, 200)
+
+        index = self.client.get('/')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=index['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.exclude(pk=self.product.pk).delete()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=index['ETag']).status_code, 200)
+
+
+def csrf_token(response):
+    return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class HtmlRevalidationTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = Product.objects.create(seller=self.seller, name='Ebook', description='An ebook', price=100)
+        self.client = Client(enforce_csrf_checks=True)
+
+    def login(self):
+        token = csrf_token(self.client.get('/login/'))
+        response = self.client.post('/login/', {'username': 'seller', 'password': 'pw', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_login_again_gets_a_fresh_csrf_token(self):
+        for path in ('/', f'/product/{self.product.pk}/'):
+            self.login()
+            before = self.client.get(path)
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=before['ETag']).status_code, 304)
+            self.client.post('/logout/', {'csrfmiddlewaretoken': csrf_token(before)})
+            self.login()  # rotates the CSRF secret
+
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=before['ETag'])
+            self.assertEqual(response.status_code, 200)
+            response = self.client.post('/logout/', {'csrfmiddlewaretoken': csrf_token(response)})
+            self.assertEqual(response.status_code, 302)
+
+    def test_pending_messages_are_rendered(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_login(other)
+        self.client.get('/')  # sets the CSRF cookie
+        index = self.client.get('/')
+        self.assertRedirects(self.client.get(f'/delete/{self.product.pk}/'), '/', fetch_redirect_response=False)
+        self.assertContains(self.client.get('/', HTTP_IF_NONE_MATCH=index['ETag']), 'not allowed to delete')
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=index['ETag']).status_code, 304)
+
+
+class CatalogCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(seller=seller, name='Ebook', description='An ebook', price=100)
+            self.other = Product.objects.create(seller=seller, name='Course', description='A course', price=50)
+        self.product_id = self.product.pk  # delete() clears it
+
+    def versions(self):
+        return catalog_cache.catalog_version(), catalog_cache.product_version(self.product_id)
+
+    def test_edit_and_delete_move_versions_on_commit(self):
+        for change in (lambda: self.product.save(update_fields=['name']), self.product.delete):
+            before = self.versions()
+            with self.captureOnCommitCallbacks() as callbacks:
+                change()
+                self.assertEqual(self.versions(), before)
+            self.assertEqual(self.versions(), before)  # nothing committed yet
+            for callback in callbacks:
+                callback()
+            catalog, product = self.versions()
+            self.assertNotEqual(catalog, before[0])
+            self.assertNotEqual(product, before[1])
+
+    def test_rollback_changes_nothing(self):
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError), transaction.atomic():
+                self.product.save()
+                self.other.delete()
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.versions(), before)
+
+    def test_stale_entry_is_never_served(self):
+        api = APIClient()
+        for path in (f'/api/products/{self.product.pk}/', '/api/products/'):
+            self.assertContains(api.get(path), '"Ebook"')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+            # A request before the commit still sees the old row, and caches
+            # it under the version that is about to be dropped
+            for path in (f'/api/products/{self.product.pk}/', '/api/products/'):
+                self.assertContains(api.get(path), '"Ebook"')
+        for path in (f'/api/products/{self.product.pk}/', '/api/products/'):
+            response = api.get(path)
+            self.assertContains(response, '"Renamed"')
+            self.assertNotContains(response, '"Ebook"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(api.get(f'/api/products/{self.product_id}/').status_code, 404)
+        self.assertNotContains(api.get('/api/products/'), '"Renamed"')
+
+
+class BulkProductTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.foreign = Product.objects.create(seller=other, name='Theirs', description='x', price=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.seller)
+
+    def send(self, method, items):
+        with mock.patch('myapp.catalog_cache.invalidate') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.api, method)('/api/products/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(invalidate.call_count, 1)  # once per batch
+        return [result['status'] for result in response.json()['results']], set(invalidate.call_args.args[0])
+
+    def test_create_update_delete(self):
+        statuses, changed = self.send('post', [
+            {'name': f'Ebook {i}', 'description': 'An ebook', 'price': 10 + i} for i in range(50)
+        ] + [{'name': 'No price'}])
+        self.assertEqual(statuses, [201] * 50 + [400])
+        mine = list(Product.objects.filter(seller=self.seller).order_by('id').values_list('id', flat=True))
+        self.assertEqual((len(mine), changed), (50, set(mine)))
+
+        statuses, changed = self.send('patch', [
+            {'id': mine[0], 'price': 99},
+            {'id': mine[1], 'name': 'Renamed'},
+            {'id': mine[1], 'price': 1},
+            {'id': mine[2], 'price': 'free'},
+            {'id': self.foreign.pk, 'price': 0},
+            {'id': 10 ** 9, 'price': 0},
+            {'price': 0},
+        ])
+        self.assertEqual(statuses, [200, 200, 400, 400, 403, 404, 400])
+        self.assertEqual(changed, {mine[0], mine[1]})
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=mine[:2]).order_by('id').values_list('name', 'price')),
+            [('Ebook 0', 99), ('Renamed', 11)],
+        )
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.price, 1)
+
+        statuses, changed = self.send('delete', mine[:40] + [self.foreign.pk])
+        self.assertEqual(statuses, [200] * 40 + [403])
+        self.assertEqual(changed, set(mine[:40]))
+        self.assertEqual(Product.objects.filter(seller=self.seller).count(), 10)
+
+    def test_rejects_oversized_or_malformed_batches(self):
+        for items in ([], {'name': 'x'}, [{'id': 1}] * 5001):
+            with self.subTest(items=str(items)[:20]):
+                self.assertEqual(self.api.post('/api/products/bulk/', items, format='json').status_code, 400)
+
+
+class ProductRowsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.products = Product.objects.bulk_create(
+            Product(seller=self.seller, name=f'Ebook {i}', description='An ebook', price=99.5 + i,
+                    total_sales=i, total_sales_amount=100 * i, counter_shards=2 if i % 2 else 0,
+                    image_variants={'thumb': {'webp': f'/media/{i}.webp', 'width': 160, 'height': 90}} if i % 3 else {})
+            for i in range(6)
+        )
+        for product in self.products[1::2]:
+            increment_sales(product.pk, 250, shards=2)
+        self.api = APIClient()
+        self.api.force_authenticate(self.seller)
+
+    def test_same_json_as_product_serializer(self):
+        expected = ProductSerializer(Product.objects.with_sales_totals().order_by('-id'), many=True).data
+        for path in ('/api/products/', '/api/dashboard/'):
+            with self.subTest(path):
+                self.assertEqual(self.api.get(path).content, JSONRenderer().render(
+                    {'next': None, 'previous': None, 'results': expected}
+                ))
+
+    def test_fields_trim_the_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/dashboard/?fields=id,name,price&page_size=2')
+        self.assertEqual(response.json()['results'], [
+            {'id': p.pk, 'name': p.name, 'price': p.price} for p in self.products[:-3:-1]
+        ])
+        [select] = [q['sql'] for q in queries.captured_queries if 'FROM "myapp_product"' in q['sql']]
+        self.assertNotIn('description', select)
+        self.assertNotIn('myapp_productsalesshard', select)
+
+        after = self.api.get(response.json()['next'])
+        self.assertEqual([row['id'] for row in after.json()['results']], [p.pk for p in self.products[-3:-5:-1]])
+        self.assertEqual(self.api.get('/api/products/?fields=id,secret').status_code, 400)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        ratelimit.reset()
+        self.addCleanup(ratelimit.reset)
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+
+    @override_settings(RATE_LIMITS={'checkout': {'rate': '1/hour', 'burst': 2, 'key': 'user_or_ip'}})
+    def test_checkout_bucket_per_user_or_ip(self):
+        def checkout(client, **extra):
+            return client.post('/create-checkout-session/999999/', '{}', content_type='application/json', **extra)
+
+        anonymous = Client()
+        self.assertEqual([checkout(anonymous).status_code for _ in range(3)], [404, 404, 429])
+        response = checkout(anonymous)
+        self.assertGreater(int(response['Retry-After']), 1700)
+        # One bucket for the scope, whichever endpoint
+        self.assertEqual(anonymous.post('/create-checkout-session-async/999999/', '{}',
+                                        content_type='application/json').status_code, 429)
+        self.assertEqual(checkout(anonymous, REMOTE_ADDR='10.0.0.2').status_code, 404)
+
+        signed_in = Client()
+        signed_in.force_login(self.buyer)
+        self.assertEqual([checkout(signed_in).status_code for _ in range(3)], [404, 404, 429])
+
+    @override_settings(RATE_LIMITS={'auth': {'rate': '1/min', 'key': 'ip'}}, RATE_LIMIT_PROXIES=1)
+    def test_drf_throttle_and_forwarded_ip(self):
+        def login(ip):
+            return APIClient().post('/api/auth/login/', {'username': 'buyer', 'password': 'pw'},
+                                    # The first address is the client's own claim, only the proxy's counts
+                                    HTTP_X_FORWARDED_FOR=f'198.51.100.7, {ip}')
+
+        self.assertEqual(login('203.0.113.1').status_code, 200)
+        response = login('203.0.113.1')
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '60'))
+        self.assertEqual(login('203.0.113.2').status_code, 200)
+
+    def test_buckets_refill(self):
+        buckets = ratelimit.LocalBuckets(size=2)
+        with mock.patch('time.monotonic', return_value=100.0) as clock:
+            self.assertEqual([buckets.take('a', 0.5, 2) for _ in range(3)], [0, 0, 2.0])
+            clock.return_value = 101.0
+            self.assertEqual(buckets.take('a', 0.5, 2), 1.0)
+            clock.return_value = 104.0
+            self.assertEqual(buckets.take('a', 0.5, 2), 0)
+            buckets.take('b', 1, 1), buckets.take('c', 1, 1)
+        self.assertEqual(list(buckets.buckets), ['b', 'c'])
+
+    def test_check_is_cheap(self):
+        request = mock.Mock(META={'REMOTE_ADDR': '127.0.0.1'}, user=AnonymousUser())
+        started = time.perf_counter()
+        for _ in range(1000):
+            ratelimit.check('catalog', request)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+    @override_settings(RATE_LIMITS={'auth': {'rate': '1/min', 'burst': 2}})
+    def test_redis_buckets(self):
+        if not os.environ.get('REDIS_URL'):
+            self.skipTest('needs REDIS_URL')
+        with override_settings(REDIS_URL=os.environ['REDIS_URL']):
+            key = f'test-{time.time_ns()}'
+            self.assertEqual([ratelimit.take('auth', key) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(ratelimit.take('auth', key), 60, delta=1)
+
+
+@override_settings(JWT_BLACKLIST_FILTER=True)
+class JwtBlacklistTests(TestCase):
+    def setUp(self):
+        tokens.blacklist_filter.reset()
+        self.addCleanup(tokens.blacklist_filter.reset)
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+
+    def refresh(self, token):
+        return APIClient().post('/api/auth/refresh/', {'refresh': str(token)})
+
+    def test_rotation_blacklists_old_token(self):
+        token = tokens.RefreshToken.for_user(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+        rotated = response.json()['refresh']
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.refresh(rotated).status_code, 200)
+        # A live token never reaches the blacklist table
+        self.assertFalse([q for q in queries.captured_queries
+                          if 'SELECT' in q['sql'] and 'blacklistedtoken' in q['sql']])
+
+    def test_blacklisted_elsewhere(self):
+        token = tokens.RefreshToken.for_user(self.buyer)
+        cache = tokens.get_cache()
+        cache.set(tokens.VERSION_KEY, 1)
+        self.assertFalse(tokens.blacklist_filter.might_contain(token['jti']))
+        # Another process blacklists it: row committed, then published
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        with mock.patch.object(tokens, 'blacklist_filter', tokens.BlacklistFilter()):
+            tokens.publish(token['jti'])
+        self.assertEqual(cache.get(tokens.VERSION_KEY), 2)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+        # An entry gone from the cache means a rebuild from the database
+        tokens.blacklist_filter.bloom = tokens.BloomFilter(16, 0.001)
+        cache.incr(tokens.VERSION_KEY)
+        self.assertTrue(tokens.blacklist_filter.might_contain(token['jti']))
+
+    def test_bloom_filter(self):
+        bloom = tokens.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'in-{i}')
+        self.assertTrue(all(f'in-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'out-{i}' in bloom for i in range(10_000))
+        self.assertLess(false_positives, 300)
+
+    def test_prune_expired_tokens(self):
+        live = tokens.RefreshToken.for_user(self.buyer)
+        expired = []
+        for _ in range(5):
+            token = tokens.RefreshToken.for_user(self.buyer)
+            token.blacklist()
+            expired.append(token['jti'])
+        OutstandingToken.objects.filter(jti__in=expired).update(expires_at=timezone.now() - datetime.timedelta(days=1))
+        generation = tokens.get_cache().get(tokens.GENERATION_KEY, 0)
+
+        out = io.StringIO()
+        call_command('prune_jwt_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('tokens=5', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertFalse(BlacklistedToken.objects.exists())
+        self.assertEqual(tokens.get_cache().get(tokens.GENERATION_KEY), generation + 1)
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+
+    def session_queries(self, client, path):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(path).status_code, 200)
+        return [q['sql'].split()[0] for q in queries.captured_queries if 'django_session' in q['sql']]
+
+    def test_unchanged_session_not_saved(self):
+        session = db_sessions.SessionStore()
+        session['cart'] = [1, 2]
+        session.save()
+
+        session = db_sessions.SessionStore(session.session_key)
+        with self.assertNumQueries(1):  # the load
+            session['cart'] = [1, 2]
+            session.pop('missing', None)
+            session.save()
+        with self.assertNumQueries(3):  # UPDATE in a savepoint
+            session['cart'] = [1]
+            session.save()
+        self.assertEqual(db_sessions.SessionStore(session.session_key)['cart'], [1])
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True, SESSION_REFRESH_INTERVAL=3600)
+    def test_sliding_expiry_written_once_per_interval(self):
+        client = Client()
+        client.force_login(self.seller)
+        with mock.patch('time.time', return_value=time.time() + 60):
+            self.assertEqual(self.session_queries(client, '/dashboard/'), ['SELECT'])
+        with mock.patch('time.time', return_value=time.time() + 3700):
+            self.assertEqual(self.session_queries(client, '/dashboard/'), ['SELECT', 'UPDATE'])
+
+    def test_signed_in_pages_skip_the_database(self):
+        for engine, expected in (('db', ['SELECT']), ('cached_db', []), ('cache', [])):
+            with self.subTest(engine), override_settings(SESSION_ENGINE=f'myapp.sessions.{engine}'):
+                cache.clear()
+                client = Client()
+                client.force_login(self.seller)
+                for path in ('/dashboard/', '/sales/', '/purchases/', '/createproduct/'):
+                    self.assertEqual(self.session_queries(client, path), expected, path)
+                # Flash messages don't touch the session either
+                product = Product.objects.create(name='Ebook', description='d', price=10, seller=self.seller)
+                with CaptureQueriesContext(connection) as queries:
+                    client.post(f'/delete/{product.pk}/')
+                self.assertFalse([q for q in queries.captured_queries
+                                  if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')])
+
+    @override_settings(REDIS_URL='redis://sessions', SESSION_ENGINE='myapp.sessions.cache')
+    def test_copy_sessions_to_cache(self):
+        client = Client()
+        with override_settings(SESSION_ENGINE='myapp.sessions.db'):
+            client.force_login(self.seller)
+            expired = db_sessions.SessionStore()
+            expired['cart'] = [1]
+            expired.set_expiry(-10)
+            expired.save()
+        cache.clear()
+        session_key = client.cookies['sessionid'].value
+        self.assertEqual(cache_sessions.SessionStore(session_key).load(), {})
+
+        out = io.StringIO()
+        call_command('copy_sessions_to_cache', '--chunk-size', '1', stdout=out)
+        self.assertIn('sessions=1', out.getvalue())
+        self.assertEqual(cache_sessions.SessionStore(session_key).load()['_auth_user_id'], str(self.seller.pk))
+        self.assertEqual(self.session_queries(client, '/dashboard/'), [])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.reset_stats()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.products = [
+            Product.objects.create(name=f'Ebook {i}', description='A guide', price=10 + i, seller=self.seller)
+            for i in range(3)
+        ]
+
+    def test_cards_cached_per_product_version(self):
+        first = Client().get('/').content.decode()
+        self.assertEqual(catalog_cache.stats(), {'hits': 0, 'misses': 3})
+        self.assertEqual(Client().get('/').content.decode(), first)
+        self.assertEqual(catalog_cache.stats(), {'hits': 3, 'misses': 3})
+        self.assertIn(f'href="/product/{self.products[0].pk}/"', first)
+
+        product = self.products[0]
+        product.name = 'Renamed ebook'
+        product.save()
+        catalog_cache.reset_stats()
+        page = Client().get('/').content.decode()
+        self.assertIn('Renamed ebook', page)
+        self.assertNotIn('Ebook 0', page)
+        self.assertEqual(catalog_cache.stats(), {'hits': 2, 'misses': 1})
+
+    def test_search_and_dashboard_cards(self):
+        self.assertContains(Client().get('/?q=ebook'), 'href="/product/', count=3)
+        client = Client()
+        client.force_login(self.seller)
+        response = client.get('/dashboard/')
+        self.assertContains(response, 'href="/editproduct/', count=3)
+        self.assertContains(response, 'Ebook 2')
+
+    def test_cached_loader_check(self):
+        self.assertEqual(cached_template_loader(None), [])
+        uncached = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {'loaders': ['django.template.loaders.app_directories.Loader']},
+        }]
+        with override_settings(TEMPLATES=uncached):
+            self.assertEqual([error.id for error in cached_template_loader(None)], ['myapp.W001'])
+            with override_settings(DEBUG=True):
+                self.assertEqual(cached_template_loader(None), [])
+
+
+class ExpirePendingOrdersTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = Product.objects.create(name='Ebook', description='A guide', price=100, seller=seller)
+        for i, status in enumerate(['PENDING'] * 5 + ['PAID', 'FAILED', 'PENDING']):
+            OrderDetail.objects.create(customer_email='buyer@example.com', product=self.product, amount=100,
+                                       status=status, razor_order_id=f'order_{i}')
+        # All but the last order are two days old
+        OrderDetail.objects.exclude(razor_order_id='order_7').update(
+            created_on=timezone.now() - datetime.timedelta(days=2))
+
+    def statuses(self):
+        return dict(OrderDetail.objects.values_list('razor_order_id', 'status'))
+
+    def test_expire(self):
+        out = io.StringIO()
+        call_command('expire_pending_orders', '--batch-size', '2', stdout=out)
+        self.assertIn('orders=5', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(self.statuses(), {
+            **{f'order_{i}': 'EXPIRED' for i in range(5)},
+            'order_5': 'PAID', 'order_6': 'FAILED', 'order_7': 'PENDING',
+        })
+
+        # A payment that arrives late still counts
+        self.assertEqual(confirm_payment('order_0', 'pay_late')[1], True)
+        self.assertEqual(self.statuses()['order_0'], 'PAID')
+
+    def test_archive(self):
+        call_command('expire_pending_orders', '--archive', '--ttl', str(3600), stdout=io.StringIO())
+        self.assertEqual(sorted(self.statuses()), ['order_5', 'order_6', 'order_7'])
+        archived = ArchivedOrder.objects.order_by('order_id')
+        self.assertEqual([order.razor_order_id for order in archived], [f'order_{i}' for i in range(5)])
+        self.assertEqual((archived[0].product_id, archived[0].amount), (self.product.pk, 100))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.ids = [
+            Product.objects.create(seller=seller, name=f'Ebook {i}', description='x', price=10).pk
+            for i in range(7)
+        ][::-1]
+
+    def page(self, **cursor):
+        page = keyset_paginate(Product.objects.all(), per_page=3, **cursor)
+        return [product.pk for product in page], page.number, page.has_previous(), page.has_next()
+
+    def test_after_and_before_across_pages(self):
+        first = keyset_paginate(Product.objects.all(), per_page=3)
+        self.assertEqual(self.page(), (self.ids[:3], 1, False, True))
+        second = keyset_paginate(Product.objects.all(), after=first.next_cursor, per_page=3)
+        self.assertEqual(self.page(after=first.next_cursor), (self.ids[3:6], 2, True, True))
+        last = keyset_paginate(Product.objects.all(), after=second.next_cursor, per_page=3)
+        self.assertEqual(self.page(after=second.next_cursor), (self.ids[6:], 3, True, False))
+        self.assertIsNone(last.next_cursor)
+
+        # And back
+        back = keyset_paginate(Product.objects.all(), before=last.previous_cursor, per_page=3)
+        self.assertEqual(self.page(before=last.previous_cursor), (self.ids[3:6], 2, True, True))
+        self.assertEqual(self.page(before=back.previous_cursor), (self.ids[:3], 1, False, True))
+
+    def test_empty_pages(self):
+        page = keyset_paginate(Product.objects.none())
+        self.assertEqual((list(page), page.number, page.has_other_pages()), ([], 1, False))
+        # A cursor past the last row, e.g. after the rows were deleted
+        self.assertEqual(self.page(after=encode_cursor(min(self.ids), 3)), ([], 4, False, False))
+
+    def test_garbled_cursors_give_the_first_page(self):
+        for token in ['garbage', '!!', 'é', encode_cursor('x', 2), encode_cursor(5, 'x'),
+                      encode_cursor(10 ** 30, 2), encode_cursor(-(10 ** 30), 2), encode_cursor(1, 2) + ':3']:
+            self.assertEqual(self.page(after=token), (self.ids[:3], 1, False, True), token)
+            self.assertEqual(self.page(before=token), (self.ids[:3], 1, False, True), token)
+            response = Client().get('/api/products/', {'after': token})
+            self.assertEqual(response.status_code, 200, token)
+            self.assertEqual(len(response.json()['results']), 7)
+
+    def test_page_size_is_clamped(self):
+        for page_size, expected in [('0', 1), ('-5', 1), ('2', 2), ('1000', 100), ('ten', 20), ('', 20)]:
+            request = Request(APIRequestFactory().get('/api/products/', {'page_size': page_size}))
+            self.assertEqual(KeysetPagination().get_page_size(request), expected, page_size)
+
+    def test_next_and_previous_links(self):
+        response = Client().get('/api/products/', {'page_size': 3, 'fields': 'id'})
+        data = response.json()
+        self.assertIsNone(data['previous'])
+        self.assertEqual([row['id'] for row in data['results']], self.ids[:3])
+        self.assertTrue(data['next'].startswith('http://testserver/api/products/?after='))
+        self.assertIn('page_size=3', data['next'])
+
+        data = Client().get(data['next']).json()
+        self.assertEqual([row['id'] for row in data['results']], self.ids[3:6])
+        self.assertIn('before=', data['previous'])
+        self.assertNotIn('after=', data['previous'])
+
+        data = Client().get(data['previous']).json()
+        self.assertEqual([row['id'] for row in data['results']], self.ids[:3])
+        self.assertIsNone(data['previous'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        # A fresh in-process index, built from this test's products
+        patcher = mock.patch.object(search, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.cookbook, self.basics, self.garden = [
+            Product.objects.create(seller=seller, name=name, description=description, price=10)
+            for name, description in [
+                ('Python Cookbook', 'Recipes'),
+                ('Cooking basics', 'Learn it with Python'),
+                ('Gardening', 'Python snakes and how to cook for them'),
+            ]
+        ]
+
+    def ranked(self, query, **options):
+        results, number, next_cursor = search.search_products(query, **options)
+        return [(rank, product.name) for rank, product in results], number, next_cursor
+
+    def test_name_hits_rank_first(self):
+        self.assertEqual(self.ranked('python')[0], [
+            (search.NAME_WEIGHT, 'Python Cookbook'),
+            (search.DESCRIPTION_WEIGHT, 'Gardening'),
+            (search.DESCRIPTION_WEIGHT, 'Cooking basics'),  # same rank: newest first
+        ])
+        # Every word is a prefix, and all of them must match
+        self.assertEqual([name for _, name in self.ranked('PYTH coo')[0]],
+                         ['Python Cookbook', 'Cooking basics', 'Gardening'])
+        self.assertEqual(self.ranked('pyth garden')[0], [(search.NAME_WEIGHT + search.DESCRIPTION_WEIGHT, 'Gardening')])
+        self.assertEqual(self.ranked('python tomato')[0], [])
+        self.assertEqual(self.ranked('  ')[0], [])
+
+    def test_prefix_matches_every_term(self):
+        seller = self.cookbook.seller
+        Product.objects.bulk_create(
+            Product(seller=seller, name=f'Volume{i:03d}', description='series', price=10) for i in range(150)
+        )
+        search.reindex_products(Product.objects.values_list('id', flat=True))
+        names, after, pages = [], None, []
+        while True:
+            results, number, after = self.ranked('vol', after=after, per_page=40)
+            names += [name for _, name in results]
+            pages.append(number)
+            if after is None:
+                break
+        self.assertEqual(pages, [1, 2, 3, 4])
+        self.assertEqual(names, [f'Volume{i:03d}' for i in range(149, -1, -1)])
+
+    def test_after_cursor(self):
+        first, number, after = self.ranked('python', per_page=2)
+        self.assertEqual((first[-1][1], number), ('Gardening', 1))
+        # Resumes inside the tie on the description rank
+        self.assertEqual(self.ranked('python', after=after, per_page=2), (
+            [(search.DESCRIPTION_WEIGHT, 'Cooking basics')], 2, None,
+        ))
+        # A garbled cursor starts over
+        self.assertEqual(self.ranked('python', after='garbage', per_page=2)[:2], (first, 1))
+        response = Client().get('/api/products/search/', {'q': 'python', 'after': 'x!', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'next', 'previous', 'results'})
+        self.assertIsNone(response.json()['previous'])
+
+    def test_words_are_not_stemmed_or_dropped(self):
+        # Like the 'simple' configuration of the Postgres vector
+        self.assertEqual(search.SEARCH_CONFIG, 'simple')
+        Product.objects.create(seller=self.cookbook.seller, name='The runs', description='x', price=1)
+        self.assertEqual([name for _, name in self.ranked('running')[0]], [])
+        self.assertEqual([name for _, name in self.ranked('the run')[0]], ['The runs'])
+
+
+class RebuildSalesRollupsTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.ebook = Product.objects.create(seller=self.seller, name='Ebook', description='x', price=100)
+        self.course = Product.objects.create(seller=self.seller, name='Course', description='x', price=50)
+        now = timezone.now()
+        for i, (product, days_ago, status) in enumerate([
+            (self.ebook, 0, 'PAID'), (self.ebook, 0, 'PAID'), (self.ebook, 10, 'PAID'), (self.course, 100, 'PAID'),
+            (self.course, 400, 'PAID'), (self.course, 0, 'PENDING'), (self.ebook, 0, 'FAILED'),
+        ]):
+            order = OrderDetail.objects.create(customer_email='buyer@example.com', product=product,
+                                               amount=product.price, status=status, razor_order_id=f'order_{i}',
+                                               razor_payment_id=f'pay_{i}' if status == 'PAID' else None)
+            OrderDetail.objects.filter(pk=order.pk).update(created_on=now - datetime.timedelta(days=days_ago))
+
+    def rebuild(self):
+        out = io.StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+        return out.getvalue()
+
+    def assertSales(self):
+        today = timezone.localdate()
+        sales = seller_sales(self.seller)
+        self.assertEqual(
+            [sales[key] for key in ('total_sales', 'yearly_sales', 'monthly_sales', 'weekly_sales')],
+            [400, 350, 300, 200],
+        )
+        self.assertEqual(sales['daily_sales_sums'], [
+            {'created_on__date': today - datetime.timedelta(days=days), 'sum': amount}
+            for days, amount in ((400, 50), (100, 50), (10, 100), (0, 200))
+        ])
+        self.assertEqual(sales['product_sales_sums'], [
+            {'product__name': 'Course', 'sum': 100}, {'product__name': 'Ebook', 'sum': 300},
+        ])
+
+    def test_backfill_and_repair(self):
+        self.assertIn('sellers=1 rows=4', self.rebuild())
+        self.assertSales()
+        self.assertIn('rows=0', self.rebuild())
+
+        # Drifted rollups: a wrong total and a day without any sale
+        SalesRollup.objects.filter(product=self.ebook, day=timezone.localdate()).update(order_count=5, amount=1)
+        add_to_rollups([(self.seller.pk, self.course.pk, timezone.localdate(), 1, 50)])
+        self.assertIn('rows=2', self.rebuild())
+        self.assertSales()
+        self.assertEqual(SalesRollup.objects.count(), 4)
+
+    def test_confirmation_during_rebuild_counts_once(self):
+        self.rebuild()
+        SalesRollup.objects.filter(product=self.ebook).update(amount=0)
+        apply_deltas = rollups.add_to_rollups
+
+        def confirm_then_apply(rows):
+            # Lands after the rebuild read the orders, before it writes
+            confirm_payment('order_5', 'pay_5')
+            apply_deltas(rows)
+
+        with mock.patch.object(rollups, 'add_to_rollups', confirm_then_apply):
+            self.rebuild()
+        sales = seller_sales(self.seller)
+        self.assertEqual((sales['total_sales'], sales['weekly_sales']), (450, 250))
+        self.assertEqual(SalesRollup.objects.get(product=self.course, day=timezone.localdate()).order_count, 1)
+        self.assertIn('rows=0', self.rebuild())
+
+
+class PurchaseHistoryTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.products = [
+            Product.objects.create(seller=self.seller, name=f'Ebook {i}', description='An ebook', price=100)
+            for i in range(30)
+        ]
+
+    def buy(self, count):
+        OrderDetail.objects.bulk_create(
+            OrderDetail(customer_email='buyer@example.com', buyer=self.buyer, product=product,
+                        amount=100, status='PAID', razor_order_id=f'order_{OrderDetail.objects.count()}_{i}')
+            for i, product in enumerate(self.products[:count])
+        )
+
+    def queries(self, client, path):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(client.get(path).status_code, 200)
+        return len(context)
+
+    def test_constant_queries_per_page(self):
+        client = Client()
+        client.force_login(self.buyer)
+        api = APIClient()
+        api.force_authenticate(self.buyer)
+
+        self.buy(2)
+        few = self.queries(client, '/purchases/'), self.queries(api, '/api/purchases/')
+        self.buy(30)
+        self.assertEqual((self.queries(client, '/purchases/'), self.queries(api, '/api/purchases/')), few)
+        self.assertEqual(len(api.get('/api/purchases/').json()['results']), 20)
+
+    def test_backfill_links_orders_by_unique_email(self):
+        User.objects.create_user('twin1', 'twin@example.com', 'pw')
+        User.objects.create_user('twin2', 'twin@example.com', 'pw')
+        for i, email in enumerate(['buyer@example.com', 'twin@example.com', 'guest@example.com']):
+            OrderDetail.objects.create(customer_email=email, product=self.products[0], amount=100,
+                                       status='PAID', razor_order_id=f'order_{i}')
+
+        call_command('backfill_order_buyers', chunk_size=2, stdout=io.StringIO())
+        self.assertEqual(
+            dict(OrderDetail.objects.values_list('customer_email', 'buyer')),
+            {'buyer@example.com': self.buyer.pk, 'twin@example.com': None, 'guest@example.com': None},
+        )
+
+
+class GenerateDatasetTests(TestCase):
+    def test_generates_consistent_orders(self):
+        call_command('generate_dataset', sellers=3, buyers=20, products=50, orders=3000, batch_size=700,
+                     days=30, stdout=io.StringIO())
+        paid = OrderDetail.objects.filter(status='PAID')
+        self.assertEqual(OrderDetail.objects.count(), 3000)
+        self.assertEqual(set(OrderDetail.objects.values_list('status', flat=True)), {'PAID', 'FAILED', 'PENDING'})
+        self.assertEqual(paid.exclude(razor_payment_id=None).count(), paid.count())
+        self.assertEqual(
+            Product.objects.aggregate(n=Sum('total_sales'), amount=Sum('total_sales_amount')),
+            {'n': paid.count(), 'amount': paid.aggregate(n=Sum('amount'))['n']},
+        )
+        self.assertEqual(SalesRollup.objects.aggregate(n=Sum('order_count'))['n'], paid.count())
+        # Zipfian popularity: the top product outsells the median one many times over
+        sales = sorted(Product.objects.values_list('total_sales', flat=True), reverse=True)
+        self.assertGreater(sales[0], 10 * sales[len(sales) // 2])
+
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', sellers=1, buyers=1, products=1, orders=1, stdout=io.StringIO())
+
+    def test_rows_repeat_for_a_seed(self):
+        end = timezone.make_aware(datetime.datetime(2026, 1, 1))
+        rows = [
+            list(order_rows(random.Random(seed), 500, [(1, 100), (2, 200)], [(7, 'a@example.com')], end, 90, 1.1, 'x'))
+            for seed in (1, 1, 2)
+        ]
+        self.assertEqual(rows[0], rows[1])
+        self.assertNotEqual(rows[0], rows[2])
+        self.assertTrue(all(end - datetime.timedelta(days=90) <= row[5] < end for row in rows[0]))
+
+
+@override_settings(QUERY_BUDGET_WARNINGS=True, RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET,
+                   RAZOR_WEBHOOK_SECRET=SECRET)
+class QueryBudgetTests(TestCase):
+    """Every URL in myapp/urls.py against seeded data: within its budget, no N+1"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        server, base_url = serve()
+        cls.addClassCleanup(server.shutdown)
+        cls.enterClassContext(override_settings(RAZORPAY_BASE_URL=base_url))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        cls.products = Product.objects.bulk_create(
+            Product(seller=cls.seller if i % 3 else other, name=f'Ebook {i}', description=f'Volume {i}',
+                    price=100, counter_shards=4 if i % 5 == 0 else 0)
+            for i in range(30)
+        )
+        OrderDetail.objects.bulk_create(
+            OrderDetail(customer_email='buyer@example.com', buyer=cls.buyer, product=cls.products[i % 30],
+                        amount=100, status='PAID', razor_order_id=f'order_{i}', razor_payment_id=f'pay_{i}',
+                        receipt=f'receipts/receipt_{i}.pdf')
+            for i in range(40)
+        )
+        OrderDetail.objects.bulk_create(
+            OrderDetail(customer_email='buyer@example.com', buyer=cls.buyer, product=cls.products[1],
+                        amount=100, razor_order_id=f'pending_{i}')
+            for i in range(3)
+        )
+        add_to_rollups(rollup_rows(
+            OrderDetail.objects.filter(status='PAID')
+            .values('product_id', 'product__seller_id', 'created_on', 'amount')
+        ))
+        for product in cls.products[::5]:
+            increment_sales(product.pk, 100, shards=4)
+
+    def setUp(self):
+        field = OrderDetail._meta.get_field('receipt')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(setattr, field, 'storage', field.storage)
+        field.storage = FileSystemStorage(media.name)
+        field.storage.save('receipts/receipt_0.pdf', io.BytesIO(b'%PDF-1.4'))
+
+    def client_for(self, user=None):
+        client = Client()
+        if user:
+            client.force_login(user)
+        return client
+
+    def api_for(self, user=None):
+        api = APIClient()
+        if user:
+            api.force_authenticate(user)
+        return api
+
+    def cases(self):
+        """{url name: (request, expected status)}"""
+        buyer, seller = self.client_for(self.buyer), self.client_for(self.seller)
+        api_buyer, api_seller = self.api_for(self.buyer), self.api_for(self.seller)
+        product, order = self.products[1], OrderDetail.objects.get(razor_order_id='order_0')
+        checkout = json.dumps({'email': 'buyer@example.com'})
+        return {
+            'index': (lambda: Client().get('/'), 200),
+            'detail': (lambda: Client().get(f'/product/{product.pk}/'), 200),
+            'create_checkout_session': (lambda: buyer.post(
+                f'/create-checkout-session/{product.pk}/', checkout, content_type='application/json'), 200),
+            'create_checkout_session_async': (lambda: buyer.post(
+                f'/create-checkout-session-async/{product.pk}/', checkout, content_type='application/json'), 200),
+            'verify_payment': (lambda: verify(buyer, 'pending_0', 'pay_new_0'), 200),
+            'payment_webhook': (lambda: webhook(Client(), 'payment.captured', 'pending_1', 'pay_new_1', 'evt_1'), 200),
+            'success': (lambda: buyer.get(f'/success/?order_id={order.pk}'), 200),
+            'failed': (lambda: Client().get('/failed/'), 200),
+            'createproduct': (lambda: seller.get('/createproduct/'), 200),
+            'editproduct': (lambda: seller.get(f'/editproduct/{product.pk}/'), 200),
+            'delete': (lambda: seller.get(f'/delete/{product.pk}/'), 200),
+            'dashboard': (lambda: seller.get('/dashboard/'), 200),
+            'register': (lambda: Client().get('/register/'), 200),
+            'login': (lambda: Client().get('/login/'), 200),
+            'logout': (lambda: self.client_for(self.buyer).post('/logout/'), 302),
+            'invalid': (lambda: Client().get('/invalid/'), 200),
+            'purchases': (lambda: buyer.get('/purchases/'), 200),
+            'download_receipt': (lambda: buyer.get(f'/receipt/{order.pk}/'), 200),
+            'download_receipt_url': (lambda: buyer.get(f'/receipt/{order.pk}/url/'), 200),
+            'sales': (lambda: seller.get('/sales/'), 200),
+            'payment_handler': (lambda: Client().post('/payment-handler/', {
+                'razorpay_order_id': 'pending_2',
+                'razorpay_payment_id': 'pay_new_2',
+                'razorpay_signature': sign('pending_2', 'pay_new_2'),
+            }), 302),
+            'api_register': (lambda: self.api_for().post('/api/auth/register/', {
+                'username': 'newbie', 'email': 'newbie@example.com', 'password': 'pw',
+            }), 201),
+            'api_login': (lambda: self.api_for().post('/api/auth/login/', {'username': 'buyer', 'password': 'pw'}), 200),
+            'api_token_refresh': (lambda: self.api_for().post(
+                '/api/auth/refresh/', {'refresh': str(RefreshToken.for_user(self.buyer))}), 200),
+            'api_logout': (lambda: api_buyer.post(
+                '/api/auth/logout/', {'refresh': str(RefreshToken.for_user(self.buyer))}), 200),
+            'api_dashboard': (lambda: api_seller.get('/api/dashboard/'), 200),
+            'api_products': (lambda: self.api_for().get('/api/products/'), 200),
+            'api_product_search': (lambda: self.api_for().get('/api/products/search/?q=ebook'), 200),
+            'api_product_detail': (lambda: self.api_for().get(f'/api/products/{product.pk}/'), 200),
+            'api_product_create': (lambda: api_seller.post('/api/products/create/', {
+                'name': 'Course', 'description': 'A course', 'price': 50,
+            }), 201),
+            'api_product_edit': (lambda: api_seller.put(f'/api/products/{product.pk}/edit/', {'price': 120}), 200),
+            'api_product_delete': (lambda: api_seller.delete(f'/api/products/{self.products[2].pk}/delete/'), 200),
+            'api_products_bulk': (lambda: api_seller.patch('/api/products/bulk/', [
+                {'id': p.pk, 'price': 90} for p in self.products[4:12] if p.seller_id == self.seller.pk
+            ], format='json'), 200),
+            'api_purchases': (lambda: api_buyer.get('/api/purchases/'), 200),
+            'api_sales': (lambda: api_seller.get('/api/sales/'), 200),
+        }
+
+    def test_every_url_within_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - set(BUDGETS), set(), 'URLs without a query budget')
+        cases = self.cases()
+        self.assertEqual(names - set(cases), set(), 'URLs without a budget test case')
+
+        search.get_index()  # built once per process, not per request
+        for name in sorted(names):
+            request, status = cases[name]
+            with self.subTest(name):
+                cache.clear()  # cached catalog pages would hide the cold-path queries
+                response = request()
+                self.assertEqual(response.status_code, status)
+                self.assertNotIn('X-Query-Budget-Warning', response, response.get('X-Query-Budget-Warning'))
+                self.assertLessEqual(int(response['X-Query-Count']), BUDGETS[name])
+
+    def test_flags_over_budget_and_n_plus_one(self):
+        with mock.patch.dict(BUDGETS, {'index': 0}):
+            self.assertIn('queries, budget 0', Client().get('/')['X-Query-Budget-Warning'])
+
+        with QueryLog() as log:
+            for order in OrderDetail.objects.all()[:5]:
+                order.product.name
+        [(sql, times)] = log.repeated()
+        self.assertEqual(times, 5)
+        self.assertIn('FROM "myapp_product"', sql)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x''y' AND n > 10"),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)  AND name = %s AND n > %s'),
+        )
+
+    @override_settings(QUERY_BUDGET_WARNINGS=False)
+    def test_disabled_outside_debug(self):
+        self.assertNotIn('X-Query-Count', Client().get('/invalid/'))
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET, RAZORPAY_ORDER_RETRIES=2, RAZORPAY_RETRY_BACKOFF=0)
+class GatewayRetryTests(SimpleTestCase):
+    def gateway(self, **options):
+        server, base_url = serve(**options)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.enterContext(override_settings(RAZORPAY_BASE_URL=base_url))
+        return server
+
+    def test_connect_failures_are_retried(self):
+        server = self.gateway()
+        port = server.server_address[1]
+        server.shutdown()
+        server.server_close()
+
+        with mock.patch.object(gateway.time, 'sleep') as sleep:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                gateway.create_order(100)
+        self.assertEqual(sleep.call_count, 2)
+
+        # The gateway comes back during the backoff
+        with mock.patch.object(gateway.time, 'sleep', side_effect=lambda delay: self.gateway(port=port)) as sleep:
+            self.assertEqual(gateway.create_order(100)['id'], 'order_fake0000000001')
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_errors_after_sending_are_not_retried(self):
+        # Every second order gets a 503: a retry would have been answered
+        self.gateway(fail_every=2)
+        with mock.patch.object(gateway.time, 'sleep') as sleep:
+            self.assertEqual(gateway.create_order(100)['id'], 'order_fake0000000001')
+            with self.assertRaises(razorpay.errors.ServerError):
+                gateway.create_order(100)
+            self.assertEqual(gateway.create_order(100)['id'], 'order_fake0000000003')
+        sleep.assert_not_called()
+
+        server = self.gateway(latency_ms=200)
+        server.handle_error = lambda request, client_address: None  # its late answer finds the socket closed
+        with override_settings(RAZORPAY_READ_TIMEOUT=0.05), self.assertRaises(requests.exceptions.ReadTimeout):
+            gateway.create_order(100)
+        # The gateway got the one request only
+        self.assertEqual(next(server.RequestHandlerClass.counter), 2)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN=None)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        server, base_url = serve()
+        cls.addClassCleanup(server.shutdown)
+        cls.enterClassContext(override_settings(RAZORPAY_BASE_URL=base_url))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        cls.product = Product.objects.create(seller=cls.buyer, name='Ebook', description='An ebook', price=100)
+
+    def timings(self, response):
+        """{name: milliseconds} of a Server-Timing header"""
+        entries = (entry.split(';') for entry in response['Server-Timing'].split(', '))
+        return {name: float(parts[0].removeprefix('dur=')) for name, *parts in entries}
+
+    def test_server_timing_splits_request_time(self):
+        timings = self.timings(Client().get('/'))
+        self.assertEqual(set(timings), {'db', 'template', 'total'})
+        self.assertLessEqual(timings['db'] + timings['template'], timings['total'])
+
+        client = Client()
+        client.force_login(self.buyer)
+        response = client.post(f'/create-checkout-session/{self.product.pk}/',
+                               json.dumps({'email': 'buyer@example.com'}), content_type='application/json')
+        self.assertIn('gateway', self.timings(response))
+        self.assertIn('queries"', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        Client().get('/')
+        body = Client().get('/metrics').content.decode()
+        self.assertRegex(body, r'http_requests_total\{view="index",method="GET",status="200"\} \d+')
+        self.assertRegex(body, r'http_request_duration_seconds_bucket\{view="index",le="\+Inf"\} \d+')
+        self.assertRegex(body, r'template_render_duration_seconds_count\{template="myapp/index.html"\} \d+')
+        self.assertIn('# TYPE db_queries_per_request histogram', body)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_token(self):
+        self.assertEqual(Client().get('/metrics').status_code, 404)
+        self.assertEqual(Client().get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', Client().get('/'))
+        self.assertEqual(Client().get('/metrics').status_code, 404)
+
+    def test_histogram_exposition(self):
+        histogram = Histogram('latency_seconds', 'Latency', ('view',), buckets=(0.1, 1))
+        for seconds in (0.05, 0.1, 0.5, 3):
+            histogram.observe(seconds, 'a"b')
+        self.assertEqual(histogram.expose()[2:], [
+            'latency_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'latency_seconds_bucket{view="a\\"b",le="1"} 3',
+            'latency_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'latency_seconds_sum{view="a\\"b"} 3.65',
+            'latency_seconds_count{view="a\\"b"} 4',
+        ])
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET)
+class ConcurrentVerificationTests(TransactionTestCase):
+    """Thousands of verifications from a thread pool, totals must come out exact"""
+    ORDERS = 2000
+    THREADS = 32
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            # In memory the threads share nothing; on file they fail with "database is locked"
+            self.skipTest('needs a database several threads can write to at once (Postgres)')
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+
+    def create_orders(self, product, count):
+        OrderDetail.objects.bulk_create(
+            OrderDetail(customer_email='buyer@example.com', product=product,
+                        amount=100, razor_order_id=f'order_{i}')
+            for i in range(count)
+        )
+
+    def fire(self, confirmations):
+        def run(ids):
+            try:
+                return verify(Client(), *ids).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            statuses = list(pool.map(run, confirmations))
+        self.assertEqual(statuses, [200] * len(confirmations))
+
+    def fire_verifications(self, product):
+        self.create_orders(product, self.ORDERS)
+        self.fire([(f'order_{i}', f'pay_{i}') for i in range(self.ORDERS)])
+
+    def test_parallel_verifications_single_row(self):
+        product = Product.objects.create(seller=self.seller, name='Viral', description='x', price=100)
+        self.fire_verifications(product)
+        self.assertEqual(sales_totals(product.pk), (self.ORDERS, self.ORDERS * 100))
+
+    def test_parallel_verifications_sharded(self):
+        product = Product.objects.create(seller=self.seller, name='Viral', description='x', price=100,
+                                         counter_shards=8)
+        self.fire_verifications(product)
+        self.assertEqual(sales_totals(product.pk), (self.ORDERS, self.ORDERS * 100))
+        compact_product(product.pk)
+        product.refresh_from_db()
+        self.assertEqual((product.total_sales, product.total_sales_amount), (self.ORDERS, self.ORDERS * 100))
+
+    def test_replayed_confirmation_counts_once(self):
+        product = Product.objects.create(seller=self.seller, name='Ebook', description='x', price=100)
+        self.create_orders(product, 1)
+        self.fire([('order_0', 'pay_0')] * self.ORDERS)
+        self.assertEqual(sales_totals(product.pk), (1, 100))
+        self.assertEqual(SalesRollup.objects.get().order_count, 1)
+
+
+# Tables whose reads and writes must always be served by an index
+INDEXED_TABLES = {
+    model._meta.db_table
+    for model in (OrderDetail, Product, ProductSalesShard, SalesRollup, PaymentWebhookEvent)
+}
+
+
+def sequential_scans(sql, params):
+    """INDEXED_TABLES that `sql` reads with a full table scan"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # With seq scans priced out, a Seq Scan left in the plan means no
+            # index can serve the query at all
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            cursor.execute('SET LOCAL enable_seqscan = on')
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans, nodes = set(), [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    scans.add(node['Relation Name'])
+                nodes.extend(node.get('Plans', []))
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[3] for row in cursor.fetchall()]
+            aliases = {alias: table for table, alias in re.findall(r'"(\w+)" (U\d+)', sql)}
+            scans = set()
+            for detail in details:
+                match = re.fullmatch(r'SCAN (\w+)', detail)  # no USING INDEX: the table itself
+                if not match:
+                    continue
+                table = aliases.get(match[1], match[1])
+                # SQLite also reports a walk in primary key order that stops at
+                # LIMIT as a plain SCAN (Postgres: Index Scan on the pkey)
+                if (f'ORDER BY "{table}"."id"' in sql and ' LIMIT ' in sql
+                        and not any('TEMP B-TREE FOR ORDER BY' in d for d in details)):
+                    continue
+                scans.add(table)
+    return scans & INDEXED_TABLES
+
+
+@override_settings(RAZOR_KEY_ID='rzp_test', RAZOR_SECRET_KEY=SECRET)
+class QueryPlanTests(TestCase):
+    """EXPLAIN every query the hot paths run against a seeded dataset, none may scan a whole table"""
+    SELLERS = 20
+    PRODUCTS = 400
+    BUYERS = 500
+    ORDERS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        sellers = User.objects.bulk_create(
+            User(username=f'seller{i}', email=f'seller{i}@example.com') for i in range(cls.SELLERS)
+        )
+        cls.buyer = User.objects.create_user('buyer0', 'buyer0@example.com', 'pw')
+        products = Product.objects.bulk_create(
+            Product(seller=sellers[i % cls.SELLERS], name=f'Ebook {i}', description=f'Volume {i}', price=100,
+                    counter_shards=4 if i % 10 == 0 else 0)
+            for i in range(cls.PRODUCTS)
+        )
+        cls.seller, cls.product = sellers[0], products[0]
+
+        statuses = ['PAID'] * 7 + ['PENDING'] * 2 + ['FAILED']
+        OrderDetail.objects.bulk_create(
+            OrderDetail(customer_email=f'buyer{i % cls.BUYERS}@example.com', product=products[i % cls.PRODUCTS],
+                        amount=100, status=statuses[i % 10], has_paid=statuses[i % 10] == 'PAID',
+                        razor_order_id=f'order_{i}',
+                        razor_payment_id=f'pay_{i}' if statuses[i % 10] == 'PAID' else None,
+                        receipt=f'receipts/receipt_{i}.pdf' if i % 3 else '')
+            for i in range(cls.ORDERS)
+        )
+        add_to_rollups(rollup_rows(
+            OrderDetail.objects.filter(status='PAID')
+            .values('product_id', 'product__seller_id', 'created_on', 'amount')
+        ))
+        for i in range(0, cls.PRODUCTS, 10):
+            increment_sales(products[i].pk, 100, shards=4)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertIndexed(self, run):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            run()
+        self.assertTrue(statements)
+        for sql, params in statements:
+            with self.subTest(sql=sql):
+                self.assertEqual(sequential_scans(sql, params), set())
+
+    def get(self, client, *paths):
+        def run():
+            for path in paths:
+                self.assertEqual(client.get(path).status_code, 200, path)
+        return run
+
+    def test_catalog(self):
+        if connection.vendor != 'postgresql':
+            search.get_index()  # the in-process fallback index is built from one deliberate full read
+        self.assertIndexed(self.get(
+            Client(),
+            '/', f'/?after={encode_cursor(self.product.pk + 200, 1)}', '/?q=ebook',
+            f'/product/{self.product.pk}/',
+            '/api/products/', '/api/products/search/?q=vol', f'/api/products/{self.product.pk}/',
+        ))
+
+    def test_seller_pages(self):
+        client = Client()
+        client.force_login(self.seller)
+        api = APIClient()
+        api.force_authenticate(self.seller)
+        self.assertIndexed(self.get(client, '/dashboard/', '/sales/'))
+        self.assertIndexed(self.get(api, '/api/dashboard/', '/api/sales/'))
+
+    def test_buyer_pages(self):
+        client = Client()
+        client.force_login(self.buyer)
+        api = APIClient()
+        api.force_authenticate(self.buyer)
+        order = OrderDetail.objects.filter(status='PAID').first()
+        self.assertIndexed(self.get(
+            client, '/purchases/', '/success/', f'/success/?order_id={order.pk}',
+            f'/success/?razorpay_order_id={order.razor_payment_id}',
+        ))
+        self.assertIndexed(self.get(api, '/api/purchases/'))
+
+    def test_payment_paths(self):
+        pending = list(OrderDetail.objects.filter(status='PENDING').values_list('razor_order_id', flat=True)[:4])
+
+        def run():
+            confirm_payment(pending[0], 'pay_new_0')
+            confirm_payment(pending[0], 'pay_new_0')
+            confirm_payments({pending[1]: 'pay_new_1', pending[2]: 'pay_new_2'})
+            mark_failed(pending[3])
+            self.assertEqual(verify(Client(), 'order_1', 'pay_1').status_code, 200)
+
+        self.assertIndexed(run)
+
+    def test_background_jobs(self):
+        self.assertIndexed(lambda: list(missing_receipts().order_by('id')[:500]))
+        self.assertIndexed(lambda: process_batch())
+        self.assertIndexed(lambda: compact_product(self.product.pk))
+        self.assertIndexed(lambda: call_command('rebuild_sales_rollups', seller=self.seller.pk, stdout=io.StringIO()))
+        self.assertIndexed(lambda: call_command('expire_pending_orders', ttl=0, stdout=io.StringIO()))
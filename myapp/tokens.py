@@ -0,0 +1,191 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt import serializers as jwt_serializers, tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+# JWT refresh token blacklist.
+# simplejwt asks the database on every refresh whether the token was
+# blacklisted. Here each process keeps a Bloom filter of the blacklisted jtis
+# instead (built from the database on first use), and only a "maybe" from the
+# filter goes to the database; a refresh of a live token, the normal case,
+# skips that query.
+# Processes keep in step through the catalog cache: blacklisting a token, once
+# committed, increments a version key and stores the jti under that version,
+# and every check reads the version and adds the jtis it hasn't seen. A
+# missing entry, or a prune_jwt_tokens run (new generation), rebuilds the
+# filter from the database. This needs a cache shared by all processes, so
+# JWT_BLACKLIST_FILTER is only on by default with REDIS_URL.
+# Refresh also writes less: no user lookups for the outstanding/blacklist rows
+# and plain INSERTs where simplejwt does get_or_create.
+
+VERSION_KEY = 'jwt:blacklist:version'
+GENERATION_KEY = 'jwt:blacklist:generation'
+# A version's jti only has to outlive the gap between two checks of a process
+ENTRY_TIMEOUT = 24 * 3600
+MIN_CAPACITY = 1024
+# More unseen versions than this and the filter is rebuilt instead
+MAX_CATCH_UP = 1000
+
+
+def _entry_key(version):
+    return f'jwt:blacklist:entry:{version}'
+
+
+class BloomFilter:
+    """Set of strings with about `error_rate` false positives and no false negatives"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing over one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _start_version(cache):
+    # Time based, so a version key that was evicted restarts ahead of every
+    # process (which then rebuild) rather than at a number they have seen
+    cache.add(VERSION_KEY, time.time_ns(), None)
+
+
+class BlacklistFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = 0
+        self.generation = None
+
+    def _rebuild(self, version, generation):
+        # Expired tokens fail verification anyway
+        jtis = list(
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True)
+        )
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(jtis)), settings.JWT_BLACKLIST_FILTER_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom, self.version, self.generation = bloom, version, generation
+
+    def _sync(self):
+        cache = get_cache()
+        state = cache.get_many([VERSION_KEY, GENERATION_KEY])
+        if VERSION_KEY not in state:
+            # Started here rather than by the first publish(), which would
+            # otherwise look like a lost key and rebuild every process again
+            _start_version(cache)
+            state[VERSION_KEY] = cache.get(VERSION_KEY, 0)
+        version, generation = state[VERSION_KEY], state.get(GENERATION_KEY, 0)
+        if (
+            self.bloom is None or generation != self.generation
+            or version < self.version or self.bloom.count > self.bloom.capacity
+        ):
+            # Rows committed before the version was read are all loaded
+            self._rebuild(version, generation)
+        elif version - self.version > MAX_CATCH_UP:
+            self._rebuild(version, generation)
+        elif version > self.version:
+            missed = range(self.version + 1, version + 1)
+            entries = cache.get_many([_entry_key(v) for v in missed])
+            if len(entries) < len(missed):
+                self._rebuild(version, generation)
+                return
+            for jti in entries.values():
+                self.bloom.add(jti)
+            self.version = version
+
+    def might_contain(self, jti):
+        with self.lock:
+            self._sync()
+            return jti in self.bloom
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def publish(jti):
+    """Make a newly blacklisted (and committed) jti known to every process"""
+    cache = get_cache()
+    _start_version(cache)
+    version = cache.incr(VERSION_KEY)
+    cache.set(_entry_key(version), jti, ENTRY_TIMEOUT)
+    with blacklist_filter.lock:
+        if blacklist_filter.bloom is not None:
+            blacklist_filter.bloom.add(jti)
+
+
+def new_generation():
+    """Have every process rebuild its filter (after pruning)"""
+    cache = get_cache()
+    cache.add(GENERATION_KEY, 0, None)
+    cache.incr(GENERATION_KEY)
+
+
+class RefreshToken(tokens.RefreshToken):
+    def check_blacklist(self):
+        if settings.JWT_BLACKLIST_FILTER and not blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        outstanding = OutstandingToken.objects.filter(jti=jti).first()
+        if outstanding is None:
+            # Issued before the blacklist app, simplejwt creates the row
+            blacklisted, created = super().blacklist()
+        else:
+            try:
+                with transaction.atomic():
+                    blacklisted, created = BlacklistedToken.objects.create(token=outstanding), True
+            except IntegrityError:
+                blacklisted, created = BlacklistedToken.objects.get(token=outstanding), False
+        if created:
+            transaction.on_commit(lambda: publish(jti))
+        return blacklisted, created
+
+    def outstand(self):
+        # A rotated token has a new jti, and its user was just checked
+        return OutstandingToken.objects.create(
+            user_id=self.payload.get(api_settings.USER_ID_CLAIM),
+            jti=self.payload[api_settings.JTI_CLAIM],
+            token=str(self),
+            created_at=self.current_time,
+            expires_at=datetime_from_epoch(self.payload['exp']),
+        ), True
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
@@ -1,74 +1,154 @@
-from django.shortcuts import render, get_object_or_404, reverse, redirect
+import logging
+
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, reverse, redirect
 from .models import Product, OrderDetail
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 import razorpay, json
 from django.http import JsonResponse, HttpResponseNotFound, FileResponse
 from .forms import ProductForm, UserRegistrationForm
-from django.db.models import Sum
-import datetime
 from django.contrib.auth.decorators import login_required
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
-from django.core.paginator import Paginator
+from .pagination import KeysetPage, KeysetPagination, keyset_paginate, approximate_count, page_query
+from .search import search_products
+from .rollups import seller_sales
+from .payments import confirm_payment, mark_failed
+from .webhooks import enqueue
 from django.contrib import messages
+from django.db.models import Max
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
-from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserRegistrationSerializer, ProductSerializer, ProductWriteSerializer, OrderDetailSerializer
+from .serializers import UserRegistrationSerializer, ProductRows, ProductSerializer, ProductWriteSerializer, OrderDetailSerializer
+
+from . import bulk, catalog_cache, gateway
+from .conditional import make_etag, respond
+from .ratelimit import AuthThrottle, CatalogThrottle, ratelimit
+from .tokens import RefreshToken
+from mysite.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+def _owns_order(user, order):
+    # Orders are owned by their buyer; only orders placed before buyers were
+    # linked (buyer is null) fall back to the checkout email, which anyone can
+    # set on their account
+    if order.buyer_id is not None:
+        return order.buyer_id == user.pk
+    return order.customer_email == user.email
+
+
+def _viewer(request):
+    # Part of the HTML pages' ETags: they differ per signed-in user, and their
+    # forms carry a CSRF token from the secret that login rotates
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    return f"{user}:{request.META.get('CSRF_COOKIE', '')}"
 
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
 
+def _no_messages(request):
+    # Flash messages are part of the page but not of its ETag: render them
+    return not messages.get_messages(request)
+
+
+@ratelimit('catalog', methods=('GET',))
 def index(request):
-    products = Product.objects.all().order_by('-id')
+    query = request.GET.get('q', '').strip()
+    if query:
+        per_page = settings.CATALOG_PAGE_SIZE
+        results, number, next_cursor = search_products(query, after=request.GET.get('after'), per_page=per_page)
+        page_obj = KeysetPage([product for _, product in results], number, per_page, next_cursor, None)
+        catalog_cache.render_cards(page_obj.object_list, 'myapp/product_card.html')
+        return render(request, 'myapp/index.html', {'page_obj':page_obj, 'query':query})
+
+    # Every product save and delete bumps the catalog version
+    last_modified = Product.objects.aggregate(last=Max('updated_at'))['last']
+    etag = make_etag('index', catalog_cache.catalog_version(), last_modified, _viewer(request), request.get_full_path())
+
+    def page():
+        page_obj = keyset_paginate(
+            Product.objects.all(),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=settings.CATALOG_PAGE_SIZE,
+            approx_count=approximate_count(Product),
+        )
+        catalog_cache.render_cards(page_obj.object_list, 'myapp/product_card.html')
+        return render(request, 'myapp/index.html', {'page_obj':page_obj})
 
-    paginator = Paginator(products, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'myapp/index.html', {'products': products,'page_obj':page_obj})
+    return respond(request, etag, last_modified, page, public=False, conditional=_no_messages(request))
 
 
+@ratelimit('catalog', methods=('GET',))
 def detail(request, id):
-    product = get_object_or_404(Product, id=id)
+    product = get_object_or_404(Product.objects.select_related('seller'), id=id)
     razor_publishable_key = settings.RAZOR_KEY_ID  # Test key
-    return render(request, 'myapp/detail.html', {
+    etag = make_etag('detail', product.pk, product.updated_at, product.seller.username, _viewer(request))
+    return respond(request, etag, product.updated_at, lambda: render(request, 'myapp/detail.html', {
         'product': product,
         'razor_publishable_key': razor_publishable_key
+    }), public=False, conditional=_no_messages(request))
+
+def _checkout_response(request, order):
+    return JsonResponse({
+        "order_id": order["id"],
+        "amount": order["amount"],
+        "currency": order["currency"],
+        "callback_url": request.build_absolute_uri(reverse("payment_handler"))
     })
 
+
 @csrf_exempt
+@ratelimit('checkout')
 def create_checkout_session(request, id):
     if request.method == "POST":
         data = json.loads(request.body) 
         product = get_object_or_404(Product, id=id)
 
-        client = razorpay.Client(auth=(settings.RAZOR_KEY_ID, settings.RAZOR_SECRET_KEY))
-
-        # Create Razorpay order
-        order = client.order.create({
-            "amount": int(product.price * 100),  # paise
-            "currency": "INR",
-            "payment_capture": 1
-        })
+        # Create Razorpay order (pooled client, timeouts + retry, see gateway.py)
+        order = gateway.create_order(int(product.price * 100))  # paise
 
         # Save order in DB with pending status
-        order_detail = OrderDetail.objects.create(
+        OrderDetail.objects.create(
             customer_email=data.get('email'),
+            buyer=request.user if request.user.is_authenticated else None,
             product=product,
             razor_order_id = order["id"],
             amount=product.price,
             status="PENDING"
         )
 
-        return JsonResponse({
-            "order_id": order["id"],
-            "amount": order["amount"],
-            "currency": order["currency"],
-            "callback_url": request.build_absolute_uri(reverse("payment_handler"))
-        })
+        return _checkout_response(request, order)
+
+    return HttpResponseNotFound()
+
+
+@csrf_exempt
+@ratelimit('checkout')
+async def create_checkout_session_async(request, id):
+    """Same as create_checkout_session, for the ASGI app (daphne/uvicorn).
+
+    The gateway call runs in a worker thread and the ORM calls are async, so a
+    slow gateway holds a coroutine instead of a whole worker.
+    """
+    if request.method == "POST":
+        data = json.loads(request.body)
+        product = await aget_object_or_404(Product, id=id)
+
+        order = await gateway.acreate_order(int(product.price * 100))  # paise
+
+        user = await request.auser()
+        await OrderDetail.objects.acreate(
+            customer_email=data.get('email'),
+            buyer=user if user.is_authenticated else None,
+            product=product,
+            razor_order_id=order["id"],
+            amount=product.price,
+            status="PENDING"
+        )
+
+        return _checkout_response(request, order)
 
     return HttpResponseNotFound()
 
@@ -77,46 +157,34 @@ def verify_payment(request):
     import traceback
     try:
         data = json.loads(request.body)
-        client = razorpay.Client(auth=(settings.RAZOR_KEY_ID, settings.RAZOR_SECRET_KEY))
 
         # 1) verify signature
-        client.utility.verify_payment_signature({
-            'razorpay_order_id': data['razorpay_order_id'],
-            'razorpay_payment_id': data['razorpay_payment_id'],
-            'razorpay_signature': data['razorpay_signature']
-        })
-
-        # 2) find order (search by razor_order_id)
-        order = get_object_or_404(OrderDetail, razor_order_id=data['razorpay_order_id'])
-
-        # 3) save payment id and mark PAID
-        order.razor_payment_id = data['razorpay_payment_id']
-        order.status = "PAID"
-        order.has_paid = True
-        order.save()
+        gateway.verify_payment_signature(
+            data['razorpay_order_id'],
+            data['razorpay_payment_id'],
+            data['razorpay_signature'],
+        )
 
-        # 4) update product totals
-        product = order.product
-        product.total_sales_amount += int(order.amount)
-        product.total_sales += 1
-        product.save()
+        # 2) mark the order PAID, update product totals and the seller's
+        #    sales rollup -- idempotent, repeats are a single lookup
+        order_id, _ = confirm_payment(data['razorpay_order_id'], data['razorpay_payment_id'])
+        if order_id is None:
+            return JsonResponse({"status": "Error", "error": "Order not found"}, status=404)
 
-        # 5) generate receipt (if not present)
+        # 3) the receipt PDF is rendered off the request path by
+        #    generate_missing_receipts (see receipts.py)
 
         return JsonResponse({
             "status": "Payment Verified",
-            "order_id": order.id,
-            "razorpay_order_id": order.razor_order_id,
+            "order_id": order_id,
+            "razorpay_order_id": data['razorpay_order_id'],
         })
 
     except razorpay.errors.SignatureVerificationError as e:
-        # mark failed
+        # mark failed (never downgrades an order that is already PAID)
         try:
-            o = OrderDetail.objects.filter(razor_order_id=data.get('razorpay_order_id')).first()
-            if o:
-                o.status = "FAILED"
-                o.save()
-        except:
+            mark_failed(data.get('razorpay_order_id'))
+        except Exception:
             pass
         traceback.print_exc()
         return JsonResponse({"status": "Payment Verification Failed", "error": str(e)}, status=400)
@@ -126,6 +194,20 @@ def verify_payment(request):
         return JsonResponse({"status": "Error", "error": str(e)}, status=500)
 
 
+@csrf_exempt
+def payment_webhook(request):
+    """Gateway webhook: verify the signature and queue the event, process_payment_webhooks applies it"""
+    if request.method != 'POST':
+        return JsonResponse({"status": "Invalid Request"}, status=405)
+    body = request.body.decode('utf-8')
+    try:
+        gateway.verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature'))
+    except razorpay.errors.SignatureVerificationError as e:
+        return JsonResponse({"status": "Invalid Signature", "error": str(e)}, status=400)
+
+    enqueue(body, request.headers.get('X-Razorpay-Event-Id'))
+    return JsonResponse({"status": "Queued"})
+
 
 @csrf_exempt
 def payment_success_view(request):
@@ -139,7 +221,7 @@ def payment_success_view(request):
 
         order_id = data.get('razorpay_order_id') or data.get('order_id')
         if order_id:
-            order = OrderDetail.objects.filter(razor_payment_id=order_id).order_by('-created_on').first()
+            order = OrderDetail.objects.select_related('product').filter(razor_payment_id=order_id).first()
 
     # If redirected via GET with order id in query params, use that to find the order
     if not order:
@@ -147,7 +229,7 @@ def payment_success_view(request):
         get_order_id = request.GET.get('order_id')
         if get_order_id:
             try:
-                order = OrderDetail.objects.get(id=int(get_order_id))
+                order = OrderDetail.objects.select_related('product').get(id=int(get_order_id))
             except (OrderDetail.DoesNotExist, ValueError):
                 pass
         
@@ -155,12 +237,12 @@ def payment_success_view(request):
         if not order:
             razorpay_id = request.GET.get('razorpay_order_id')
             if razorpay_id:
-                order = OrderDetail.objects.filter(razor_payment_id=razorpay_id).order_by('-created_on').first()
+                order = OrderDetail.objects.select_related('product').filter(razor_payment_id=razorpay_id).first()
 
     # Fallback: show most recent paid order for the logged-in user
     if not order:
         if request.user and request.user.is_authenticated:
-            order = OrderDetail.objects.filter(customer_email=request.user.email, has_paid=True).order_by('-created_on').first()
+            order = OrderDetail.objects.select_related('product').filter(buyer=request.user, status='PAID').order_by('-id').first()
         else:
             order = None
 
@@ -175,17 +257,15 @@ def payment_failed_view(request):
 def create_product(request):
     if request.method == "POST":
         product_form = ProductForm(request.POST, request.FILES)
-        print("🟡 POST received:", request.POST)
-        print("🟡 FILES received:", request.FILES)
 
         if product_form.is_valid():
             new_product = product_form.save(commit=False)
             new_product.seller = request.user
             new_product.save()
-            print("✅ Product created:", new_product.id, new_product.name, new_product.seller)
+            logger.info('Product %s created by %s', new_product.id, request.user.id)
             return redirect('dashboard')
         else:
-            print("❌ Form errors:", product_form.errors)
+            logger.info('Product form errors: %s', product_form.errors.as_json())
 
     else:
         product_form = ProductForm()
@@ -196,7 +276,7 @@ def create_product(request):
 
 def product_edit(request,id):
     product = Product.objects.get(id=id)
-    if product.seller != request.user:
+    if product.seller_id != request.user.id:
         return redirect('invalid')
 
     product_form = ProductForm(request.POST or None,request.FILES or None,instance=product)
@@ -210,7 +290,7 @@ def product_delete(request, id):
     product = get_object_or_404(Product, id=id)
 
     # Prevent users from deleting products they don't own
-    if product.seller != request.user:
+    if product.seller_id != request.user.id:
         messages.error(request, "You are not allowed to delete this product.")
         return redirect('index')
 
@@ -224,13 +304,18 @@ def product_delete(request, id):
 
 
 def dashboard(request):
-    products = Product.objects.filter(seller=request.user).order_by('-id')
+    products = Product.objects.filter(seller=request.user)
 
-    paginator = Paginator(products, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'myapp/dashboard.html',{'products':products,'page_obj':page_obj})
+    page_obj = keyset_paginate(
+        products,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=3,
+    )
+    catalog_cache.render_cards(page_obj.object_list, 'myapp/seller_product_card.html')
+    return render(request, 'myapp/dashboard.html',{'page_obj':page_obj})
 
+@ratelimit('auth')
 def register(request):
     if request.method == "POST":
       user_form = UserRegistrationForm(request.POST)  
@@ -245,50 +330,23 @@ def register(request):
 def invalid(request):
     return render(request,'myapp/invalid.html')
 
+@login_required
 def my_purchases(request):
-    orders = OrderDetail.objects.filter(
-        customer_email=request.user.email,
-        status="PAID"
-    ).order_by('-created_on')  # newest first
-
-    return render(request,'myapp/purchases.html',{'orders':orders})
-
-
-def sales(request):
-
-    # ONLY include paid orders
-    orders = OrderDetail.objects.filter(
-        product__seller=request.user,
-        status="PAID"
+    # Newest first; product is joined in, so a page is a fixed number of queries
+    orders = OrderDetail.objects.filter(buyer=request.user, status="PAID").select_related('product')
+
+    page_obj = keyset_paginate(
+        orders,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=10,
     )
+    return render(request,'myapp/purchases.html',{'page_obj':page_obj})
 
-    total_sales = orders.aggregate(Sum('amount'))
-
-    last_year = datetime.date.today() - datetime.timedelta(days=365)
-    yearly_sales = orders.filter(created_on__gt=last_year).aggregate(Sum('amount'))
-
-    last_month = datetime.date.today() - datetime.timedelta(days=30)
-    monthly_sales = orders.filter(created_on__gt=last_month).aggregate(Sum('amount'))
-
-    last_week = datetime.date.today() - datetime.timedelta(days=7)
-    weekly_sales = orders.filter(created_on__gt=last_week).aggregate(Sum('amount'))
 
-    daily_sales_sums = orders.values('created_on__date') \
-                             .order_by('created_on__date') \
-                             .annotate(sum=Sum('amount'))
-
-    product_sales_sums = orders.values('product__name') \
-                               .order_by('product__name') \
-                               .annotate(sum=Sum('amount'))
-
-    return render(request, 'myapp/sales.html', {
-        'total_sales': total_sales,
-        'yearly_sales': yearly_sales,
-        'monthly_sales': monthly_sales,
-        'weekly_sales': weekly_sales,
-        'daily_sales_sums': daily_sales_sums,
-        'product_sales_sums': product_sales_sums
-    })
+def sales(request):
+    # Pre-aggregated PAID sales, see myapp/rollups.py
+    return render(request, 'myapp/sales.html', seller_sales(request.user))
 
 
 
@@ -297,22 +355,22 @@ def download_receipt(request, order_id):
     """Download receipt PDF for a specific order"""
     try:
         order = OrderDetail.objects.get(id=order_id)
-        # Verify user owns this order (via email or user account)
-        if order.customer_email != request.user.email:
+        if not _owns_order(request.user, order):
             return HttpResponseNotFound("Order not found or access denied")
         
         if not order.receipt:
             return HttpResponseNotFound("Receipt not generated yet")
         
         # Open the receipt file and return it
-        receipt_file = order.receipt.open('rb')
+        with timed('storage'):
+            receipt_file = order.receipt.open('rb')
         response = FileResponse(receipt_file, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="receipt_{order.id}.pdf"'
         return response
     except OrderDetail.DoesNotExist:
         return HttpResponseNotFound("Order not found")
-    except Exception as e:
-        print(f"Receipt download error: {e}")
+    except Exception:
+        logger.exception('Receipt download failed for order %s', order_id)
         return HttpResponseNotFound("Could not download receipt")
 
 
@@ -322,20 +380,20 @@ def download_receipt_url(request, order_id):
     """Get direct download URL for receipt PDF"""
     try:
         order = OrderDetail.objects.get(id=order_id)
-        # Verify user owns this order (via email or user account)
-        if order.customer_email != request.user.email:
+        if not _owns_order(request.user, order):
             return JsonResponse({"error": "Access denied"}, status=403)
         
         if not order.receipt:
             return JsonResponse({"error": "Receipt not generated yet"}, status=404)
         
         # Return the Cloudinary URL
-        receipt_url = order.receipt.url
+        with timed('storage'):
+            receipt_url = order.receipt.url
         return JsonResponse({"url": receipt_url})
     except OrderDetail.DoesNotExist:
         return JsonResponse({"error": "Order not found"}, status=404)
-    except Exception as e:
-        print(f"Receipt URL error: {e}")
+    except Exception:
+        logger.exception('Receipt URL failed for order %s', order_id)
         return JsonResponse({"error": "Could not get receipt URL"}, status=500)
 
 
@@ -347,30 +405,16 @@ def payment_handler(request):
             order_id   = request.POST.get('razorpay_order_id', '')
             signature  = request.POST.get('razorpay_signature', '')
 
-            client = razorpay.Client(auth=(settings.RAZOR_KEY_ID, settings.RAZOR_SECRET_KEY))
-
             # Verify signature
-            client.utility.verify_payment_signature({
-                'razorpay_order_id': order_id,
-                'razorpay_payment_id': payment_id,
-                'razorpay_signature': signature
-            })
-
-            # Update order in DB
-            order = OrderDetail.objects.filter(razor_order_id=order_id).first()
-            if order:
-                order.razor_payment_id = payment_id
-                order.status = "PAID"
-                order.has_paid = True
-                order.save()
-
-                product = order.product
-                product.total_sales_amount += int(order.amount)
-                product.total_sales += 1
-                product.save()
+            gateway.verify_payment_signature(order_id, payment_id, signature)
+
+            # Update order in DB (idempotent, see payments.py)
+            order_pk, _ = confirm_payment(order_id, payment_id)
+            if order_pk is None:
+                return redirect('/payment-failed/?error=Order not found')
 
             # ✅ Redirect (not JSON) — UPI expects this
-            return redirect(f'/payment-success/?order_id={order.id}')
+            return redirect(f'/payment-success/?order_id={order_pk}')
 
         except razorpay.errors.SignatureVerificationError:
             return redirect('/payment-failed/?error=Signature verification failed')
@@ -385,6 +429,7 @@ def payment_handler(request):
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthThrottle]
 
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
@@ -410,28 +455,61 @@ class DashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        products = Product.objects.filter(seller=request.user).order_by('-id')
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        rows = ProductRows.from_request(request)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(rows.queryset(Product.objects.filter(seller=request.user)), request, view=self)
+        return paginator.get_paginated_response(rows.data(page))
     
 class ProductListView(APIView):
     permission_classes = [permissions.AllowAny]  # public, no token needed
+    throttle_classes = [CatalogThrottle]
 
     def get(self, request):
-        products = Product.cache.get('product_list')
-        
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        def build():
+            rows = ProductRows.from_request(request)
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(rows.queryset(Product.objects, 'updated_at'), request, view=self)
+            return paginator.get_paginated_data(rows.data(page)), max((row['updated_at'] for row in page), default=None)
+
+        data, etag, last_modified = catalog_cache.get_page(request, build)
+        return respond(request, etag, last_modified, lambda: Response(data), public=True)
+
+
+class ProductSearchView(APIView):
+    permission_classes = [permissions.AllowAny]  # public, no token needed
+    throttle_classes = [CatalogThrottle]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+
+        per_page = KeysetPagination().get_page_size(request)
+        results, number, next_cursor = search_products(query, after=request.query_params.get('after'), per_page=per_page)
+
+        data = ProductSerializer([product for _, product in results], many=True).data
+        for item, (rank, _) in zip(data, results):
+            item['rank'] = rank
+
+        next_link = None
+        if next_cursor:
+            next_link = f'{request.build_absolute_uri(request.path)}?{page_query(request, after=next_cursor)}'
+        # Same shape as the KeysetPagination responses; search cursors only go forward
+        return Response({'next': next_link, 'previous': None, 'results': data})
 
 
 class ProductDetailView(APIView):
     permission_classes = [permissions.AllowAny]  # public, no token needed
+    throttle_classes = [CatalogThrottle]
 
     def get(self, request, id):
-        product = get_object_or_404(Product, id=id)
-        serializer = ProductSerializer(product)
-        return Response(serializer.data)
-    
+        def build():
+            product = get_object_or_404(Product.objects.with_sales_totals(), id=id)
+            return ProductSerializer(product).data, product.updated_at
+
+        data, etag, last_modified = catalog_cache.get_product(id, build)
+        return respond(request, etag, last_modified, lambda: Response(data), public=True)
+
 class ProductCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -448,7 +526,7 @@ class ProductEditView(APIView):
 
     def put(self, request, id):
         product = get_object_or_404(Product, id=id)
-        if product.seller != request.user:
+        if product.seller_id != request.user.id:
             return Response({'error': 'Not authorized'}, status=403)
         serializer = ProductWriteSerializer(product, data=request.data, partial=True)
         if serializer.is_valid():
@@ -462,61 +540,47 @@ class ProductDeleteView(APIView):
 
     def delete(self, request, id):
         product = get_object_or_404(Product, id=id)
-        if product.seller != request.user:
+        if product.seller_id != request.user.id:
             return Response({'error': 'Not authorized'}, status=403)
         name = product.name
         product.delete()
         return Response({'message': f'{name} deleted successfully'})
     
-class MyPurchasesView(APIView):
+class ProductBulkView(APIView):
+    """Create (POST), update (PATCH) or delete (DELETE) many products at once, see bulk.py"""
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
-        orders = OrderDetail.objects.filter(
-            customer_email=request.user.email,
-            status="PAID"
-        ).order_by('-created_on')
-        serializer = OrderDetailSerializer(orders, many=True)
-        return Response(serializer.data)
-
+    def _run(self, request, write):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list'}, status=400)
+        if len(items) > bulk.MAX_ITEMS:
+            return Response({'error': f'At most {bulk.MAX_ITEMS} items per request'}, status=400)
+        return Response({'results': write(request.user, items)})
 
-class SalesView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    def post(self, request):
+        return self._run(request, bulk.create_products)
 
-    def get(self, request):
-        orders = OrderDetail.objects.filter(
-            product__seller=request.user,
-            status="PAID"
-        )
+    def patch(self, request):
+        return self._run(request, bulk.update_products)
 
-        total_sales = orders.aggregate(Sum('amount'))
+    def delete(self, request):
+        return self._run(request, bulk.delete_products)
 
-        last_year = datetime.date.today() - datetime.timedelta(days=365)
-        yearly_sales = orders.filter(created_on__gt=last_year).aggregate(Sum('amount'))
 
-        last_month = datetime.date.today() - datetime.timedelta(days=30)
-        monthly_sales = orders.filter(created_on__gt=last_month).aggregate(Sum('amount'))
+class MyPurchasesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        last_week = datetime.date.today() - datetime.timedelta(days=7)
-        weekly_sales = orders.filter(created_on__gt=last_week).aggregate(Sum('amount'))
+    def get(self, request):
+        orders = OrderDetail.objects.filter(buyer=request.user, status="PAID").select_related('product')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderDetailSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-        daily_sales_sums = list(
-            orders.values('created_on__date')
-            .order_by('created_on__date')
-            .annotate(sum=Sum('amount'))
-        )
 
-        product_sales_sums = list(
-            orders.values('product__name')
-            .order_by('product__name')
-            .annotate(sum=Sum('amount'))
-        )
+class SalesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        return Response({
-            'total_sales': total_sales['amount__sum'],
-            'yearly_sales': yearly_sales['amount__sum'],
-            'monthly_sales': monthly_sales['amount__sum'],
-            'weekly_sales': weekly_sales['amount__sum'],
-            'daily_sales_sums': daily_sales_sums,
-            'product_sales_sums': product_sales_sums,
-        })
\ No newline at end of file
+    def get(self, request):
+        return Response(seller_sales(request.user))
@@ -0,0 +1,228 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.views.decorators.http import require_GET
+
+
+# Request metrics.
+# With METRICS_ENABLED, MetricsMiddleware times every request and splits its
+# wall time into database, payment gateway, file storage (Cloudinary) and
+# template rendering time. The split is sent back in a Server-Timing header
+# and aggregated, per view, into the histograms served at /metrics in the
+# Prometheus text format. Each process keeps its own registry: scrape every
+# worker (or run one per scrape target).
+# Turned off, the middleware passes requests straight through and timed()
+# costs one context variable lookup.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def sample_lines(self, labels, value):
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted(self._series.items())
+            for values, value in series:
+                labels = ','.join(f'{k}="{escape(v)}"' for k, v in zip(self.labels, values))
+                lines += self.sample_lines(labels, value)
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def sample_lines(self, labels, value):
+        return [f'{self.name}{{{labels}}} {value:g}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [per-bucket counts (last one is +Inf), sum]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def sample_lines(self, labels, value):
+        counts, total = value
+        sep = ',' if labels else ''
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_sum{{{labels}}} {total:g}')
+        lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+REQUESTS = Counter('http_requests_total', 'Requests handled', ('view', 'method', 'status'))
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request wall time', ('view',))
+DB_QUERIES = Histogram('db_queries_per_request', 'SQL statements per request', ('view',),
+                       buckets=QUERY_COUNT_BUCKETS)
+DB_SECONDS = Histogram('db_duration_seconds', 'Time in SQL per request', ('view',))
+OUTBOUND_SECONDS = Histogram('outbound_call_duration_seconds',
+                             'Payment gateway and file storage calls', ('service', 'view'))
+TEMPLATE_SECONDS = Histogram('template_render_duration_seconds', 'Template rendering', ('template',))
+REGISTRY = [REQUESTS, REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, OUTBOUND_SECONDS, TEMPLATE_SECONDS]
+
+
+class RequestTimings:
+    """Per-request accumulator of database and timed() durations"""
+
+    def __init__(self, view):
+        self.view = view
+        self.queries = 0
+        self.seconds = {'db': 0.0}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds['db'] += time.perf_counter() - started
+
+    def add(self, kind, seconds):
+        self.seconds[kind] = self.seconds.get(kind, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [f'db;dur={self.seconds["db"] * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{kind};dur={seconds * 1000:.1f}' for kind, seconds in self.seconds.items() if kind != 'db']
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def timed(kind, label=None):
+    """Time the block as `kind` (gateway, storage, template) of the current request
+
+    Outbound calls land in outbound_call_duration_seconds, templates in
+    template_render_duration_seconds under `label`. A no-op outside a
+    metered request.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        timings.add(kind, seconds)
+        if kind == 'template':
+            TEMPLATE_SECONDS.observe(seconds, label or 'unknown')
+        else:
+            OUTBOUND_SECONDS.observe(seconds, kind, timings.view)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        timings = RequestTimings('unresolved')
+        token = _current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        # Unmatched paths share one label, keeping the series count bounded
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_SECONDS.observe(total, view)
+        DB_QUERIES.observe(timings.queries, view)
+        DB_SECONDS.observe(timings.seconds['db'], view)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Outbound calls made by the view are labelled with its name
+        timings = _current.get()
+        if timings is not None:
+            timings.view = request.resolver_match.view_name
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint, 404 unless METRICS_ENABLED (and METRICS_TOKEN when set)"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        raise Http404
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.expose()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TimedTemplate:
+    """A backend template whose render() is timed as 'template'"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template', self.template.origin.template_name):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render (includes are part of it)"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
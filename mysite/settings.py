@@ -28,6 +28,32 @@ DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 MEDIA_URL = ""
 MEDIA_ROOT = None
 
+# Receipt PDFs (OrderDetail.receipt, myapp/receipts.py): raw uploads on
+# Cloudinary, local files under media/ when Cloudinary isn't configured
+RECEIPT_STORAGE = (
+    {"BACKEND": "cloudinary_storage.storage.RawMediaCloudinaryStorage"}
+    if CLOUDINARY_STORAGE["CLOUD_NAME"]
+    else {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": BASE_DIR / "media"}}
+)
+# Product images (myapp/images.py): uploads are staged on local disk (shared
+# with the process_product_images worker), resized variants are stored on
+# Cloudinary, or under media/variants/ when Cloudinary isn't configured (a
+# directory of its own: it is served as is in DEBUG, receipts and staged
+# uploads are not)
+IMAGE_STAGING_ROOT = os.environ.get("IMAGE_STAGING_ROOT", BASE_DIR / "media" / "staged")
+IMAGE_VARIANT_STORAGE = (
+    {"BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage"}
+    if CLOUDINARY_STORAGE["CLOUD_NAME"]
+    else {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": BASE_DIR / "media" / "variants", "base_url": "/media/variants/"},
+    }
+)
+# Optional TrueType fonts for receipts (non-Latin product names, the rupee sign);
+# the built-in Helvetica is used otherwise
+RECEIPT_FONT = os.environ.get("RECEIPT_FONT")
+RECEIPT_BOLD_FONT = os.environ.get("RECEIPT_BOLD_FONT")
+
 
 # ---------------------------
 # SECURITY
@@ -40,6 +66,8 @@ ALLOWED_HOSTS = ["*"]
 # APPS
 # ---------------------------
 INSTALLED_APPS = [
+    # ASGI runserver (HTTP + the live sales WebSocket), must come first
+    "daphne",
     "cloudinary",
     "cloudinary_storage",
     "widget_tweaks",
@@ -58,8 +86,12 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # ---------------------------
 MIDDLEWARE = [
+    # Outermost, so its timings cover the rest of the stack, see mysite/metrics.py
+    "mysite.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Counts every statement below it, see myapp/query_budget.py
+    "myapp.query_budget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -72,20 +104,29 @@ ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates with render timing for the metrics middleware
+        "BACKEND": "mysite.metrics.TimedDjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            # Templates compiled once per process (runserver's autoreloader
+            # still resets it on template changes); checked by myapp/checks.py
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = "mysite.wsgi.application"
+ASGI_APPLICATION = "mysite.asgi.application"
 
 # ---------------------------
 # DATABASE
@@ -112,6 +153,66 @@ else:
         }
     }
 
+# ---------------------------
+# CACHE
+# ---------------------------
+# Local memory by default, Redis when REDIS_URL is set
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            # Room for a page's worth of product cards (default 300 entries)
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Live sales feed (myapp/sales_feed.py): in-memory reaches sockets of this
+# process only, Redis fans events out across workers and management commands
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = int(os.environ.get("CATALOG_CACHE_TIMEOUT", "300"))
+# Products per storefront page (index and search)
+CATALOG_PAGE_SIZE = int(os.environ.get("CATALOG_PAGE_SIZE", "3"))
+# How long a CDN may serve the public catalog APIs without revalidating
+# (s-maxage), and serve them stale while it revalidates, see myapp/conditional.py
+CATALOG_HTTP_MAX_AGE = int(os.environ.get("CATALOG_HTTP_MAX_AGE", "30"))
+
+# ---------------------------
+# SESSIONS
+# ---------------------------
+# db: a query per signed-in request. cached_db: reads from the cache, writes
+# through to the database. cache: no database at all (sessions are lost when
+# Redis evicts or loses them; copy_sessions_to_cache moves existing ones).
+# The cache stores need a cache shared by every process, so cached_db is only
+# the default with REDIS_URL. All three skip writes of unchanged sessions,
+# see myapp/sessions/__init__.py.
+SESSION_STORE = os.environ.get("SESSION_STORE", "cached_db" if REDIS_URL else "db")
+SESSION_ENGINE = f"myapp.sessions.{SESSION_STORE}"
+SESSION_CACHE_ALIAS = "default"
+SESSION_SAVE_EVERY_REQUEST = os.environ.get("SESSION_SAVE_EVERY_REQUEST", "False") == "True"
+# With SESSION_SAVE_EVERY_REQUEST, seconds between writes of an unchanged session
+SESSION_REFRESH_INTERVAL = int(os.environ.get("SESSION_REFRESH_INTERVAL", "3600"))
+# Flash messages ride in a cookie, so they never make the session dirty
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
 # ---------------------------
 # STATIC
 # ---------------------------
@@ -125,6 +226,43 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 RAZOR_SECRET_KEY = os.environ.get("RAZOR_SECRET_KEY")
 RAZOR_KEY_ID = os.environ.get("RAZOR_KEY_ID")
+# Secret set on the gateway dashboard for /webhooks/payments/ (separate from the API key secret)
+RAZOR_WEBHOOK_SECRET = os.environ.get("RAZOR_WEBHOOK_SECRET")
+# Gateway client (myapp/gateway.py); RAZORPAY_BASE_URL points at a fake gateway in benchmarks
+RAZORPAY_BASE_URL = os.environ.get("RAZORPAY_BASE_URL")
+RAZORPAY_CONNECT_TIMEOUT = float(os.environ.get("RAZORPAY_CONNECT_TIMEOUT", "3.05"))
+RAZORPAY_READ_TIMEOUT = float(os.environ.get("RAZORPAY_READ_TIMEOUT", "10"))
+RAZORPAY_POOL_SIZE = int(os.environ.get("RAZORPAY_POOL_SIZE", "20"))
+# Retries of a gateway order only when the connection could not be made (myapp.gateway.connect_failed)
+RAZORPAY_ORDER_RETRIES = int(os.environ.get("RAZORPAY_ORDER_RETRIES", "2"))
+RAZORPAY_RETRY_BACKOFF = float(os.environ.get("RAZORPAY_RETRY_BACKOFF", "0.25"))
+# Seconds a checkout may stay PENDING before expire_pending_orders marks it EXPIRED
+PENDING_ORDER_TTL = int(os.environ.get("PENDING_ORDER_TTL", str(24 * 3600)))
+# Per-request query budget / N+1 warnings (myapp/query_budget.py)
+QUERY_BUDGET_WARNINGS = os.environ.get("QUERY_BUDGET_WARNINGS", str(DEBUG)) == "True"
+# Server-Timing headers and the Prometheus /metrics endpoint (mysite/metrics.py);
+# METRICS_TOKEN, when set, is required as a Bearer token to scrape
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "False") == "True"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# Token-bucket rate limits (myapp/ratelimit.py), shared through Redis when
+# REDIS_URL is set. "N/period" refills N tokens per sec/min/hour/day, burst is
+# the bucket size (N by default); key is "ip", "user" or "user_or_ip".
+# RATE_LIMIT_PROXIES is the number of trusted proxies appending to
+# X-Forwarded-For in front of the app (0: the client IP is REMOTE_ADDR).
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True") == "True"
+RATE_LIMIT_PROXIES = int(os.environ.get("RATE_LIMIT_PROXIES", "0"))
+RATE_LIMIT_REDIS_TIMEOUT = float(os.environ.get("RATE_LIMIT_REDIS_TIMEOUT", "0.1"))
+RATE_LIMITS = {
+    # Each checkout creates a gateway order and an OrderDetail row
+    "checkout": {"rate": "30/hour", "burst": 10, "key": "user_or_ip"},
+    # Login and registration hash a password
+    "auth": {"rate": "10/min", "burst": 10, "key": "ip"},
+    "catalog": {"rate": "20/sec", "burst": 200, "key": "ip"},
+}
+# Per-process Bloom filter in front of the JWT blacklist table (myapp/tokens.py).
+# Processes sync through the cache, so it has to be shared (Redis).
+JWT_BLACKLIST_FILTER = os.environ.get("JWT_BLACKLIST_FILTER", str(bool(REDIS_URL))) == "True"
+JWT_BLACKLIST_FILTER_ERROR_RATE = 0.001
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "index"
 
@@ -133,7 +271,10 @@ LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "handlers": {"console": {"class": "logging.StreamHandler", "stream": sys.stdout}},
-    "loggers": {"django": {"handlers": ["console"], "level": "ERROR"}},
+    "loggers": {
+        "django": {"handlers": ["console"], "level": "ERROR"},
+        "myapp": {"handlers": ["console"], "level": os.environ.get("LOG_LEVEL", "INFO")},
+    },
 }
 
 REST_FRAMEWORK = {
@@ -150,4 +291,6 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Blacklist checks through JWT_BLACKLIST_FILTER, fewer writes per rotation
+    'TOKEN_REFRESH_SERIALIZER': 'myapp.tokens.TokenRefreshSerializer',
 }
\ No newline at end of file
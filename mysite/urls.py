@@ -19,8 +19,19 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('',include('myapp.urls')),
 ]
 
+# Without Cloudinary, image variants are plain files under media/variants/.
+# Django only serves them with DEBUG on, and only that directory (receipts and
+# staged uploads live next to it); in production configure Cloudinary (or have
+# the web server serve that directory).
+_variant_options = settings.IMAGE_VARIANT_STORAGE.get("OPTIONS", {})
+if "location" in _variant_options:
+    urlpatterns += static(_variant_options["base_url"], document_root=_variant_options["location"])
+